@@ -1,13 +1,33 @@
+import atexit
+import hashlib
+import hmac
 import os
 import re
-from datetime import timedelta
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
 
 from flask import (
     Flask, request, render_template, redirect, url_for,
-    session, abort, jsonify
+    session, abort, jsonify, g, has_app_context, has_request_context,
+    before_render_template, template_rendered, send_file
 )
-import mysql.connector
-from werkzeug.security import check_password_hash, generate_password_hash
+
+from db_pool import ConnectionPool, PoolTimeout
+from ttl_cache import TTLCache, MISSING
+from code_index import CodeIndex
+from storage import open_storage, open_replica
+from replicas import ReplicaSet
+from metrics import Metrics
+from emergency_numbers import EmergencyNumbers
+from assets import AssetManifest
+import card_formats
+from passwords import PasswordHasher, HashBusy, HashTimeout
+from ratelimit import SharedRateLimiter, RateLimited, parse_rules
+from card_snapshot import CardSnapshot
+from breaker import CircuitBreaker, STATE_CODES
+from scan_log import ScanLog, SCAN, VIEW, ua_class
+import codes
 
 # -----------------------------
 # Configuración de la app Flask
@@ -32,95 +52,704 @@ DB_NAME = _env("QR_DB_NAME", "MYSQLDATABASE", default="railway")
 DB_USER = _env("QR_DB_USER", "MYSQLUSER", default="root")
 DB_PASS = _env("QR_DB_PASSWORD", "MYSQLPASSWORD", default="")
 
+# Backend de datos: mysql (producción) o sqlite (local / benchmarks, sin red)
+DB_BACKEND = _env("QR_DB_BACKEND", default="mysql")
+DB_SQLITE_PATH = _env("QR_DB_SQLITE_PATH", default="qr_local.sqlite3")
+
+# Pool de conexiones (por worker)
+DB_POOL_SIZE = int(_env("QR_DB_POOL_SIZE", default="5"))
+DB_POOL_TIMEOUT = float(_env("QR_DB_POOL_TIMEOUT", default="10"))       # seg. esperando una conexión libre
+DB_POOL_RECYCLE = float(_env("QR_DB_POOL_RECYCLE", default="1800"))     # seg. de vida máx. de una conexión
+DB_POOL_PING_AFTER = float(_env("QR_DB_POOL_PING_AFTER", default="30")) # seg. ociosa antes de hacer ping
+DB_CONNECT_TIMEOUT = int(_env("QR_DB_CONNECT_TIMEOUT", default="5"))
+
+# Réplicas de lectura (opcional, ver replicas.py): la ficha y /v leen de ahí, todo lo demás de la primaria.
+# MySQL: "host[:puerto],..." con el mismo usuario/clave/base que la primaria salvo
+# QR_DB_REPLICA_USER / QR_DB_REPLICA_PASSWORD. SQLite: rutas de archivo separadas por coma.
+DB_REPLICAS = [r.strip() for r in _env("QR_DB_REPLICAS", default="").split(",") if r.strip()]
+DB_REPLICA_USER = _env("QR_DB_REPLICA_USER", default=DB_USER)
+DB_REPLICA_PASS = _env("QR_DB_REPLICA_PASSWORD", default=DB_PASS)
+DB_REPLICA_MAX_LAG = float(_env("QR_DB_REPLICA_MAX_LAG", default="5"))       # seg. de atraso tolerados
+DB_REPLICA_CHECK = float(_env("QR_DB_REPLICA_CHECK", default="5"))           # seg. entre chequeos de salud
+DB_REPLICA_POOL_TIMEOUT = float(_env("QR_DB_REPLICA_POOL_TIMEOUT", default="1"))  # réplica llena: a la primaria
+# Seg. que una sesión lee de la primaria después de escribir (claim, contraseña): ve lo suyo aunque la réplica atrase
+DB_READ_YOUR_WRITES = float(_env("QR_DB_READ_YOUR_WRITES", default="30"))
+
+# Cache de fichas públicas (por worker)
+CARD_CACHE_SIZE = int(_env("QR_CARD_CACHE_SIZE", default="2048"))
+CARD_CACHE_TTL = float(_env("QR_CARD_CACHE_TTL", default="60"))          # seg. para fichas existentes
+CARD_CACHE_NEG_TTL = float(_env("QR_CARD_CACHE_NEG_TTL", default="5"))   # seg. para ids inexistentes / sin dueño
+
+# Snapshot en disco de las fichas (ver card_snapshot.py) y circuit breaker de la base (ver breaker.py):
+# si leer la ficha falla o tarda más de QR_CARD_DB_BUDGET, /emergencia contesta desde el snapshot
+CARD_SNAPSHOT_ENABLED = _env("QR_CARD_SNAPSHOT", default="1") != "0"
+CARD_SNAPSHOT_PATH = _env("QR_CARD_SNAPSHOT_PATH", default="qr_cards.snap")
+CARD_SNAPSHOT_REFRESH = float(_env("QR_CARD_SNAPSHOT_REFRESH", default="30"))      # seg. entre deltas / lecturas del log
+CARD_SNAPSHOT_REBUILD = float(_env("QR_CARD_SNAPSHOT_REBUILD", default="86400"))   # seg. antes de rearmarlo entero
+CARD_SNAPSHOT_COMPACT = int(_env("QR_CARD_SNAPSHOT_COMPACT", default=str(4 << 20)))  # bytes de log antes de fundirlo
+CARD_DB_BUDGET = float(_env("QR_CARD_DB_BUDGET", default="0.5"))
+DB_BREAKER_FAILURES = int(_env("QR_DB_BREAKER_FAILURES", default="3"))
+DB_BREAKER_COOLDOWN = float(_env("QR_DB_BREAKER_COOLDOWN", default="15"))
+
+# Registro de escaneos de /v y /emergencia (ver scan_log.py): cola por worker que un thread
+# escribe en lotes; el request nunca espera a la base por esto
+SCAN_LOG_ENABLED = _env("QR_SCAN_LOG", default="1") != "0"
+SCAN_LOG_QUEUE = int(_env("QR_SCAN_LOG_QUEUE", default="10000"))       # eventos en memoria antes de descartar
+SCAN_LOG_BATCH = int(_env("QR_SCAN_LOG_BATCH", default="200"))         # filas por lote
+SCAN_LOG_INTERVAL = float(_env("QR_SCAN_LOG_INTERVAL", default="1"))   # seg. máx. que un evento espera en la cola
+
+# Identidad del usuario logueado guardada en la sesión (firmada): seg. antes de revalidarla contra users
+IDENTITY_TTL = float(_env("QR_IDENTITY_TTL", default="60"))
+
+# Panel: QR por página (?n= hasta PANEL_PAGE_MAX) y seg. que se cachea el total de QR de cada usuario
+PANEL_PAGE_SIZE = int(_env("QR_PANEL_PAGE_SIZE", default="50"))
+PANEL_PAGE_MAX = int(_env("QR_PANEL_PAGE_MAX", default="500"))
+QR_COUNT_TTL = float(_env("QR_COUNT_TTL", default="300"))
+
+# Índice en memoria de public_code (por worker). QR_CODE_INDEX=0 lo desactiva.
+CODE_INDEX_ENABLED = _env("QR_CODE_INDEX", default="1") != "0"
+CODE_INDEX_REFRESH = float(_env("QR_CODE_INDEX_REFRESH", default="5"))          # seg. entre deltas
+CODE_INDEX_MISS_REFRESH = float(_env("QR_CODE_INDEX_MISS_REFRESH", default="1")) # seg. mín. entre deltas forzados por un miss
+
+# public_code: los nuevos llevan un símbolo verificador (ver codes.py) y, si no cierra, se rechazan
+# sin ir a la base. Los viejos (sin verificador) siguen andando si coinciden con QR_LEGACY_CODES
+# (regex sobre el código en mayúsculas; "0" = no se aceptan códigos viejos).
+LEGACY_CODES = _env("QR_LEGACY_CODES", default=codes.LEGACY_PATTERN)
+if LEGACY_CODES == "0":
+    LEGACY_CODES = None
+
+# Token para los endpoints /admin/* (si no está seteado, esos endpoints no existen)
+ADMIN_TOKEN = _env("QR_ADMIN_TOKEN", default="")
+
+# Números de emergencia por país/región (se recargan solos si el archivo cambia)
+EMERGENCY_NUMBERS_PATH = _env("QR_EMERGENCY_NUMBERS", default=os.path.join(app.static_folder, "emergency_numbers_partial_updated.json"))
+EMERGENCY_NUMBERS_CHECK = float(_env("QR_EMERGENCY_NUMBERS_CHECK", default="30"))   # seg. entre chequeos del archivo
+EMERGENCY_DEFAULT_COUNTRY = _env("QR_EMERGENCY_DEFAULT_COUNTRY", default="AR")
+EMERGENCY_NUMBERS_MAX_AGE = int(_env("QR_EMERGENCY_NUMBERS_MAX_AGE", default="300"))  # seg. de cache en clientes/CDN
+
+# Hash de contraseñas en un pool de procesos acotado (por worker); QR_HASH_WORKERS=0 -> inline
+PASSWORD_METHOD = _env("QR_PASSWORD_METHOD", default="scrypt")       # p.ej. scrypt:16384:8:1, pbkdf2:sha256:600000
+HASH_WORKERS = int(_env("QR_HASH_WORKERS", default="1"))
+HASH_QUEUE = int(_env("QR_HASH_QUEUE", default="8"))                   # hashes esperando antes de contestar 503
+HASH_TIMEOUT = float(_env("QR_HASH_TIMEOUT", default="10"))            # seg.
+
+# Assets versionados (python build_assets.py -> static/dist); cache de un año
+ASSETS_DIR = _env("QR_ASSETS_DIR", default=os.path.join(app.static_folder, "dist"))
+ASSETS_MAX_AGE = int(_env("QR_ASSETS_MAX_AGE", default="31536000"))
+
+# Métricas: cada worker vuelca las suyas en QR_METRICS_DIR y /metrics las suma
+METRICS_DIR = _env("QR_METRICS_DIR", "PROMETHEUS_MULTIPROC_DIR")
+METRICS_FLUSH = float(_env("QR_METRICS_FLUSH", default="1"))   # seg. mín. entre volcados de un worker
+
+# Rate limits (token buckets compartidos entre workers, ver ratelimit.py).
+# Reglas "nombre=capacidad/período_seg"; QR_RATE_LIMIT_RULES pisa las que nombre.
+# /emergencia no tiene límite: los que atienden una emergencia nunca reciben un 429.
+RATE_LIMIT_ENABLED = _env("QR_RATE_LIMIT", default="1") != "0"
+RATE_LIMIT_PATH = _env("QR_RATE_LIMIT_PATH")                     # default: /dev/shm/qr_ratelimit-<uid>.bin
+RATE_LIMIT_SLOTS = int(_env("QR_RATE_LIMIT_SLOTS", default="65536"))
+RATE_LIMIT_RULES = {
+    **parse_rules(
+        "v_miss_ip=30/60,"        # /v con códigos inexistentes (enumeración); los escaneos válidos no cuentan
+        "claim_ip=20/60,"         # /claim y /claim/<code> por IP
+        "claim_code=10/60,"       # ... y por código
+        "login_ip=20/60,"         # POST /login por IP
+        "login_email=5/300"       # ... y por cuenta
+    ),
+    **parse_rules(_env("QR_RATE_LIMIT_RULES", default="")),
+}
+# Proxies delante de la app (Railway: 1) para tomar la IP real de X-Forwarded-For
+TRUSTED_PROXIES = int(_env("QR_TRUSTED_PROXIES", default="1"))
+
+# Warm-up (ver warm_up y /ready); profiles.apply_env ajusta las conexiones al perfil
+WARM_CONNECTIONS = int(_env("QR_WARM_CONNECTIONS", default="1"))   # conexiones abiertas antes de atender
+WARM_RETRY = float(_env("QR_WARM_RETRY", default="5"))              # seg. mín. entre reintentos desde /ready
+
+# ------------------------------------------------
+# Instrumentación por request (Server-Timing + /metrics)
+# ------------------------------------------------
+_METRICS = Metrics(METRICS_DIR, flush_interval=METRICS_FLUSH)
+
+def _timing():
+    """Acumulador de tiempos del request en curso (None fuera de un request)."""
+    if not has_request_context():
+        return None
+    return g.get("_timing")
+
+def _add_time(name, seconds):
+    t = _timing()
+    if t is not None:
+        t[name] = t.get(name, 0.0) + seconds
+
+def _on_query(sql, seconds):
+    t = _timing()
+    if t is not None:
+        t["db"] = t.get("db", 0.0) + seconds
+        t["db_count"] = t.get("db_count", 0) + 1
+    _METRICS.inc("qr_db_queries_total")
+    _METRICS.inc("qr_db_query_seconds_total", seconds)
+
+_HASHER = PasswordHasher(PASSWORD_METHOD, workers=HASH_WORKERS, queue=HASH_QUEUE, timeout=HASH_TIMEOUT)
+
+def hash_password(password):
+    t0 = time.perf_counter()
+    try:
+        return _HASHER.hash(password)
+    finally:
+        _add_time("hash", time.perf_counter() - t0)
+
+def verify_password(pwd_hash, password):
+    t0 = time.perf_counter()
+    try:
+        return _HASHER.verify(pwd_hash, password)
+    finally:
+        _add_time("hash", time.perf_counter() - t0)
+
+_LIMITER = SharedRateLimiter(RATE_LIMIT_PATH, RATE_LIMIT_SLOTS, RATE_LIMIT_RULES) if RATE_LIMIT_ENABLED else None
+
+def client_ip():
+    """IP del cliente: la que agregó el último proxy confiable en X-Forwarded-For."""
+    if TRUSTED_PROXIES:
+        hops = [h.strip() for h in request.headers.get("X-Forwarded-For", "").split(",") if h.strip()]
+        if len(hops) >= TRUSTED_PROXIES:
+            return hops[-TRUSTED_PROXIES]
+    return request.remote_addr or "-"
+
+def rate_limit(rule, value, consume=True):
+    """Descuenta un token de (rule, value); si no hay, RateLimited -> 429 (ver _too_many_requests)."""
+    if _LIMITER is not None:
+        _LIMITER.hit(rule, value, consume=consume)
+
+def _hash_unavailable(template, **ctx):
+    # Pool de hashing lleno o lento: mejor un 503 rápido que frenar los escaneos
+    resp = app.make_response((render_template(template, error="Hay mucha demanda en este momento. Probá de nuevo en unos segundos.", **ctx), 503))
+    resp.headers["Retry-After"] = "5"
+    return resp
+
 # ------------------------------------------------
 # Helpers de DB y de sesión
 # ------------------------------------------------
 def get_db():
-    return mysql.connector.connect(
-        host=DB_HOST,
-        port=DB_PORT,
-        user=DB_USER,
-        password=DB_PASS,
-        database=DB_NAME,
-        autocommit=True
-    )
-
-# Mapeo de nombres de columnas (cacheado)
-_USER_COLMAP = None
-def _detect_user_columns():
     """
-    Detecta nombres reales de columnas en 'users' y devuelve un mapping:
-    first_name, last_name, blood, allergies, phone1, phone2
+    Devuelve una conexión del pool.
+    Dentro de un request es siempre la misma (una por request): conn.close()
+    no hace nada y la conexión vuelve al pool en el teardown.
+    Fuera de un request, conn.close() la devuelve al pool.
     """
-    global _USER_COLMAP
-    if _USER_COLMAP is not None:
-        return _USER_COLMAP
+    if not has_app_context():
+        return _POOL.acquire()
+    conn = g.get("_db_conn")
+    if conn is None:
+        if g.get("_db_read_replica"):
+            conn = _replica_conn()
+            if conn is not None:
+                return conn
+        t0 = time.perf_counter()
+        conn = g._db_conn = _POOL.acquire(pinned=True)
+        _add_time("db_pool", time.perf_counter() - t0)
+    return conn
+
+# Acceso a datos (ver storage.py); las consultas usan get_db()
+_STORE = open_storage(
+    DB_BACKEND,
+    get_db,
+    host=DB_HOST,
+    port=DB_PORT,
+    user=DB_USER,
+    password=DB_PASS,
+    database=DB_NAME,
+    connect_timeout=DB_CONNECT_TIMEOUT,
+    sqlite_path=DB_SQLITE_PATH
+)
+_STORE.on_query = _on_query
+
+_POOL = ConnectionPool(
+    _STORE.open_connection,
+    size=DB_POOL_SIZE,
+    timeout=DB_POOL_TIMEOUT,
+    recycle=DB_POOL_RECYCLE,
+    ping_after=DB_POOL_PING_AFTER,
+    pinger=_STORE.ping
+)
 
-    conn = get_db()
-    cur = conn.cursor()
+_SCANS = ScanLog(_STORE.insert_scans, maxsize=SCAN_LOG_QUEUE, batch=SCAN_LOG_BATCH,
+                 interval=SCAN_LOG_INTERVAL) if SCAN_LOG_ENABLED else None
+
+_REPLICAS = ReplicaSet(
+    [(spec, open_replica(DB_BACKEND, spec, port=DB_PORT, user=DB_REPLICA_USER, password=DB_REPLICA_PASS,
+                         database=DB_NAME, connect_timeout=DB_CONNECT_TIMEOUT)) for spec in DB_REPLICAS],
+    pool_size=DB_POOL_SIZE,
+    pool_timeout=DB_REPLICA_POOL_TIMEOUT,
+    recycle=DB_POOL_RECYCLE,
+    ping_after=DB_POOL_PING_AFTER,
+    max_lag=DB_REPLICA_MAX_LAG,
+    check_every=DB_REPLICA_CHECK
+) if DB_REPLICAS else None
+
+def _replica_conn():
+    # Una réplica por request (la primera lectura elige); None -> la primaria
+    conn = g.get("_db_replica_conn")
+    if conn is None and not g.get("_db_replica_tried"):
+        g._db_replica_tried = True
+        t0 = time.perf_counter()
+        replica, conn = _REPLICAS.acquire()
+        _add_time("db_pool", time.perf_counter() - t0)
+        if conn is None:
+            _METRICS.inc("qr_db_replica_fallback_total", reason="unavailable")
+            return None
+        g._db_replica, g._db_replica_conn = replica, conn
+        _METRICS.inc("qr_db_replica_reads_total", replica=replica.name)
+    return conn
+
+def read_replica(fn, *args):
+    """
+    Corre una lectura pública fn(*args) contra una réplica sana, salvo que el
+    request ya tenga la conexión de la primaria o que la sesión haya escrito
+    hace menos de DB_READ_YOUR_WRITES seg. Si la réplica falla a mitad de
+    camino, se saca de la rotación y la lectura se repite en la primaria.
+    """
+    if _REPLICAS is None or not has_request_context() or "_db_conn" in g:
+        return fn(*args)
+    if session.get("rw_until", 0) > time.time():
+        _METRICS.inc("qr_db_replica_fallback_total", reason="read_your_writes")
+        return fn(*args)
+    g._db_read_replica = True
     try:
-        cur.execute("SHOW COLUMNS FROM users")
-        rows = cur.fetchall()  # tuples: (Field, Type, Null, Key, Default, Extra)
-        cols = set([r[0] for r in rows])
+        return fn(*args)
+    except Exception as e:
+        conn = g.pop("_db_replica_conn", None)
+        if conn is None:
+            raise
+        _REPLICAS.mark_down(g.pop("_db_replica"), e)
+        conn.discard()
+        _METRICS.inc("qr_db_replica_fallback_total", reason="error")
     finally:
-        cur.close()
-        conn.close()
+        g._db_read_replica = False
+    return fn(*args)
 
-    def pick(*candidates):
-        for c in candidates:
-            if c in cols:
-                return c
-        return None
+def pin_to_primary():
+    """Después de escribir: las lecturas de esta sesión van a la primaria por DB_READ_YOUR_WRITES seg."""
+    if _REPLICAS is not None:
+        session["rw_until"] = int(time.time() + DB_READ_YOUR_WRITES) + 1
 
-    _USER_COLMAP = {
-        "first": pick("nombre", "name", "first_name"),
-        "last": pick("apellido", "surname", "last_name"),
-        "blood": pick("grupo_sanguineo", "blood_type"),
-        "allergies": pick("alergias", "allergies", "allergies_bool"),
-        "phone1": pick("contacto1", "contact_phone_1", "phone1"),
-        "phone2": pick("contacto2", "contact_phone_2", "phone2"),
-        "email": pick("email"),
-        "pwd": pick("password_hash", "pass_hash"),
-        "id": pick("id")
-    }
-    return _USER_COLMAP
+@app.teardown_appcontext
+def _release_db(exc):
+    for key in ("_db_conn", "_db_replica_conn"):
+        conn = g.pop(key, None)
+        if conn is None:
+            continue
+        if exc is not None and _STORE.is_disconnect_error(exc):
+            # Error de red/servidor: no reciclamos una conexión rota
+            conn.discard()
+        else:
+            conn.release()
+
+# Identidad en la sesión: id, email, nombre, apellido + versión (users.updated_at)
+# y cuándo se leyó. Mientras tenga menos de IDENTITY_TTL seg. no se consulta users.
+_IDENTITY_FIELDS = ("id", "email", "nombre", "apellido")
+# uid -> time.time() del último cambio hecho por este worker (invalidate_identity)
+_IDENTITY_CHANGED = TTLCache(maxsize=4096, ttl=IDENTITY_TTL)
+
+def remember_identity(user):
+    """Guarda en la sesión la identidad leída de users (login, registro o revalidación)."""
+    session["uid"] = user["id"]
+    ident = {k: user.get(k) or "" for k in _IDENTITY_FIELDS}
+    ident["id"] = user["id"]
+    ident["v"] = str(user.get("updated_at") or "")
+    ident["at"] = time.time()
+    session["ident"] = ident
+
+def invalidate_identity(user_id):
+    """El registro cambió: las sesiones de este worker lo vuelven a leer (los demás, al vencer el TTL)."""
+    _IDENTITY_CHANGED.set(user_id, time.time())
 
 def get_current_user():
     uid = session.get("uid")
     if not uid:
         return None
+    ident = session.get("ident")
+    if ident and ident.get("id") == uid:
+        changed = _IDENTITY_CHANGED.get(uid)
+        if time.time() - ident.get("at", 0) < IDENTITY_TTL and (changed is MISSING or changed < ident["at"]):
+            return {k: ident[k] for k in _IDENTITY_FIELDS}
 
-    m = _detect_user_columns()
-    id_col = m["id"] or "id"
-    email_col = m["email"] or "email"
-    first_col = m["first"]
-    last_col = m["last"]
+    user = _STORE.load_user(uid)
+    if user is None:
+        # Usuario borrado: la sesión no sirve más
+        session.pop("uid", None)
+        session.pop("ident", None)
+        return None
+    if ident and ident.get("id") == uid and ident.get("v") != str(user["updated_at"] or ""):
+        # Cambió el perfil: las fichas de este worker pueden estar viejas
+        invalidate_card(user_id=uid)
+    remember_identity(user)
+    return {k: user[k] for k in _IDENTITY_FIELDS}
 
-    # Armamos SELECT compatible (si no hay columnas de nombre, devolvemos strings vacíos)
-    select_parts = [f"{id_col} AS id", f"{email_col} AS email"]
-    if first_col:
-        select_parts.append(f"{first_col} AS nombre")
-    else:
-        select_parts.append(f"'' AS nombre")
-    if last_col:
-        select_parts.append(f"{last_col} AS apellido")
+# Fichas de emergencia: qr_id -> dict con los datos, o None si no existe / no tiene dueño
+_CARD_CACHE = TTLCache(maxsize=CARD_CACHE_SIZE, ttl=CARD_CACHE_TTL, negative_ttl=CARD_CACHE_NEG_TTL)
+
+_SNAPSHOT = CardSnapshot(CARD_SNAPSHOT_PATH) if CARD_SNAPSHOT_ENABLED else None
+_BREAKER = CircuitBreaker(failures=DB_BREAKER_FAILURES, cooldown=DB_BREAKER_COOLDOWN, slow=CARD_DB_BUDGET)
+
+def _read_card_row(fetch, qr_id):
+    """
+    fetch(qr_id) (load_card / card_version de storage) pasando por el circuit
+    breaker. Si la base falla o el circuito está abierto, la fila sale del
+    snapshot y el request queda marcado como posiblemente desactualizado
+    (g._card_stale). Si el snapshot tampoco la tiene: 503.
+    """
+    if _BREAKER.allow():
+        t0 = time.perf_counter()
+        try:
+            row = read_replica(fetch, qr_id)
+        except Exception as e:
+            if not (isinstance(e, PoolTimeout) or _STORE.is_db_error(e)):
+                raise
+            conn = g.pop("_db_conn", None)
+            if conn is not None:
+                conn.discard()
+            _BREAKER.failure(e)
+            reason = "error"
+        else:
+            _BREAKER.record(time.perf_counter() - t0)
+            return row
     else:
-        select_parts.append(f"'' AS apellido")
+        reason = "circuit_open"
+
+    known, card = _SNAPSHOT.get(qr_id) if _SNAPSHOT is not None else (False, None)
+    _METRICS.inc("qr_card_snapshot_served_total", reason=reason if known else "unknown")
+    if not known:
+        resp = app.make_response(("La base de datos no responde. Probá de nuevo en unos segundos.", 503))
+        resp.headers["Retry-After"] = "5"
+        abort(resp)
+    g._card_stale = True
+    return card
+
+def load_card(qr_id):
+    """Datos de la ficha pública del QR, o None si no existe o no fue reclamado."""
+    data = _CARD_CACHE.get(qr_id)
+    if data is not MISSING:
+        return data
+
+    data = _read_card_row(_STORE.load_card, qr_id)
+    if not data or data["user_id"] is None:
+        data = None
+    if not g.get("_card_stale"):
+        _CARD_CACHE.set(qr_id, data)
+    return data
+
+def invalidate_card(qr_id=None, user_id=None):
+    """
+    Saca fichas del cache: por qr_id (claim) o todas las de un usuario
+    (edición de perfil). Es por worker: los demás workers las refrescan por TTL.
+    """
+    if qr_id is not None:
+        _CARD_CACHE.invalidate(qr_id)
+    if user_id is not None:
+        _CARD_CACHE.invalidate_where(lambda d: d["user_id"] == user_id)
+
+def _version_key(row):
+    return (row["user_id"], row["claimed_at"], row["updated_at"])
+
+def card_validators(qr_id, row, *extra):
+    """
+    (ETag, Last-Modified) de la ficha a partir de la versión de la fila
+    (dueño, claimed_at, users.updated_at) y de lo demás que cambie la página
+    (template, números de emergencia elegidos, build de assets).
+    """
+    raw = repr((qr_id, _version_key(row), _CARD_TEMPLATE_VERSION) + extra).encode("utf-8")
+    etag = hashlib.blake2b(raw, digest_size=12).hexdigest()
+    stamps = [d for d in (row["claimed_at"], row["updated_at"]) if d is not None]
+    last_modified = max(stamps).replace(tzinfo=timezone.utc, microsecond=0) if stamps else None
+    return etag, last_modified
+
+def card_version(qr_id):
+    """
+    Solo la versión de la ficha (una lectura por PK, sin traer el perfil), para
+    contestar If-None-Match / If-Modified-Since. None si no existe o no tiene dueño.
+    Si la ficha cacheada quedó vieja (la editaron desde otro worker), la saca del cache.
+    """
+    ver = _read_card_row(_STORE.card_version, qr_id)
+    if not ver or ver["user_id"] is None:
+        ver = None
+    cached = _CARD_CACHE.get(qr_id)
+    if cached is not MISSING:
+        if cached is None or ver is None:
+            stale = cached is not ver
+        else:
+            stale = _version_key(cached) != _version_key(ver)
+        if stale:
+            _CARD_CACHE.invalidate(qr_id)
+            if cached and ver and cached["updated_at"] != ver["updated_at"]:
+                # Se editó el perfil: la identidad en las sesiones de este worker también
+                invalidate_identity(ver["user_id"])
+    return ver
+
+# Un thread por worker mantiene el snapshot (el líder lo actualiza, el resto lee)
+_SNAPSHOT_THREAD = {"pid": None}
+_SNAPSHOT_THREAD_LOCK = threading.Lock()
+
+def sync_card_snapshot():
+    """
+    Si este worker es el líder del snapshot: lo arma si no existe o tiene más
+    de CARD_SNAPSHOT_REBUILD seg., si no le agrega lo que cambió desde la
+    última marca y funde el log cuando pasa CARD_SNAPSHOT_COMPACT bytes.
+    Si no es el líder, solo lee lo que agregaron los demás.
+    """
+    if not _SNAPSHOT.try_lead():
+        _SNAPSHOT.refresh()
+        return
+    _SNAPSHOT.refresh()
+    if not _SNAPSHOT.ready or time.time() - _SNAPSHOT.built_at > CARD_SNAPSHOT_REBUILD:
+        t0 = time.perf_counter()
+        n = _SNAPSHOT.rebuild(_STORE.iter_cards())
+        print(f"Snapshot de fichas armado: {n} fichas en {time.perf_counter() - t0:.1f}s → {CARD_SNAPSHOT_PATH}")
+        return
+    since = datetime(1970, 1, 1) + timedelta(seconds=_SNAPSHOT.watermark)
+    _SNAPSHOT.append([(r["id"], r) for r in _STORE.cards_since(since)])
+    if _SNAPSHOT.log_size() > CARD_SNAPSHOT_COMPACT:
+        _SNAPSHOT.compact()
+
+def _snapshot_loop(pid):
+    while _SNAPSHOT_THREAD["pid"] == pid:
+        time.sleep(CARD_SNAPSHOT_REFRESH)
+        try:
+            sync_card_snapshot()
+        except Exception as e:
+            print(f"[WARN] Snapshot de fichas: no se pudo actualizar: {e}")
+
+@app.before_request
+def _start_snapshot_thread():
+    pid = os.getpid()
+    if _SNAPSHOT is None or _SNAPSHOT_THREAD["pid"] == pid:
+        return
+    with _SNAPSHOT_THREAD_LOCK:
+        if _SNAPSHOT_THREAD["pid"] != pid:
+            _SNAPSHOT_THREAD["pid"] = pid
+            threading.Thread(target=_snapshot_loop, args=(pid,), name="qr-card-snapshot", daemon=True).start()
+
+def _snapshot_claim(qr_id):
+    # La ficha recién reclamada va al snapshot ya, sin esperar el delta
+    if _SNAPSHOT is None:
+        return
+    try:
+        _SNAPSHOT.append([(qr_id, _STORE.load_card(qr_id))])
+    except Exception as e:
+        print(f"[WARN] Snapshot de fichas: no se pudo guardar la ficha {qr_id}: {e}")
+
+def _file_version(path):
+    try:
+        with open(path, "rb") as f:
+            return hashlib.blake2b(f.read(), digest_size=8).hexdigest()
+    except OSError:
+        return ""
+
+# Un cambio en los templates o en los formatos alternativos también invalida los ETag de las fichas
+_CARD_TEMPLATE_VERSION = "".join(_file_version(p) for p in (
+    os.path.join(app.template_folder, "emergencia.html"),
+    os.path.join(app.template_folder, "emergencia_lite.html"),
+    card_formats.__file__,
+))
+
+# public_code -> (id, reclamado). Si no está cargado (DB caída al arrancar o
+# desactivado) se consulta la base como antes.
+_CODE_INDEX = CodeIndex()
+_CODE_INDEX_REFRESHING = threading.Lock()
+
+def _refresh_code_index(min_age):
+    # Un solo thread por worker hace el delta; los demás siguen con lo que hay
+    if time.monotonic() - _CODE_INDEX.last_refresh < min_age:
+        return
+    if not _CODE_INDEX_REFRESHING.acquire(blocking=False):
+        return
+    try:
+        _CODE_INDEX.apply_delta(_STORE.codes_since(_CODE_INDEX.max_id, _CODE_INDEX.max_claimed_at))
+    finally:
+        _CODE_INDEX_REFRESHING.release()
+
+def load_code_index():
+    if not CODE_INDEX_ENABLED:
+        return
+    _CODE_INDEX.load(_STORE.iter_codes())
+
+def find_code(code):
+    """
+    Busca un public_code. Devuelve {"id", "claimed"} o None si no existe.
+    Con el índice cargado, un código inexistente se rechaza sin ir a la base
+    (salvo un delta como mucho cada CODE_INDEX_MISS_REFRESH seg., por si es nuevo).
+    """
+    if _CODE_INDEX.ready:
+        _refresh_code_index(CODE_INDEX_REFRESH)
+        hit = _CODE_INDEX.lookup(code)
+        if hit is None:
+            _refresh_code_index(CODE_INDEX_MISS_REFRESH)
+            hit = _CODE_INDEX.lookup(code)
+        # Respondió el índice (exista o no el código): no hubo que ir a la base
+        _METRICS.inc("qr_cache_hits_total", cache="code_index")
+        if hit is None:
+            return None
+        return {"id": hit[0], "claimed": hit[1]}
+
+    _METRICS.inc("qr_cache_misses_total", cache="code_index")
+    row = read_replica(_STORE.find_code, code)
+    if not row:
+        return None
+    return {"id": row["id"], "claimed": row["user_id"] is not None}
+
+def check_public_code(code):
+    """
+    Verifica un public_code sin ir a la base (ver codes.classify). Devuelve
+    el código a buscar (normalizado) o None si es inválido. Compatibilidad
+    con códigos viejos del mismo largo que los nuevos:
+    - si no pasa el verificador, solo sigue si el código existe tal como vino
+      (find_code: el índice en memoria o, sin índice o antes de que cargue,
+      una consulta);
+    - si lo pasa al normalizarlo (O -> 0, I/L -> 1, sin guiones) pero tal como
+      vino es otro código, se busca como viejo cuando el normalizado no existe
+      y el viejo sí (sin índice: una consulta, solo en ese caso).
+    """
+    status, norm = codes.classify(code, LEGACY_CODES)
+    upper = code.strip().upper()
+    if status == codes.INVALID and LEGACY_CODES:
+        if re.fullmatch(LEGACY_CODES, upper) and find_code(upper) is not None:
+            status, norm = codes.LEGACY, upper
+    elif status == codes.VALID and upper != norm and LEGACY_CODES and re.fullmatch(LEGACY_CODES, upper):
+        if _CODE_INDEX.ready:
+            legacy = _CODE_INDEX.lookup(norm) is None and _CODE_INDEX.lookup(upper) is not None
+        else:
+            legacy = read_replica(_STORE.find_code, norm) is None
+        if legacy:
+            status, norm = codes.LEGACY, upper
+    _METRICS.inc("qr_public_code_checks_total", result=status)
+    return norm if status != codes.INVALID else None
+
+# Números de emergencia (ver emergency_numbers.py)
+_EMERGENCY = EmergencyNumbers(EMERGENCY_NUMBERS_PATH, check_every=EMERGENCY_NUMBERS_CHECK)
+
+def _emergency_numbers():
+    try:
+        _EMERGENCY.maybe_reload()
+    except (OSError, ValueError) as e:
+        # Archivo a medio escribir o roto: seguimos con el índice que ya teníamos
+        print(f"[WARN] No se pudo recargar {EMERGENCY_NUMBERS_PATH}: {e}")
+    return _EMERGENCY
+
+def _request_country():
+    """
+    País de quien escanea: ?pais=, el header de país del proxy/CDN, la región
+    de Accept-Language (es-AR -> AR) o QR_EMERGENCY_DEFAULT_COUNTRY.
+    """
+    nums = _emergency_numbers()
+    for cand in (request.args.get("pais"), request.args.get("country"),
+                 request.headers.get("CF-IPCountry"), request.headers.get("X-Country-Code")):
+        if cand and nums.country_code(cand):
+            return cand
+    for lang, _ in request.accept_languages:
+        if "-" in lang and nums.country_code(lang.split("-", 1)[1]):
+            return lang.split("-", 1)[1]
+    return EMERGENCY_DEFAULT_COUNTRY
+
+def emergency_numbers_for_request():
+    """Entry con los números locales para la ficha, o None."""
+    return _emergency_numbers().lookup(_request_country(), request.args.get("region"))
+
+# ------------------------------------------------
+# Política de cache HTTP por ruta (ver add_headers)
+# ------------------------------------------------
+# endpoint -> Cache-Control. Lo que no figura va con no-store; None = no tocar.
+_CACHE_POLICY = {"static": None}
+
+def cache_policy(value):
+    """Decorador (debajo de @app.route): Cache-Control de las respuestas OK de la ruta."""
+    def deco(view):
+        _CACHE_POLICY[view.__name__] = value
+        return view
+    return deco
+
+# Presupuesto de idas a la base por request: endpoint -> (sentencias, conexiones nuevas).
+# Sin declarar: (0, 0). check_db_budget.py lo verifica ruta por ruta y en producción
+# los excesos se cuentan en qr_db_budget_exceeded_total.
+_DB_BUDGET = {}
+
+def db_budget(queries, connections=0):
+    """Decorador (debajo de @app.route): máximo de sentencias SQL y de conexiones nuevas (pool caliente)."""
+    def deco(view):
+        _DB_BUDGET[view.__name__] = (queries, connections)
+        return view
+    return deco
 
-    sql = f"SELECT {', '.join(select_parts)} FROM users WHERE {id_col}=%s"
+# Rutas que registran un evento por request (ver scan_log.py): endpoint -> kind
+_SCAN_KIND = {}
 
-    conn = get_db()
-    cur = conn.cursor(dictionary=True)
-    cur.execute(sql, (uid,))
-    user = cur.fetchone()
-    cur.close()
-    conn.close()
-    return user
+def scan_event(kind):
+    """Decorador (debajo de @app.route): cada respuesta de la ruta se encola como escaneo (SCAN / VIEW)."""
+    def deco(view):
+        _SCAN_KIND[view.__name__] = kind
+        return view
+    return deco
+
+@app.after_request
+def _record_scan(resp):
+    kind = _SCAN_KIND.get(request.endpoint)
+    if kind is None or _SCANS is None:
+        return resp
+    args = request.view_args or {}
+    code = args.get("code")
+    _SCANS.record((
+        args.get("qr_id", g.get("_scan_qr_id")),
+        code[:64] if code else None,
+        datetime.now(timezone.utc).replace(tzinfo=None),   # UTC, como CURRENT_TIMESTAMP
+        ua_class(request.user_agent.string),
+        resp.status_code,
+        kind,
+    ))
+    return resp
+
+def _not_modified(etag, last_modified=None):
+    """
+    ¿El cliente ya tiene esta versión? If-None-Match manda; If-Modified-Since
+    solo se mira si no vino If-None-Match.
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    ims = request.if_modified_since
+    return ims is not None and last_modified is not None and last_modified <= ims
+
+# CSS crítico / íconos inline y URLs con hash (ver assets.py y build_assets.py)
+_ASSETS = AssetManifest(ASSETS_DIR)
+app.jinja_env.globals.update(
+    asset_url=_ASSETS.url,
+    asset_inline=_ASSETS.inline,
+    asset_icon=_ASSETS.icon,
+)
 
 def _is_safe_next(nxt: str) -> bool:
     # Permitimos solo paths locales (empiezan con /) para evitar open redirect
     return isinstance(nxt, str) and nxt.startswith("/")
 
+# Vistas que, pasado el límite, muestran su formulario con el aviso en vez de texto plano
+_RATE_LIMIT_TEMPLATES = {"login": "login.html", "claim_manual": "claim_manual.html"}
+
+@app.errorhandler(RateLimited)
+def _too_many_requests(exc):
+    _METRICS.inc("qr_rate_limited_total", rule=exc.rule)
+    msg = f"Demasiados intentos. Probá de nuevo en {exc.retry_after} segundos."
+    template = _RATE_LIMIT_TEMPLATES.get(request.endpoint)
+    if template:
+        body = render_template(template, error=msg, next=request.form.get("next") or request.args.get("next", "/panel"))
+        resp = app.make_response((body, 429))
+    else:
+        resp = app.make_response((msg, 429, {"Content-Type": "text/plain; charset=utf-8"}))
+    resp.headers["Retry-After"] = str(exc.retry_after)
+    return resp
+
+def _require_admin():
+    # Sin QR_ADMIN_TOKEN configurado, los endpoints /admin/* no existen
+    if not ADMIN_TOKEN:
+        abort(404)
+    token = request.headers.get("X-Admin-Token", "")
+    if not hmac.compare_digest(token, ADMIN_TOKEN):
+        abort(403)
+
 # ------------------------------------------------
 # Rutas utilitarias
 # ------------------------------------------------
@@ -129,17 +758,72 @@ def health():
     return jsonify({"status": "ok"})
 
 @app.route("/db_ping")
+@db_budget(1)
 def db_ping():
     try:
-        conn = get_db()
-        cur = conn.cursor()
-        cur.execute("SELECT 1")
-        cur.fetchone()
-        cur.close()
-        conn.close()
-        return jsonify({"status": "db_ok", "db_host": DB_HOST, "db_name": DB_NAME})
+        _STORE.ping_db()
+        replicas = {"replicas": _REPLICAS.stats()} if _REPLICAS is not None else {}
+        return jsonify({"status": "db_ok", "backend": _STORE.dialect, **_STORE.describe(), "pool": _POOL.stats(),
+                        "breaker": _BREAKER.stats(), "scans": _SCANS.stats() if _SCANS is not None else None,
+                        **replicas})
     except Exception as e:
-        return jsonify({"status": "db_error", "db_host": DB_HOST, "db_name": DB_NAME, "error": str(e)}), 500
+        return jsonify({"status": "db_error", "backend": _STORE.dialect, **_STORE.describe(), "error": str(e)}), 500
+
+@app.route("/metrics")
+def metrics():
+    """Métricas de todos los workers en formato Prometheus."""
+    return _METRICS.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+@app.route("/api/emergency-numbers")
+@cache_policy(f"public, max-age={EMERGENCY_NUMBERS_MAX_AGE}")
+def emergency_numbers_index():
+    """Países y regiones disponibles."""
+    nums = _emergency_numbers()
+    return _cached_json(*nums.listing())
+
+@app.route("/api/emergency-numbers/<country>")
+@cache_policy(f"public, max-age={EMERGENCY_NUMBERS_MAX_AGE}")
+def emergency_numbers_api(country):
+    """Números de un país (código ISO o nombre); ?region= con fallback al default del país."""
+    entry = _emergency_numbers().lookup(country, request.args.get("region"))
+    if entry is None:
+        return jsonify({"error": "país desconocido"}), 404
+    return _cached_json(entry.body, entry.etag)
+
+def _cached_json(body, etag):
+    # El cuerpo y el ETag vienen precalculados: si el cliente ya lo tiene, 304 sin cuerpo
+    if _not_modified(etag):
+        resp = app.response_class(status=304)
+    else:
+        resp = app.response_class(body, mimetype="application/json")
+    resp.set_etag(etag)
+    return resp
+
+@app.route("/assets/<path:filename>")
+@cache_policy(f"public, max-age={ASSETS_MAX_AGE}, immutable")
+def assets(filename):
+    """Assets con hash en el nombre; variante .br/.gz precomprimida si el cliente la acepta."""
+    found = _ASSETS.resolve(filename, lambda enc: request.accept_encodings[enc] > 0)
+    if found is None:
+        abort(404)
+    path, encoding, mimetype = found
+    resp = send_file(path, mimetype=mimetype, conditional=True, etag=filename)
+    if encoding:
+        resp.headers["Content-Encoding"] = encoding
+    resp.vary.add("Accept-Encoding")
+    return resp
+
+@app.route("/admin/reload-schema", methods=["POST"])
+@db_budget(1)
+def admin_reload_schema():
+    """
+    Re-detecta las columnas de users en ESTE worker.
+    Para todos los workers: `kill -HUP <pid master>` (gunicorn los recicla y
+    cada uno detecta el esquema al arrancar).
+    """
+    _require_admin()
+    q = _STORE.reload_schema()
+    return jsonify({"status": "ok", "pid": os.getpid(), "columns": dict(q.colmap)})
 
 @app.route("/")
 def home():
@@ -150,6 +834,7 @@ def home():
 # Autenticación
 # ------------------------------------------------
 @app.route("/login", methods=["GET", "POST"])
+@db_budget(2)
 def login():
     error = None
     nxt = request.args.get("next", "/panel")
@@ -159,28 +844,34 @@ def login():
         email = (request.form.get("email") or "").strip().lower()
         password = request.form.get("password") or ""
 
-        m = _detect_user_columns()
-        email_col = m["email"] or "email"
-        pwd_col = m["pwd"] or "password_hash"
-
-        conn = get_db()
-        cur = conn.cursor(dictionary=True)
-        cur.execute(f"SELECT {m['id']} AS id, {email_col} AS email, {pwd_col} AS password_hash FROM users WHERE {email_col}=%s", (email,))
-        user = cur.fetchone()
-        cur.close()
-        conn.close()
+        # Antes de tocar la base o el pool de hashing
+        rate_limit("login_ip", client_ip())
+        rate_limit("login_email", email)
+        user = _STORE.find_login_user(email)
 
         if not user:
             error = "Usuario inexistente"
         else:
+            try:
+                ok = bool(user["password_hash"]) and verify_password(user["password_hash"], password)
+            except (HashBusy, HashTimeout):
+                return _hash_unavailable("login.html", next=nxt)
+            if ok and _HASHER.needs_rehash(user["password_hash"]):
+                # Hash con parámetros viejos: lo actualizamos ahora que tenemos la contraseña
+                try:
+                    _STORE.update_password(user["id"], hash_password(password))
+                except (HashBusy, HashTimeout):
+                    pass  # se reintenta en el próximo login
             if not user["password_hash"]:
                 error = "Usuario sin contraseña configurada"
-            elif not check_password_hash(user["password_hash"], password):
+            elif not ok:
                 error = "Contraseña inválida"
             else:
                 # ok
+                if _LIMITER is not None:
+                    _LIMITER.reset("login_email", email)
                 session.permanent = True
-                session["uid"] = user["id"]
+                remember_identity(user)
                 # Validamos next
                 return redirect(nxt if _is_safe_next(nxt) else url_for("panel"))
 
@@ -210,6 +901,7 @@ def forgot():
 
 # -------- /register (alta de usuario) --------
 @app.route("/register", methods=["GET", "POST"])
+@db_budget(2)
 def register():
     error = None
     nxt = request.args.get("next", "/panel")
@@ -223,44 +915,18 @@ def register():
         if not (email and password):
             error = "Completá email y contraseña."
         else:
-            m = _detect_user_columns()
-            email_col = m["email"] or "email"
-            pwd_col   = m["pwd"] or "password_hash"
-            first_col = m["first"]  # puede ser None
-            last_col  = m["last"]   # puede ser None
-
-            conn = get_db()
-            cur = conn.cursor(dictionary=True)
-
             # ¿ya existe?
-            cur.execute(f"SELECT {m['id']} AS id FROM users WHERE {email_col}=%s", (email,))
-            exists = cur.fetchone()
-            if exists:
+            if _STORE.user_exists(email):
                 error = "Ese email ya está registrado."
-                cur.close(); conn.close()
             else:
-                pwd_hash = generate_password_hash(password)
-                # Inserción mínima (siempre válida)
-                cur.execute(f"INSERT INTO users ({email_col}, {pwd_col}) VALUES (%s, %s)", (email, pwd_hash))
-                uid = cur.lastrowid
-
-                # Si existen columnas de nombre, las actualizamos
-                update_parts = []
-                params = []
-                if first_col and nombre:
-                    update_parts.append(f"{first_col}=%s")
-                    params.append(nombre)
-                if last_col and apellido:
-                    update_parts.append(f"{last_col}=%s")
-                    params.append(apellido)
-                if update_parts:
-                    params.append(uid)
-                    cur.execute(f"UPDATE users SET {', '.join(update_parts)} WHERE {m['id']}=%s", tuple(params))
-
-                cur.close(); conn.close()
+                try:
+                    pwd_hash = hash_password(password)
+                except (HashBusy, HashTimeout):
+                    return _hash_unavailable("register.html", next=nxt)
+                uid = _STORE.create_user(email, pwd_hash, nombre, apellido)
 
                 session.permanent = True
-                session["uid"] = uid
+                remember_identity({"id": uid, "email": email, "nombre": nombre, "apellido": apellido})
                 return redirect(nxt if _is_safe_next(nxt) else url_for("panel"))
 
     return render_template("register.html", error=error, next=nxt)
@@ -268,54 +934,154 @@ def register():
 # ------------------------------------------------
 # Panel del usuario logueado
 # ------------------------------------------------
+# Total de QR por usuario (uid -> n): evita un COUNT(*) en cada carga del panel.
+# Se invalida cuando el usuario reclama desde este worker; el resto, por TTL.
+_QR_COUNT = TTLCache(maxsize=CARD_CACHE_SIZE, ttl=QR_COUNT_TTL)
+
+def user_qr_count(user_id):
+    n = _QR_COUNT.get(user_id)
+    if n is MISSING:
+        n = _STORE.count_user_qrs(user_id)
+        _QR_COUNT.set(user_id, n)
+    return n
+
+def _parse_day(value):
+    value = (value or "").strip()
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Fecha inválida: {value!r} (usá AAAA-MM-DD)") from None
+
+def _int_arg(name, default=None):
+    value = request.args.get(name, "").strip()
+    if not value:
+        return default
+    if not value.isdigit():
+        raise ValueError(f"{name} tiene que ser un número")
+    return int(value)
+
+def _panel_page(user_id):
+    """
+    Página del listado según ?antes= / ?despues= (cursor: id de QR), ?q= (prefijo
+    del código), ?desde= / ?hasta= (fecha de asociación, inclusive) y ?n=.
+    ValueError si algún parámetro es inválido.
+    """
+    before = _int_arg("antes")
+    after = _int_arg("despues") if before is None else None
+    limit = max(1, min(_int_arg("n", PANEL_PAGE_SIZE), PANEL_PAGE_MAX))
+    prefix = (request.args.get("q") or "").strip().upper()
+    if prefix and not re.fullmatch(r"[A-Z0-9\-]{1,64}", prefix):
+        raise ValueError("Búsqueda inválida: solo letras, números y guiones")
+    since = _parse_day(request.args.get("desde"))
+    until = _parse_day(request.args.get("hasta"))
+    filters = {k: v for k, v in (("q", prefix), ("desde", since and since.isoformat()),
+                                 ("hasta", until and until.isoformat()), ("n", request.args.get("n"))) if v}
+
+    # Una fila de más para saber si hay otra página sin contar
+    rows = _STORE.list_user_qrs(
+        user_id, limit=limit + 1, before_id=before, after_id=after, prefix=prefix or None,
+        claimed_from=since and datetime.combine(since, datetime.min.time()),
+        claimed_until=until and datetime.combine(until + timedelta(days=1), datetime.min.time()),
+    )
+    more = len(rows) > limit
+    if after is not None:
+        rows = rows[-limit:] if more else rows
+        has_newer, has_older = more, True
+    else:
+        rows = rows[:limit]
+        has_newer, has_older = before is not None, more
+
+    if not filters.keys() - {"n"} and before is None and after is None and not more:
+        total = len(rows)   # entra todo en la primera página: no hace falta contar
+        _QR_COUNT.set(user_id, total)
+    else:
+        total = user_qr_count(user_id)
+    return {
+        "qrs": rows,
+        "total": total,
+        "filtered": bool(filters.keys() - {"n"}),
+        "filters": filters,
+        "newer": rows[0]["id"] if rows and has_newer else None,
+        "older": rows[-1]["id"] if rows and has_older else None,
+    }
+
 @app.route("/panel")
+@cache_policy("private, no-store")
+@db_budget(2)
 def panel():
     user = get_current_user()
     if not user:
         return redirect(url_for("login", next="/panel"))
 
-    conn = get_db()
-    cur = conn.cursor(dictionary=True)
-    cur.execute("""
-        SELECT id, public_code, user_id, claimed_at
-        FROM qr_codes
-        WHERE user_id=%s
-        ORDER BY id DESC
-    """, (user["id"],))
-    qrs = cur.fetchall()
-    cur.close()
-    conn.close()
+    try:
+        page = _panel_page(user["id"])
+    except ValueError as e:
+        return render_template("panel.html", user=user, qrs=[], total=None, filtered=True,
+                               filters={}, newer=None, older=None, error=str(e)), 400
+
+    return render_template("panel.html", user=user, **page)
 
-    return render_template("panel.html", user=user, qrs=qrs)
+@app.route("/panel.json")
+@cache_policy("private, no-store")
+@db_budget(2)
+def panel_json():
+    """El mismo listado para scripts: los cursores next/prev van en ?antes= / ?despues=."""
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "login requerido"}), 401
+    try:
+        page = _panel_page(user["id"])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def _iso(v):
+        return v.isoformat() if hasattr(v, "isoformat") else v
+    return jsonify({
+        "total": page["total"],
+        "filters": page["filters"],
+        "items": [{"id": r["id"], "public_code": r["public_code"], "claimed_at": _iso(r["claimed_at"]),
+                   "url": url_for("emergencia", qr_id=r["id"], _external=True),
+                   **({"scans": r["scans"], "views": r["views"], "last_scan_at": _iso(r["last_scan_at"])}
+                      if "scans" in r else {})} for r in page["qrs"]],
+        "next": url_for("panel_json", antes=page["older"], **page["filters"]) if page["older"] else None,
+        "prev": url_for("panel_json", despues=page["newer"], **page["filters"]) if page["newer"] else None,
+    })
 
 # ------------------------------------------------
 # Flujo público QR (virgen → login+claim, reclamado → ficha)
 # ------------------------------------------------
 @app.route("/v/<code>")
+@db_budget(1)
+@scan_event(SCAN)
 def view_public_code(code):
     """
     Entrada pública de una etiqueta con public_code.
     - Si no existe -> 404
     - Si existe y no está reclamada (user_id IS NULL) -> redirige a /login?next=/claim/<code>
     - Si ya está reclamada -> redirige a /emergencia/<id>
+    Solo los códigos inexistentes gastan el límite por IP: un escaneo válido nunca se frena
+    salvo que esa IP ya venga probando códigos. Un código con el verificador mal
+    es un 404 sin consultar la base.
     """
-    conn = get_db()
-    cur = conn.cursor(dictionary=True)
-    cur.execute("SELECT id, user_id FROM qr_codes WHERE public_code=%s", (code,))
-    row = cur.fetchone()
-    cur.close()
-    conn.close()
-
+    ip = client_ip()
+    rate_limit("v_miss_ip", ip, consume=False)
+    code = check_public_code(code)
+    row = find_code(code) if code else None
     if not row:
+        rate_limit("v_miss_ip", ip)
         abort(404)
+    g._scan_qr_id = row["id"]
 
-    if row["user_id"] is None:
+    if not row["claimed"]:
         return redirect(url_for("login", next=f"/claim/{code}"))
 
     return redirect(url_for("emergencia", qr_id=row["id"]))
 
 # --- NUEVO: carga manual del código desde una vista ---
 @app.route("/claim", methods=["GET", "POST"])
+@db_budget(2)
 def claim_manual():
     """
     Vista con formulario para ingresar 'public_code'.
@@ -323,75 +1089,81 @@ def claim_manual():
     - POST: valida el código y redirige al flujo /claim/<code>
     """
     error = None
+    suggested = []
     if request.method == "POST":
-        code = (request.form.get("code") or "").strip().upper()
-        # Permitimos letras, números y guiones, 4 a 64 chars (ajustable a tu formato real)
-        if not code:
+        typed = (request.form.get("code") or "").strip().upper()
+        # Verificador / formato viejo (codes.py) antes de gastar una consulta
+        code = check_public_code(typed) if typed else None
+        if not typed:
             error = "Ingresá el código."
-        elif not re.fullmatch(r"[A-Z0-9\-]{4,64}", code):
-            error = "Formato de código inválido."
+        elif not code:
+            error = "El código no es válido: revisá que esté bien copiado."
+            # Dos caracteres intercambiados es el error más común al tipear desde la etiqueta
+            suggested = codes.suggestions(typed)
         else:
+            rate_limit("claim_ip", client_ip())
+            rate_limit("claim_code", code)
             # Verificamos existencia y estado para dar una UX más clara
-            conn = get_db()
-            cur = conn.cursor(dictionary=True)
-            cur.execute("SELECT id, user_id FROM qr_codes WHERE public_code=%s", (code,))
-            row = cur.fetchone()
-            cur.close()
-            conn.close()
+            row = find_code(code)
 
             if not row:
                 error = "El código no existe."
             else:
-                user = get_current_user()
-                if row["user_id"] is None:
+                if not row["claimed"]:
                     # Si no está logueado, igual /claim/<code> lo manda a login con next
                     return redirect(url_for("claim_code", code=code))
-                elif user and row["user_id"] == user["id"]:
+                user = get_current_user()
+                card = load_card(row["id"]) if user else None
+                if card and card["user_id"] == user["id"]:
                     # Ya es tuyo → panel
                     return redirect(url_for("panel"))
                 else:
                     # Tiene dueño → mostramos la ficha pública
                     return redirect(url_for("emergencia", qr_id=row["id"]))
 
-    return render_template("claim_manual.html", error=error)
+    return render_template("claim_manual.html", error=error, suggested=suggested)
 
 @app.route("/claim/<code>", methods=["GET"])
+# UPDATE + load_card para el snapshot; sin índice (QR_CODE_INDEX=0) también find_code
+@db_budget(3)
 def claim_code(code):
     """
     Reclama (asocia) el public_code al usuario logueado.
     Si no está logueado → /login?next=/claim/<code>
-    Si el código no existe → 404
+    Si el código no existe o es inválido (verificador) → 404
     Si ya está reclamado → redirige a /emergencia/<id>
     """
     user = get_current_user()
     if not user:
         return redirect(url_for("login", next=f"/claim/{code}"))
+    code = check_public_code(code)
+    if not code:
+        abort(404)
 
-    conn = get_db()
-    cur = conn.cursor(dictionary=True)
-
+    rate_limit("claim_ip", client_ip())
+    rate_limit("claim_code", code)
     # Buscamos el QR
-    cur.execute("SELECT id, user_id FROM qr_codes WHERE public_code=%s", (code,))
-    row = cur.fetchone()
+    row = find_code(code)
     if not row:
-        cur.close()
-        conn.close()
         abort(404)
 
     # Si ya estaba reclamado, vamos a la ficha
-    if row["user_id"] is not None:
-        qr_id = row["id"]
-        cur.close()
-        conn.close()
-        return redirect(url_for("emergencia", qr_id=qr_id))
+    if row["claimed"]:
+        return redirect(url_for("emergencia", qr_id=row["id"]))
 
     # Reclamar (solo si sigue virgen)
-    cur.execute(
-        "UPDATE qr_codes SET user_id=%s, claimed_at=NOW() WHERE public_code=%s AND user_id IS NULL",
-        (user["id"], code)
-    )
-    cur.close()
-    conn.close()
+    claimed = _STORE.claim_code(code, user["id"])
+    pin_to_primary()
+    if claimed:
+        _snapshot_claim(row["id"])
+    _CODE_INDEX.mark_claimed(code)
+    _QR_COUNT.invalidate(user["id"])
+    # La ficha pudo haber quedado cacheada como "sin dueño"
+    invalidate_card(qr_id=row["id"])
+
+    if not claimed:
+        # Lo reclamó otro en el medio (el índice puede estar unos segundos atrasado)
+        return redirect(url_for("emergencia", qr_id=row["id"]))
 
     # A panel (ahí verá el nuevo QR)
     return redirect(url_for("panel"))
@@ -400,72 +1172,333 @@ def claim_code(code):
 # Ficha pública (solo si el QR tiene dueño)
 # ------------------------------------------------
 @app.route("/emergencia/<int:qr_id>")
+@cache_policy("private, no-cache")
+@db_budget(1)
+@scan_event(VIEW)
 def emergencia(qr_id):
     """
     Muestra la ficha SOLO si el QR ya fue reclamado (user_id NO NULL).
     Si no tiene dueño -> 404
+    Con If-None-Match / If-Modified-Since se consulta solo la versión de la
+    fila y, si no cambió, se contesta 304 sin armar la página.
+    Según Accept puede devolver otra representación (ver card_formats.py).
     """
-    m = _detect_user_columns()
-    first_col = m["first"]
-    last_col = m["last"]
-    blood_col = m["blood"]
-    allergies_col = m["allergies"]
-    phone1_col = m["phone1"]
-    phone2_col = m["phone2"]
-
-    # Armamos SELECT seguro (si falta una columna, devolvemos vacío)
-    select_user_parts = []
-    if first_col:   select_user_parts.append(f"u.{first_col} AS nombre")
-    else:           select_user_parts.append(f"'' AS nombre")
-    if last_col:    select_user_parts.append(f"u.{last_col} AS apellido")
-    else:           select_user_parts.append(f"'' AS apellido")
-    if blood_col:   select_user_parts.append(f"u.{blood_col} AS grupo_sanguineo")
-    else:           select_user_parts.append(f"'' AS grupo_sanguineo")
-    if allergies_col: select_user_parts.append(f"u.{allergies_col} AS alergias")
-    else:             select_user_parts.append(f"'' AS alergias")
-    if phone1_col: select_user_parts.append(f"u.{phone1_col} AS contacto1")
-    else:          select_user_parts.append(f"'' AS contacto1")
-    if phone2_col: select_user_parts.append(f"u.{phone2_col} AS contacto2")
-    else:          select_user_parts.append(f"'' AS contacto2")
-
-    sql = f"""
-        SELECT q.id, q.user_id, {', '.join(select_user_parts)}
-        FROM qr_codes q
-        LEFT JOIN users u ON u.{m['id']} = q.user_id
-        WHERE q.id=%s
-    """
-
-    conn = get_db()
-    cur = conn.cursor(dictionary=True)
-    cur.execute(sql, (qr_id,))
-    data = cur.fetchone()
-    cur.close()
-    conn.close()
+    fmt = "html"
+    if request.accept_mimetypes and not request.accept_mimetypes.accept_html:
+        best = request.accept_mimetypes.best_match([m for m, _ in card_formats.ACCEPT])
+        fmt = dict(card_formats.ACCEPT).get(best, "html")
+    resp = _card_response(qr_id, fmt)
+    resp.vary.add("Accept")
+    return resp
 
-    if not data or data["user_id"] is None:
+@app.route("/emergencia/<int:qr_id>.<any(json, vcf, txt, lite):fmt>")
+@cache_policy("private, no-cache")
+@db_budget(1)
+@scan_event(VIEW)
+def emergencia_format(qr_id, fmt):
+    """La ficha en JSON / vCard / texto / HTML mínimo (ver card_formats.py)."""
+    return _card_response(qr_id, fmt)
+
+def _card_response(qr_id, fmt):
+    # vCard no lleva los números locales: no depende del país de quien escanea
+    local = emergency_numbers_for_request() if fmt != "vcf" else None
+    extra = (fmt, local.etag if local else "", _ASSETS.version if fmt == "html" else "")
+
+    if request.if_none_match or request.if_modified_since:
+        ver = card_version(qr_id)
+        if ver is None:
+            abort(404)
+        etag, last_modified = card_validators(qr_id, ver, *extra)
+        if _not_modified(etag, last_modified):
+            return _card_headers(app.response_class(status=304), etag, last_modified, fmt)
+
+    data = load_card(qr_id)
+    if data is None:
         abort(404)
+    etag, last_modified = card_validators(qr_id, data, *extra)
+    stale = bool(g.get("_card_stale"))
 
-    # Render (adaptá a tu template 'emergencia.html')
-    return render_template(
-        "emergencia.html",
-        nombre=(data.get("nombre") or ""),
-        apellido=(data.get("apellido") or ""),
-        grupo_sanguineo=(data.get("grupo_sanguineo") or ""),
-        alergias=(data.get("alergias") or "No"),
-        contacto1=(data.get("contacto1") or ""),
-        contacto2=(data.get("contacto2") or "")
-    )
+    if fmt == "html":
+        # Render (adaptá a tu template 'emergencia.html')
+        body = render_template(
+            "emergencia.html",
+            desactualizada=stale,
+            nombre=(data.get("nombre") or ""),
+            apellido=(data.get("apellido") or ""),
+            grupo_sanguineo=(data.get("grupo_sanguineo") or ""),
+            alergias=(data.get("alergias") or "No"),
+            contacto1=(data.get("contacto1") or ""),
+            contacto2=(data.get("contacto2") or ""),
+            emergencia_local=local
+        )
+    else:
+        fields = card_formats.card_fields(data)
+        if fmt == "json":
+            body = card_formats.to_json(qr_id, fields, local, stale=stale)
+        elif fmt == "vcf":
+            body = card_formats.to_vcard(qr_id, fields)
+        elif fmt == "txt":
+            body = card_formats.to_text(qr_id, fields, local, stale=stale)
+        else:
+            body = render_template("emergencia_lite.html", qr_id=qr_id, card=fields, emergencia_local=local,
+                                   desactualizada=stale)
+
+    resp = app.response_class(body, content_type=card_formats.MIMETYPES[fmt])
+    if fmt == "vcf":
+        resp.headers["Content-Disposition"] = f'inline; filename="emergencia-{qr_id}.vcf"'
+    return _card_headers(resp, etag, last_modified, fmt)
+
+def _card_headers(resp, etag, last_modified, fmt="html"):
+    if g.get("_card_stale"):
+        # Salió del snapshot: la base no respondió
+        resp.headers["X-Card-Source"] = "snapshot"
+    resp.set_etag(etag)
+    if last_modified is not None:
+        resp.last_modified = last_modified
+    if fmt != "vcf":
+        # Los números de emergencia dependen del país de quien escanea
+        resp.vary.update(("Accept-Language", "CF-IPCountry", "X-Country-Code"))
+    return resp
 
 # ------------------------------------------------
 # Filtro de path (por si querés exponer menos info en logs)
 # ------------------------------------------------
 @app.after_request
 def add_headers(resp):
-    # cache bust
-    resp.headers["Cache-Control"] = "no-store"
+    # Política por ruta (ver cache_policy); por defecto y en errores, no-store
+    policy = _CACHE_POLICY.get(request.endpoint, "no-store")
+    if policy is None:
+        return resp
+    if resp.status_code >= 400:
+        policy = "no-store"
+    resp.headers["Cache-Control"] = policy
+    return resp
+
+# ------------------------------------------------
+# Tiempos del request: header Server-Timing + histograma por ruta
+# ------------------------------------------------
+@app.before_request
+def _start_timing():
+    g._timing = {"start": time.perf_counter()}
+
+@before_render_template.connect_via(app)
+def _render_started(sender, template, context, **extra):
+    t = _timing()
+    if t is not None:
+        t["render_start"] = time.perf_counter()
+
+@template_rendered.connect_via(app)
+def _render_finished(sender, template, context, **extra):
+    t = _timing()
+    if t is not None and "render_start" in t:
+        _add_time("render", time.perf_counter() - t.pop("render_start"))
+
+def _collect_stats(m):
+    # Contadores que ya llevan los caches y el pool de este worker
+    cs = _CARD_CACHE.stats()
+    m.set_total("qr_cache_hits_total", cs["hits"], cache="card")
+    m.set_total("qr_cache_misses_total", cs["misses"], cache="card")
+    ps = _POOL.stats()
+    m.set_total("qr_db_connections_opened_total", ps["opened"])
+    m.set_gauge("qr_db_pool_connections", ps["open"] - ps["idle"], state="in_use")
+    m.set_gauge("qr_db_pool_connections", ps["idle"], state="idle")
+    m.set_gauge("qr_db_breaker_state", STATE_CODES[_BREAKER.state])
+    if _SNAPSHOT is not None:
+        m.set_gauge("qr_card_snapshot_cards", len(_SNAPSHOT))
+    if _SCANS is not None:
+        ss = _SCANS.stats()
+        m.set_total("qr_scan_events_written_total", ss["written"])
+        for reason, n in ss["dropped"].items():
+            m.set_total("qr_scan_events_dropped_total", n, reason=reason)
+        m.set_gauge("qr_scan_queue_events", ss["queued"])
+    if _REPLICAS is not None:
+        for r in _REPLICAS.stats():
+            m.set_gauge("qr_db_replica_up", int(r["healthy"]), replica=r["name"])
+            if r["lag"] is not None and r["lag"] != float("inf"):
+                m.set_gauge("qr_db_replica_lag_seconds", r["lag"], replica=r["name"])
+
+_METRICS.add_collector(_collect_stats)
+
+def flush_metrics():
+    """Último volcado del worker (gunicorn: worker_exit; el resto: atexit)."""
+    try:
+        _METRICS.flush()
+    except OSError:
+        pass
+
+atexit.register(flush_metrics)
+
+def flush_scans():
+    """Escaneos que quedaron en la cola del worker (gunicorn: worker_exit; el resto: atexit)."""
+    if _SCANS is not None and _SCANS.flush():
+        print(f"[WARN] Registro de escaneos: {_SCANS.stats()['queued']} eventos sin escribir al salir")
+
+atexit.register(flush_scans)
+
+@app.after_request
+def _finish_timing(resp):
+    t = g.get("_timing")
+    if t is None:
+        return resp
+    total = time.perf_counter() - t["start"]
+    parts = []
+    if "db_pool" in t:
+        parts.append(f"db-pool;dur={t['db_pool'] * 1000:.2f}")
+    if "db" in t:
+        parts.append(f'db;desc="sql={t["db_count"]}";dur={t["db"] * 1000:.2f}')
+    if "render" in t:
+        parts.append(f"render;dur={t['render'] * 1000:.2f}")
+    if "hash" in t:
+        parts.append(f"hash;dur={t['hash'] * 1000:.2f}")
+    parts.append(f"total;dur={total * 1000:.2f}")
+    resp.headers["Server-Timing"] = ", ".join(parts)
+
+    route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+    _METRICS.observe("qr_http_request_duration_seconds", total,
+                     route=route, method=request.method, status=str(resp.status_code))
+    if t.get("db_count", 0) > _DB_BUDGET.get(request.endpoint, (0, 0))[0]:
+        _METRICS.inc("qr_db_budget_exceeded_total", route=route)
+    if "db_pool" in t:
+        _METRICS.inc("qr_db_pool_wait_seconds_total", t["db_pool"])
+    if "render" in t:
+        _METRICS.inc("qr_render_seconds_total", t["render"])
+    if "hash" in t:
+        _METRICS.inc("qr_password_hash_seconds_total", t["hash"])
+    try:
+        _METRICS.maybe_flush()
+    except OSError as e:
+        print(f"[WARN] No se pudieron volcar las métricas: {e}")
     return resp
 
+# ------------------------------------------------
+# Warm-up: todo lo que antes pagaba el primer request de cada worker
+# ------------------------------------------------
+# ready: el proceso terminó el warm-up sin errores de los pasos obligatorios
+_WARM = {"ready": False, "pid": None, "at": None, "last_try": 0.0, "errors": {}}
+_WARM_LOCK = threading.Lock()
+
+def _prime_connections(n):
+    # Abrimos n conexiones a la vez (si no, el pool LIFO reusaría siempre la misma)
+    conns = []
+    try:
+        for _ in range(min(n, _POOL.size)):
+            conns.append(_POOL.acquire())
+    finally:
+        for c in conns:
+            c.close()
+
+def _warm_snapshot():
+    # El que hace el warm-up (el master con preload) arma el snapshot si hace falta y suelta el liderazgo
+    if _SNAPSHOT is None:
+        return
+    _SNAPSHOT.refresh()
+    if _SNAPSHOT.try_lead():
+        try:
+            sync_card_snapshot()
+        finally:
+            _SNAPSHOT.release_lead()
+
+def _check_replicas():
+    # Sin réplicas sanas no es un error para /ready: se lee de la primaria
+    if _REPLICAS is not None and not _REPLICAS.check():
+        raise RuntimeError("ninguna réplica disponible; se lee de la primaria")
+
+def _warm_templates():
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
+def warm_up(connections=None):
+    """
+    Deja el proceso listo para atender: esquema de users, templates compilados,
+    índice de códigos, assets, números de emergencia y `connections` conexiones
+    abiertas en el pool. Si falla algún paso obligatorio (esquema, conexiones)
+    /ready sigue dando 503 y lo reintenta. Devuelve True si quedó listo.
+    """
+    if connections is None:
+        connections = WARM_CONNECTIONS
+    with _WARM_LOCK:
+        _WARM["last_try"] = time.monotonic()
+        errors = {}
+        steps = (
+            ("schema", True, lambda: _STORE.queries),
+            ("connections", True, lambda: _prime_connections(connections)),
+            ("templates", True, _warm_templates),
+            ("code_index", False, load_code_index),
+            ("assets", False, _ASSETS.load),
+            ("emergency_numbers", False, _EMERGENCY.load),
+            ("replicas", False, _check_replicas),
+            ("card_snapshot", False, _warm_snapshot),
+        )
+        for name, required, step in steps:
+            try:
+                step()
+            except Exception as e:
+                print(f"[WARN] Warm-up: falló {name}: {e}")
+                errors[name] = {"error": str(e), "required": required}
+        _WARM["errors"] = errors
+        _WARM["ready"] = not any(e["required"] for e in errors.values())
+        _WARM["pid"] = os.getpid()
+        _WARM["at"] = time.time()
+        return _WARM["ready"]
+
+def before_fork():
+    """gunicorn pre_fork (con preload): el master suelta sus conexiones ociosas y deja de volcar métricas."""
+    _METRICS.release()
+    _POOL.dispose()
+    if _REPLICAS is not None:
+        _REPLICAS.dispose()
+
+def after_fork():
+    """
+    gunicorn post_fork (con preload): el worker hereda esquema, templates e
+    índice del master; le falta abrir sus propias conexiones (el pool del hijo
+    arranca vacío) y ponerse al día con los códigos creados desde el preload.
+    """
+    with _WARM_LOCK:
+        _WARM["ready"] = False
+    errors = {}
+    try:
+        _prime_connections(WARM_CONNECTIONS)
+    except Exception as e:
+        print(f"[WARN] Warm-up del worker: no se pudo conectar a la base: {e}")
+        errors["connections"] = {"error": str(e), "required": True}
+    if _CODE_INDEX.ready:
+        try:
+            _refresh_code_index(0)
+        except Exception as e:
+            print(f"[WARN] Warm-up del worker: falló el delta del índice: {e}")
+            errors["code_index"] = {"error": str(e), "required": False}
+    with _WARM_LOCK:
+        _WARM["errors"] = {**{k: v for k, v in _WARM["errors"].items() if k not in ("connections", "code_index")}, **errors}
+        _WARM["ready"] = not any(e["required"] for e in _WARM["errors"].values())
+        _WARM["pid"] = os.getpid()
+        _WARM["at"] = time.time()
+
+@app.route("/ready")
+def ready():
+    """
+    Readiness del worker que atiende: 503 hasta que terminó el warm-up
+    (a diferencia de /health, que siempre dice "ok"). Si el warm-up falló,
+    lo reintenta como mucho cada WARM_RETRY seg.
+    """
+    if (not _WARM["ready"] or _WARM["pid"] != os.getpid()) and time.monotonic() - _WARM["last_try"] >= WARM_RETRY:
+        warm_up()
+    ok = _WARM["ready"] and _WARM["pid"] == os.getpid()
+    body = {
+        "status": "ready" if ok else "warming_up",
+        "pid": os.getpid(),
+        "warmed_at": _WARM["at"],
+        "errors": _WARM["errors"],
+        "pool": _POOL.stats(),
+    }
+    return jsonify(body), 200 if ok else 503
+
 # ---- DEBUG + RUTAS AUXILIARES (deben estar ANTES de app.run) ----
+# Warm-up al importar: con preload lo hace el master una vez (after_fork completa
+# cada worker); sin preload, cada worker al arrancar. Si la DB no responde, /ready
+# lo reintenta y las consultas detectan el esquema en el primer request que lo necesite.
+warm_up()
+
 print("[DEBUG] app.py cargado OK")
 
 @app.route("/__ping__", methods=["GET"])
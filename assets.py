@@ -0,0 +1,76 @@
+# assets.py
+"""
+Assets generados por build_assets.py (static/dist/ + manifest.json).
+
+- url(nombre):    /assets/<archivo con hash>, para servir con cache immutable.
+- inline(nombre): el contenido ya minificado, para meterlo en el <head>
+                  (CSS crítico) o como <svg> en la página. Se lee una vez.
+- resolve():      qué archivo mandar en /assets/..., eligiendo la variante
+                  precomprimida (.br / .gz) según Accept-Encoding.
+"""
+import hashlib
+import json
+import mimetypes
+import os
+
+from markupsafe import Markup
+
+# extensión del archivo precomprimido -> Content-Encoding
+_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+class AssetManifest:
+    def __init__(self, dist_dir, url_prefix="/assets/"):
+        self.dist_dir = dist_dir
+        self.url_prefix = url_prefix
+        self._manifest = {}
+        self._files = {}      # archivo con hash -> info del manifest
+        self._inline = {}
+        self.version = ""     # cambia con cada build (entra en el ETag de las páginas que inlinean)
+
+    def load(self):
+        with open(os.path.join(self.dist_dir, "manifest.json"), "rb") as f:
+            raw = f.read()
+        manifest = json.loads(raw.decode("utf-8"))
+        self.version = hashlib.blake2b(raw, digest_size=8).hexdigest()
+        self._manifest = manifest
+        self._files = {info["file"]: info for info in manifest.values()}
+        self._inline = {}
+        return len(manifest)
+
+    def url(self, name):
+        info = self._manifest.get(name)
+        return self.url_prefix + info["file"] if info else ""
+
+    def inline(self, name):
+        """Contenido del asset como Markup (vacío si no hay build)."""
+        text = self._inline.get(name)
+        if text is None:
+            info = self._manifest.get(name)
+            if info is None:
+                return Markup("")
+            with open(os.path.join(self.dist_dir, info["file"]), encoding="utf-8") as f:
+                text = self._inline[name] = f.read()
+        return Markup(text)
+
+    def icon(self, name, cls=""):
+        """Ícono SVG inline (icons/<name>.svg) con una clase CSS."""
+        svg = self.inline(f"icons/{name}.svg")
+        if cls and svg.startswith("<svg "):
+            svg = Markup(f'<svg class="{cls}" ') + Markup(svg[5:])
+        return svg
+
+    def resolve(self, filename, accepts):
+        """
+        (path, content_encoding, mimetype) para /assets/<filename>, o None si
+        no es un asset del build. `accepts(enc)` dice si el cliente acepta esa codificación.
+        """
+        info = self._files.get(filename)
+        if info is None:
+            return None
+        mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        path = os.path.join(self.dist_dir, filename)
+        for encoding, ext in _ENCODINGS:
+            if encoding in info and accepts(encoding):
+                return path + ext, encoding, mimetype
+        return path, None, mimetype
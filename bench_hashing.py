@@ -0,0 +1,72 @@
+# bench_hashing.py
+"""
+Benchmark del hash de contraseñas, para dimensionar QR_HASH_WORKERS y
+elegir QR_PASSWORD_METHOD:
+
+    python bench_hashing.py
+    python bench_hashing.py --method scrypt --method scrypt:16384:8:1 --method pbkdf2:sha256:600000
+    python bench_hashing.py --seconds 5 --workers 4
+
+Para cada método mide hashes/seg. en un solo proceso (lo que aguanta un
+worker del pool = un core) y con --workers procesos en paralelo, y estima
+la memoria que usa scrypt con esa cantidad de procesos.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from passwords import _hash, _mp_context, normalize_method
+
+DEFAULT_METHODS = ("scrypt", "scrypt:16384:8:1", "pbkdf2:sha256:600000")
+
+
+def _burst(method, seconds):
+    """Hashea durante `seconds`; devuelve cuántos hizo."""
+    n = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        _hash("contraseña-de-prueba", method)
+        n += 1
+    return n
+
+
+def _scrypt_mem(method):
+    name, *args = method.split(":")
+    if name != "scrypt":
+        return 0
+    n, r, p = map(int, args)
+    return 128 * n * r * p
+
+
+def bench(method, seconds, workers, pool):
+    t0 = time.perf_counter()
+    single = _burst(method, seconds) / (time.perf_counter() - t0)
+    t0 = time.perf_counter()
+    total = sum(pool.map(_burst, [method] * workers, [seconds] * workers))
+    parallel = total / (time.perf_counter() - t0)
+    return single, parallel
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Hashes/seg. por core de los métodos de contraseña")
+    ap.add_argument("--method", action="append", help=f"método de Werkzeug (default: {', '.join(DEFAULT_METHODS)})")
+    ap.add_argument("--seconds", type=float, default=2.0, help="duración de cada medición")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="procesos en paralelo")
+    args = ap.parse_args()
+
+    methods = [normalize_method(m) for m in (args.method or DEFAULT_METHODS)]
+    print(f"{args.workers} procesos, {args.seconds:.1f} s por medición\n")
+    print(f"{'método':28} {'ms/hash':>8} {'h/s 1 core':>11} {f'h/s x{args.workers}':>10} {'h/s/core':>9} {'mem pool':>9}")
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=_mp_context()) as pool:
+        list(pool.map(_burst, [methods[0]] * args.workers, [0] * args.workers))  # levanta los procesos
+        for method in methods:
+            single, parallel = bench(method, args.seconds, args.workers, pool)
+            mem = _scrypt_mem(method) * args.workers
+            print(f"{method:28} {1000 / single:8.1f} {single:11.1f} {parallel:10.1f} "
+                  f"{parallel / args.workers:9.1f} {mem / 2**20:7.0f}MB")
+    print("\nQR_HASH_WORKERS por worker de gunicorn ~= logins/seg. pico / (h/s/core), sin pasar los cores libres.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# bench_snapshot.py
+"""
+Benchmark del snapshot de fichas en disco (card_snapshot.py), para
+dimensionar el archivo y saber cuánto tarda un worker en tenerlo listo:
+
+    python bench_snapshot.py
+    python bench_snapshot.py --cards 1000000 --dir /var/tmp
+
+Arma un snapshot con --cards fichas sintéticas (nombres y teléfonos de largo
+realista), y mide: armado, tamaño por 100k fichas, apertura (mmap), búsquedas
+por segundo, y agregar / fundir un log de --changes fichas editadas.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from card_snapshot import CardSnapshot
+
+
+def _cards(n, seed=1):
+    rnd = random.Random(seed)
+    base = datetime(2024, 1, 1)
+    for i in range(1, n + 1):
+        yield {
+            "id": i,
+            "user_id": rnd.randint(1, n // 3 + 1),
+            "nombre": rnd.choice(("María José", "Juan", "Ana Laura", "Sebastián", "Lucía")),
+            "apellido": rnd.choice(("Fernández", "González Pérez", "Rodríguez", "López")),
+            "grupo_sanguineo": rnd.choice(("0+", "0-", "A+", "B+", "AB-")),
+            "alergias": rnd.choice(("No", "Penicilina", "Maní, mariscos")),
+            "contacto1": f"+54 9 11 {rnd.randint(1000, 9999)}-{rnd.randint(1000, 9999)}",
+            "contacto2": rnd.choice(("", f"+54 9 351 {rnd.randint(100, 999)}-{rnd.randint(1000, 9999)}")),
+            "claimed_at": base + timedelta(seconds=i * 30),
+            "updated_at": base + timedelta(seconds=i * 31),
+        }
+
+
+def bench(n, changes, directory):
+    path = os.path.join(directory, "bench_cards.snap")
+    for p in (path, path + ".log"):
+        if os.path.exists(p):
+            os.remove(p)
+    snap = CardSnapshot(path)
+
+    cards = list(_cards(n))     # que no cuente el generador
+    t0 = time.perf_counter()
+    snap.rebuild(cards)
+    build = time.perf_counter() - t0
+    size = os.path.getsize(path)
+
+    t0 = time.perf_counter()
+    fresh = CardSnapshot(path)
+    fresh.refresh()
+    open_s = time.perf_counter() - t0
+
+    ids = [random.randint(1, n) for _ in range(100000)]
+    t0 = time.perf_counter()
+    for i in ids:
+        fresh.get(i)
+    lookup = (time.perf_counter() - t0) / len(ids)
+
+    edited = [(c["id"], dict(c, nombre=c["nombre"] + " (editado)")) for c in cards[:changes]]
+    del cards
+    t0 = time.perf_counter()
+    snap.append(edited)
+    append = time.perf_counter() - t0
+    log_size = snap.log_size()
+    t0 = time.perf_counter()
+    fresh.refresh()
+    tail = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    snap.compact()
+    compact = time.perf_counter() - t0
+
+    for p in (path, path + ".log", path + ".lock"):
+        if os.path.exists(p):
+            os.remove(p)
+    per_100k = 100000 / n
+    print(f"fichas:            {n}")
+    print(f"armado:            {build:.2f} s ({build * per_100k:.2f} s cada 100k)")
+    print(f"tamaño:            {size / 1e6:.1f} MB ({size / n:.0f} B por ficha, {size * per_100k / 1e6:.1f} MB cada 100k)")
+    print(f"apertura (mmap):   {open_s * 1000:.2f} ms")
+    print(f"búsqueda:          {lookup * 1e6:.1f} µs ({1 / lookup:.0f}/s)")
+    print(f"log de {changes}:".ljust(19) + f"append {append * 1000:.0f} ms, {log_size / 1e3:.0f} kB, "
+          f"lectura en otro worker {tail * 1000:.0f} ms")
+    print(f"compactar:         {compact:.2f} s")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark del snapshot de fichas")
+    ap.add_argument("--cards", type=int, default=100000, help="fichas (default 100000)")
+    ap.add_argument("--changes", type=int, default=1000, help="fichas editadas para el log (default 1000)")
+    ap.add_argument("--dir", default=tempfile.gettempdir(), help="carpeta para el archivo de prueba")
+    args = ap.parse_args()
+    bench(args.cards, args.changes, args.dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# breaker.py
+"""
+Circuit breaker por worker para las lecturas de la ficha pública.
+
+- closed     todo va a la base. `failures` fallas seguidas (error o lectura
+             más lenta que `slow` seg.) lo abren.
+- open       no se consulta la base durante `cooldown` seg.: quien llama usa
+             el snapshot (card_snapshot.py).
+- half_open  pasado el cooldown, UN request prueba la base (los demás siguen
+             con el snapshot). Si anda, se cierra; si falla, vuelve a open.
+             La prueba es un préstamo de `cooldown` seg.: si el request
+             muere sin avisar (una excepción que no es de la base), pasado
+             ese tiempo otro request puede probar.
+
+Una lectura lenta no se corta a la mitad (el driver bloquea); se usa igual,
+pero cuenta como falla para que las siguientes no esperen lo mismo.
+"""
+import threading
+import time
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+STATE_CODES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+
+class CircuitBreaker:
+    def __init__(self, failures=3, cooldown=15.0, slow=0.5):
+        self.max_failures = failures
+        self.cooldown = cooldown
+        self.slow = slow
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.last_error = None
+        self._probe_at = None       # monotonic de la prueba en curso (half_open)
+
+    def allow(self):
+        """True si este request puede ir a la base."""
+        if self.state == CLOSED:
+            return True
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = HALF_OPEN
+            now = time.monotonic()
+            if self.state == HALF_OPEN and (self._probe_at is None or now - self._probe_at >= self.cooldown):
+                self._probe_at = now
+                return True
+            return self.state == CLOSED
+
+    def record(self, seconds):
+        """La lectura anduvo en `seconds`; si pasó el presupuesto cuenta como falla."""
+        if seconds > self.slow:
+            self.failure(f"lectura lenta ({seconds * 1000:.0f} ms)")
+            return
+        if self.state == CLOSED and not self.failures:
+            return
+        with self._lock:
+            if self.state != CLOSED:
+                print(f"[WARN] Base de datos de nuevo disponible: circuito cerrado (venía de {self.last_error})")
+            self.state = CLOSED
+            self.failures = 0
+            self._probe_at = None
+
+    def failure(self, error):
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(error)
+            self._probe_at = None
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.max_failures):
+                if self.state == CLOSED:
+                    print(f"[WARN] Circuito de la base abierto por {self.cooldown:.0f} s: {error}")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def stats(self):
+        return {"state": self.state, "failures": self.failures, "last_error": self.last_error}
@@ -0,0 +1,219 @@
+# build_assets.py
+"""
+Arma los assets de las páginas públicas en static/dist/:
+
+    python build_assets.py            # assets/ -> static/dist/ + manifest.json
+    python build_assets.py --check    # falla si static/dist no está al día
+
+Para cada archivo de assets/ (CSS, SVG):
+- CSS: se purgan las reglas cuyas clases no aparecen en ningún template
+  (sirve también para un bootstrap.min.css completo) y se minifica;
+- nombre con hash del contenido (emergencia.3f2a9c1b.css) para poder
+  servirlo con cache "immutable";
+- variantes precomprimidas .gz y .br (esta última si está instalado el
+  paquete `brotli`), solo si pesan menos que el original.
+
+El manifest (static/dist/manifest.json) mapea el nombre lógico al archivo
+final; lo lee assets.py. El CSS crítico de la ficha va inline desde ahí.
+Los archivos generados se commitean: el deploy no corre este script.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+
+try:
+    import brotli  # opcional: pip install brotli
+except ImportError:
+    brotli = None
+
+BASE = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BASE, "assets")
+DIST_DIR = os.path.join(BASE, "static", "dist")
+TEMPLATES_DIR = os.path.join(BASE, "templates")
+
+_CLASS_ATTR = re.compile(r'class="([^"]*)"')
+_WORD = re.compile(r"[A-Za-z_][\w-]*")
+_SELECTOR_CLASS = re.compile(r"\.(-?[A-Za-z_][\w-]*)")
+
+
+def used_classes(templates_dir=TEMPLATES_DIR):
+    """Todas las palabras que aparecen dentro de class="..." (incluidas las de {% if %})."""
+    used = set()
+    for name in os.listdir(templates_dir):
+        if not name.endswith(".html"):
+            continue
+        with open(os.path.join(templates_dir, name), encoding="utf-8") as f:
+            for attr in _CLASS_ATTR.findall(f.read()):
+                used.update(_WORD.findall(attr))
+    return used
+
+
+# ---------- CSS ----------
+def _strip_comments(css):
+    return re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+
+
+def parse_css(css):
+    """Lista de (prelude, body) o (prelude, [hijos]) para @media/@supports."""
+    css = _strip_comments(css)
+    n = len(css)
+
+    def block(i):
+        out = []
+        while i < n:
+            j = css.find("{", i)
+            k = css.find("}", i)
+            if k != -1 and (j == -1 or k < j):
+                return out, k + 1
+            if j == -1:
+                return out, n
+            prelude = css[i:j].strip()
+            if prelude.startswith("@media") or prelude.startswith("@supports"):
+                children, i = block(j + 1)
+                out.append((prelude, children))
+            else:
+                end = css.find("}", j)
+                out.append((prelude, css[j + 1:end].strip()))
+                i = end + 1
+        return out, n
+
+    rules, _ = block(0)
+    return rules
+
+
+def purge(rules, used):
+    """Saca los selectores con alguna clase que no se usa; las reglas vacías se van."""
+    out = []
+    for prelude, body in rules:
+        if isinstance(body, list):
+            children = purge(body, used)
+            if children:
+                out.append((prelude, children))
+            continue
+        if prelude.startswith("@"):
+            out.append((prelude, body))   # @font-face, @keyframes, ...
+            continue
+        keep = [s for s in (p.strip() for p in prelude.split(","))
+                if all(c in used for c in _SELECTOR_CLASS.findall(s))]
+        if keep:
+            out.append((",".join(keep), body))
+    return out
+
+
+def _min_decl(body):
+    body = re.sub(r"\s+", " ", body).strip()
+    body = re.sub(r"\s*([:;,])\s*", r"\1", body)
+    return body.rstrip(";")
+
+
+def render_css(rules):
+    parts = []
+    for prelude, body in rules:
+        prelude = re.sub(r"\s+", " ", prelude)
+        prelude = re.sub(r"\s*([>+~,])\s*", r"\1", prelude)
+        if isinstance(body, list):
+            parts.append(f"{prelude}{{{render_css(body)}}}")
+        else:
+            parts.append(f"{prelude}{{{_min_decl(body)}}}")
+    return "".join(parts)
+
+
+def build_css(text, used):
+    return render_css(purge(parse_css(text), used))
+
+
+def build_svg(text):
+    return re.sub(r">\s+<", "><", text.strip())
+
+
+# ---------- salida ----------
+def _variants(data):
+    out = {}
+    gz = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(gz) < len(data):
+        out["gzip"] = gz
+    if brotli is not None:
+        br = brotli.compress(data, quality=11)
+        if len(br) < len(data):
+            out["br"] = br
+    return out
+
+
+def build(src_dir=SRC_DIR, dist_dir=DIST_DIR, write=True):
+    """Devuelve el manifest; con write=True además escribe static/dist."""
+    used = used_classes()
+    manifest, files = {}, {}
+    for root, _, names in os.walk(src_dir):
+        for name in sorted(names):
+            src = os.path.join(root, name)
+            logical = os.path.relpath(src, src_dir).replace(os.sep, "/")
+            with open(src, encoding="utf-8") as f:
+                text = f.read()
+            if name.endswith(".css"):
+                data = build_css(text, used).encode("utf-8")
+            elif name.endswith(".svg"):
+                data = build_svg(text).encode("utf-8")
+            else:
+                continue
+            digest = hashlib.blake2b(data, digest_size=4).hexdigest()
+            stem, ext = os.path.splitext(logical)
+            final = f"{stem}.{digest}{ext}"
+            variants = _variants(data)
+            manifest[logical] = {"file": final, "bytes": len(data),
+                                 **{enc: len(blob) for enc, blob in variants.items()}}
+            files[final] = data
+            for enc, blob in variants.items():
+                files[final + (".gz" if enc == "gzip" else ".br")] = blob
+
+    if write:
+        os.makedirs(dist_dir, exist_ok=True)
+        for rel, data in files.items():
+            path = os.path.join(dist_dir, rel)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(data)
+        with open(os.path.join(dist_dir, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+            f.write("\n")
+        # Versiones viejas (otro hash) ya no las referencia nadie
+        for root, _, names in os.walk(dist_dir):
+            for name in names:
+                rel = os.path.relpath(os.path.join(root, name), dist_dir).replace(os.sep, "/")
+                if rel != "manifest.json" and rel not in files:
+                    os.remove(os.path.join(root, name))
+    return manifest
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Purga, minifica, versiona y precomprime los assets")
+    ap.add_argument("--check", action="store_true", help="no escribe; exit 1 si static/dist está desactualizado")
+    args = ap.parse_args()
+
+    if args.check:
+        expected = build(write=False)
+        try:
+            with open(os.path.join(DIST_DIR, "manifest.json"), encoding="utf-8") as f:
+                current = json.load(f)
+        except (OSError, ValueError):
+            current = None
+        cur_files = {k: v["file"] for k, v in (current or {}).items()}
+        if cur_files != {k: v["file"] for k, v in expected.items()}:
+            print("static/dist desactualizado: correr python build_assets.py")
+            sys.exit(1)
+        print("static/dist al día")
+        return
+
+    manifest = build()
+    for logical, info in sorted(manifest.items()):
+        sizes = ", ".join(f"{k} {info[k]} B" for k in ("gzip", "br") if k in info)
+        print(f"{logical:28} -> {info['file']:36} {info['bytes']} B" + (f" ({sizes})" if sizes else ""))
+    if brotli is None:
+        print("[WARN] sin el paquete brotli: no se generaron variantes .br")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# card_formats.py
+"""
+Representaciones alternativas de la ficha pública (además de emergencia.html):
+
+    /emergencia/<id>.json   JSON compacto (integraciones, app offline)
+    /emergencia/<id>.vcf    vCard 3.0 con los teléfonos de contacto
+    /emergencia/<id>.txt    texto plano
+    /emergencia/<id>.lite   HTML mínimo sin CSS (templates/emergencia_lite.html)
+
+o en /emergencia/<id> según el header Accept. Todas salen de la misma fila
+(load_card) y comparten cache y validadores (ETag / Last-Modified) con la página.
+Los tamaños máximos los controla check_page_weight.py.
+"""
+import json
+
+# formato -> Content-Type
+MIMETYPES = {
+    "html": "text/html; charset=utf-8",
+    "json": "application/json",
+    "vcf": "text/vcard; charset=utf-8",
+    "txt": "text/plain; charset=utf-8",
+    "lite": "text/html; charset=utf-8",
+}
+
+# Accept -> formato (el orden define el preferido ante */*)
+ACCEPT = (
+    ("text/html", "html"),
+    ("application/json", "json"),
+    ("text/vcard", "vcf"),
+    ("text/x-vcard", "vcf"),
+    ("text/plain", "txt"),
+)
+
+
+def allergies_text(value):
+    """Misma lectura que emergencia.html: vacío/no/0/false -> 'No'; 1/true/si -> 'Sí'; si no, el texto."""
+    txt = str(value or "").strip()
+    low = txt.lower()
+    if low in ("", "no", "0", "false"):
+        return "No"
+    if low in ("1", "true", "si", "sí"):
+        return "Sí"
+    return txt
+
+
+def card_fields(data):
+    """Campos de la fila de la ficha, ya normalizados (strings, sin None)."""
+    return {
+        "nombre": data.get("nombre") or "",
+        "apellido": data.get("apellido") or "",
+        "grupo_sanguineo": data.get("grupo_sanguineo") or "",
+        "alergias": allergies_text(data.get("alergias")),
+        "contactos": [c for c in (data.get("contacto1"), data.get("contacto2")) if c],
+    }
+
+
+def to_json(qr_id, fields, local=None, stale=False):
+    payload = {"id": qr_id, **fields}
+    if stale:
+        payload["desactualizada"] = True   # salió del snapshot: la base no respondió
+    if local is not None:
+        payload["emergencias"] = {
+            "pais": local.country,
+            "region": local.region,
+            "numeros": {label: number for _, label, number, _ in local.services},
+        }
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+
+def _vc(value):
+    # Escape de TEXT en vCard (RFC 2426 §4)
+    return (value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r", "").replace("\n", "\\n"))
+
+
+def to_vcard(qr_id, fields):
+    nombre, apellido = fields["nombre"], fields["apellido"]
+    full = " ".join(p for p in (nombre, apellido) if p) or f"Ficha {qr_id}"
+    note = f"Grupo sanguíneo: {fields['grupo_sanguineo'] or '-'}. Alergias: {fields['alergias']}."
+    lines = [
+        "BEGIN:VCARD",
+        "VERSION:3.0",
+        f"N:{_vc(apellido)};{_vc(nombre)};;;",
+        f"FN:{_vc(full)}",
+        f"NOTE:{_vc(note)}",
+    ]
+    for i, phone in enumerate(fields["contactos"], 1):
+        lines.append(f"item{i}.TEL;TYPE=VOICE:{_vc(phone)}")
+        lines.append(f"item{i}.X-ABLabel:Contacto de emergencia {i}")
+    lines.append("END:VCARD")
+    return "\r\n".join(lines) + "\r\n"
+
+
+def to_text(qr_id, fields, local=None, stale=False):
+    lines = [
+        "DATOS DE EMERGENCIA",
+        *(["(últimos datos guardados; pueden no estar actualizados)"] if stale else []),
+        f"Nombre: {' '.join(p for p in (fields['nombre'], fields['apellido']) if p)}",
+        f"Grupo sanguíneo: {fields['grupo_sanguineo'] or '-'}",
+        f"Alergias: {fields['alergias']}",
+    ]
+    for i, phone in enumerate(fields["contactos"], 1):
+        lines.append(f"Contacto {i}: {phone}")
+    if local is not None:
+        where = local.nombre + (f", {local.region}" if local.region else "")
+        nums = " / ".join(f"{label} {number}" for _, label, number, _ in local.services)
+        lines.append(f"Emergencias ({where}): {nums}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,121 @@
+# check_card_snapshot.py
+"""
+/emergencia con la base caída, para correr antes de deployar o en CI:
+
+    python check_card_snapshot.py
+
+Levanta la app contra una base SQLite temporal, arma el snapshot de fichas
+(card_snapshot.py) y simula una caída (el pool no puede abrir conexiones y
+las que tenía se cierran). Verifica que:
+
+- el delta y el claim dejan las fichas en el snapshot, en archivos 0600;
+- con la base caída la ficha sale del snapshot (200, X-Card-Source: snapshot
+  y el aviso de datos posiblemente desactualizados);
+- tras QR_DB_BREAKER_FAILURES fallas el circuito se abre y ya no se intenta
+  conectar; una ficha que el snapshot no tiene da 503 con Retry-After;
+- cuando la base vuelve, pasado el cooldown, se lee de nuevo de la base.
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+SAMPLE_PASSWORD = "snapshot-1234"
+COOLDOWN = 0.3
+
+
+def _sample_app(tmp):
+    os.environ["QR_DB_BACKEND"] = "sqlite"
+    os.environ["QR_DB_SQLITE_PATH"] = os.path.join(tmp, "snapshot.sqlite3")
+    os.environ["QR_CARD_SNAPSHOT_PATH"] = os.path.join(tmp, "cards.snap")
+    os.environ["QR_CARD_SNAPSHOT_REFRESH"] = "3600"                # los deltas los pide el script
+    os.environ["QR_DB_BREAKER_COOLDOWN"] = str(COOLDOWN)
+    os.environ.setdefault("QR_METRICS_DIR", os.path.join(tmp, "metrics"))
+    os.environ["QR_RATE_LIMIT_PATH"] = os.path.join(tmp, "ratelimit.bin")
+    os.environ["QR_HASH_WORKERS"] = "0"
+    os.environ["QR_PASSWORD_METHOD"] = "pbkdf2:sha256:1000"
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as qr_app
+
+    store = qr_app._STORE
+    store.create_user("flota@example.com", qr_app.hash_password(SAMPLE_PASSWORD), "Guardada", "Ejemplo")
+    store.insert_codes(["SNAP01", "SNAP02", "VIRGEN01"])
+    store.assign_codes([("SNAP01", "flota@example.com"), ("SNAP02", "flota@example.com")])
+    qr_app.load_code_index()
+    return qr_app
+
+
+def check():
+    failures = []
+
+    def expect(desc, ok, detail=""):
+        print(f"{'OK   ' if ok else 'FALLA'} {desc}{'' if ok else f' ({detail})'}")
+        if not ok:
+            failures.append(desc)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        qr_app = _sample_app(tmp)
+        store, snap, pool = qr_app._STORE, qr_app._SNAPSHOT, qr_app._POOL
+        ids = {c: store.find_code(c)["id"] for c in ("SNAP01", "SNAP02", "VIRGEN01")}
+
+        qr_app.sync_card_snapshot()
+        expect("el delta agrega las fichas reclamadas", snap.get(ids["SNAP01"])[0] and snap.get(ids["SNAP02"])[0],
+               len(snap))
+        client = qr_app.app.test_client()
+        client.post("/login", data={"email": "flota@example.com", "password": SAMPLE_PASSWORD})
+        client.get("/claim/VIRGEN01")
+        known, card = snap.get(ids["VIRGEN01"])
+        expect("el claim guarda la ficha en el snapshot", known and card["user_id"] is not None, card)
+        expect("compactar conserva todo", snap.compact() == 3 and snap.log_size() == 0, len(snap))
+        modes = {p: oct(os.stat(p).st_mode & 0o777) for p in (snap.path, snap.log_path)}
+        expect("la base y el log son 0600 (datos médicos)", set(modes.values()) == {"0o600"}, modes)
+
+        # Caída: conexiones nuevas fallan y las ociosas se cierran
+        attempts = []
+        factory = pool._factory
+
+        def down():
+            attempts.append(1)
+            raise sqlite3.OperationalError("unable to open database file")
+        pool.dispose()
+        pool._factory = down
+        qr_app._CARD_CACHE.clear()
+
+        scanner = qr_app.app.test_client()
+        for i in range(qr_app.DB_BREAKER_FAILURES):
+            resp = scanner.get(f"/emergencia/{ids['SNAP01']}")
+        expect("con la base caída la ficha sale del snapshot",
+               resp.status_code == 200 and resp.headers.get("X-Card-Source") == "snapshot"
+               and "pueden no estar actualizados" in resp.get_data(as_text=True), resp.status_code)
+        resp = scanner.get(f"/emergencia/{ids['SNAP02']}.json")
+        expect("JSON marcado como desactualizado", resp.status_code == 200 and resp.get_json().get("desactualizada"),
+               resp.data)
+        expect("el circuito se abre", qr_app._BREAKER.state == "open", qr_app._BREAKER.stats())
+        tried = len(attempts)
+        resp = scanner.get(f"/emergencia/{ids['SNAP02']}.txt")
+        expect("con el circuito abierto no se intenta conectar", resp.status_code == 200 and len(attempts) == tried,
+               len(attempts) - tried)
+        resp = scanner.get("/emergencia/999999")
+        expect("ficha desconocida: 503 con Retry-After",
+               resp.status_code == 503 and resp.headers.get("Retry-After"), resp.status_code)
+
+        # Vuelve la base
+        pool._factory = factory
+        time.sleep(COOLDOWN + 0.05)
+        resp = scanner.get(f"/emergencia/{ids['SNAP01']}")
+        expect("pasado el cooldown se lee de la base", resp.status_code == 200
+               and "X-Card-Source" not in resp.headers and qr_app._BREAKER.state == "closed",
+               (resp.status_code, qr_app._BREAKER.stats()))
+    return failures
+
+
+def main():
+    failures = check()
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# check_codes.py
+"""
+public_code con verificador y compatibilidad con los códigos viejos, para
+correr antes de deployar o en CI:
+
+    python check_codes.py
+
+Verifica codes.py sin base (verificador, errores de tipeo, sugerencias) y
+después, contra una base SQLite temporal, que check_public_code resuelva
+bien los códigos viejos de 11 caracteres (el largo de los nuevos), pasen o
+no el verificador una vez normalizados (O -> 0, I/L -> 1): con y sin el
+índice en memoria.
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import codes  # noqa: E402
+
+# Código viejo (sin verificador) que choca con el formato nuevo: el último
+# símbolo justo cierra el verificador del código normalizado ("L0TE2024AB" + ?)
+LEGACY_PAYLOAD = "LOTE2024AB"
+COLLISION = LEGACY_PAYLOAD + codes.check_symbol(LEGACY_PAYLOAD)
+# Código viejo de 11 caracteres que no pasa el verificador (lo más común: 31 de cada 32)
+LEGACY_11 = next(LEGACY_PAYLOAD + c for c in "XYZ" if c != codes.check_symbol(LEGACY_PAYLOAD))
+
+
+def _sample_app(tmp):
+    os.environ["QR_DB_BACKEND"] = "sqlite"
+    os.environ["QR_DB_SQLITE_PATH"] = os.path.join(tmp, "codes.sqlite3")
+    os.environ["QR_CARD_SNAPSHOT_PATH"] = os.path.join(tmp, "cards.snap")
+    os.environ.setdefault("QR_METRICS_DIR", os.path.join(tmp, "metrics"))
+    os.environ["QR_RATE_LIMIT_PATH"] = os.path.join(tmp, "ratelimit.bin")
+    os.environ["QR_HASH_WORKERS"] = "0"
+    import app as qr_app
+
+    qr_app._STORE.insert_codes([COLLISION, LEGACY_11])
+    return qr_app
+
+
+def check():
+    failures = []
+
+    def expect(desc, ok, detail=""):
+        print(f"{'OK   ' if ok else 'FALLA'} {desc}{'' if ok else f' ({detail})'}")
+        if not ok:
+            failures.append(desc)
+
+    new = codes.random_code()
+    expect("un código nuevo pasa el verificador", codes.classify(new) == (codes.VALID, new), new)
+    typed = "-".join([new[:4].lower(), new[4:8], new[8:]])
+    expect("minúsculas y guiones se normalizan", codes.classify(typed) == (codes.VALID, new), typed)
+    wrong = new[:3] + codes.ALPHABET[(codes.ALPHABET.index(new[3]) + 1) % 32] + new[4:]
+    expect("un carácter cambiado es INVALID", codes.classify(wrong)[0] == codes.INVALID, wrong)
+    swapped = next((new[:i] + new[i + 1] + new[i] + new[i + 2:] for i in range(len(new) - 1)
+                    if new[i] != new[i + 1]), new)
+    expect("dos vecinos intercambiados se detectan y se sugiere el bueno",
+           codes.classify(swapped)[0] == codes.INVALID and new in codes.suggestions(swapped), swapped)
+    expect("el código viejo de prueba choca con el formato nuevo",
+           codes.classify(COLLISION) == (codes.VALID, codes.normalize(COLLISION)), COLLISION)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        qr_app = _sample_app(tmp)
+        qr_app._CODE_INDEX.ready = False        # como con QR_CODE_INDEX=0: todo va a la base
+        got = qr_app.check_public_code(COLLISION)
+        expect("sin índice: el código viejo que pasa el verificador se busca tal cual",
+               got == COLLISION and qr_app.find_code(got) is not None, got)
+        got = qr_app.check_public_code(LEGACY_11)
+        expect("sin índice: un código viejo de 11 caracteres sin verificador sigue andando",
+               got == LEGACY_11 and qr_app.find_code(got) is not None, got)
+        resp = qr_app.app.test_client().get(f"/v/{LEGACY_11}")
+        expect("sin índice: /v/<código viejo de 11> no es 404", resp.status_code == 302, resp.status_code)
+        qr_app.load_code_index()
+        got = qr_app.check_public_code(COLLISION)
+        expect("con índice: el código viejo que pasa el verificador se busca tal cual",
+               got == COLLISION and qr_app.find_code(got) is not None, got)
+        got = qr_app.check_public_code(LEGACY_11)
+        expect("con índice: un código viejo de 11 caracteres sin verificador sigue andando", got == LEGACY_11, got)
+        expect("un código de 11 con el verificador mal que no existe sigue siendo inválido",
+               qr_app.check_public_code(wrong) is None, wrong)
+        got = qr_app.check_public_code(new)
+        expect("un código nuevo inexistente sigue normalizado", got == new, got)
+    return failures
+
+
+def main():
+    failures = check()
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
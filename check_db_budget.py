@@ -0,0 +1,153 @@
+# check_db_budget.py
+"""
+Presupuesto de idas a la base por ruta, para correr antes de deployar o en CI:
+
+    python check_db_budget.py
+    python check_db_budget.py -v        # muestra el SQL de cada request
+
+Levanta la app contra una base SQLite temporal (un usuario con QR reclamados
+y vírgenes), recorre los flujos de las rutas (ficha, /v, login, panel, claim,
+registro, ...) y por cada request cuenta las sentencias SQL ejecutadas y las
+conexiones nuevas que abrió el pool. Cada endpoint declara su presupuesto con
+@db_budget(sentencias, conexiones) en app.py (sin declarar: 0 y 0); si un
+request se pasa, se informa con el SQL que ejecutó y sale con código 1.
+
+El pool ya está caliente (warm-up de app.py): abrir una conexión nueva en
+medio de un request cuenta como exceso.
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+SAMPLE_PASSWORD = "presupuesto-1234"
+
+
+def _sample_app(db_path):
+    os.environ["QR_DB_BACKEND"] = "sqlite"
+    os.environ["QR_DB_SQLITE_PATH"] = db_path
+    os.environ.setdefault("QR_METRICS_DIR", os.path.join(os.path.dirname(db_path), "metrics"))
+    os.environ["QR_RATE_LIMIT_PATH"] = os.path.join(os.path.dirname(db_path), "ratelimit.bin")
+    os.environ["QR_CARD_SNAPSHOT_PATH"] = os.path.join(os.path.dirname(db_path), "cards.snap")
+    os.environ["QR_HASH_WORKERS"] = "0"                           # hash en el mismo thread
+    os.environ["QR_PASSWORD_METHOD"] = "pbkdf2:sha256:1000"       # rápido; acá no se mide el hash
+    os.environ["QR_WARM_CONNECTIONS"] = "1"
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as qr_app
+
+    store = qr_app._STORE
+    uid = store.create_user("flota@example.com", qr_app.hash_password(SAMPLE_PASSWORD), "Flota", "Ejemplo")
+    store.insert_codes(["BUDGET01", "BUDGET02", "BUDGET03", "VIRGEN01", "VIRGEN02"])
+    store.assign_codes([("BUDGET01", "flota@example.com"), ("BUDGET02", "flota@example.com"),
+                        ("BUDGET03", "flota@example.com")])
+    qr_id = store.find_code("BUDGET01")["id"]
+    qr_app.load_code_index()
+    return qr_app, uid, qr_id
+
+
+def _steps(qr_app, qr_id):
+    """(descripción, método, path, form, headers) en el orden de un uso real."""
+    return [
+        ("health", "GET", "/health", None, None),
+        ("ready", "GET", "/ready", None, None),
+        ("ficha (cache frío)", "GET", f"/emergencia/{qr_id}", None, None),
+        ("ficha (cache caliente)", "GET", f"/emergencia/{qr_id}", None, None),
+        ("ficha condicional (304)", "GET", f"/emergencia/{qr_id}", None, "etag"),
+        ("ficha .json", "GET", f"/emergencia/{qr_id}.json", None, None),
+        ("ficha .vcf", "GET", f"/emergencia/{qr_id}.vcf", None, None),
+        ("ficha inexistente", "GET", "/emergencia/999999", None, None),
+        ("/v reclamado", "GET", "/v/BUDGET01", None, None),
+        ("/v virgen", "GET", "/v/VIRGEN01", None, None),
+        ("/v inexistente", "GET", "/v/NOEXISTE", None, None),
+        ("números de emergencia", "GET", "/api/emergency-numbers/AR", None, None),
+        ("asset", "GET", qr_app._ASSETS.url("emergencia.css"), None, None),
+        ("login (form)", "GET", "/login", None, None),
+        ("login incorrecto", "POST", "/login", {"email": "flota@example.com", "password": "mal"}, None),
+        ("login", "POST", "/login", {"email": "flota@example.com", "password": SAMPLE_PASSWORD}, None),
+        ("panel", "GET", "/panel", None, None),
+        ("panel (cursor)", "GET", "/panel?n=1&antes=999999", None, None),
+        ("panel búsqueda", "GET", "/panel?q=BUDGET&desde=2000-01-01", None, None),
+        ("panel.json", "GET", "/panel.json?n=2", None, None),
+        ("claim (form)", "GET", "/claim", None, None),
+        ("claim manual: virgen", "POST", "/claim", {"code": "VIRGEN01"}, None),
+        ("claim manual: propio", "POST", "/claim", {"code": "BUDGET02"}, None),
+        ("claim", "GET", "/claim/VIRGEN01", None, None),
+        ("claim ya reclamado", "GET", "/claim/BUDGET03", None, None),
+        ("panel después del claim", "GET", "/panel", None, None),
+        ("logout", "GET", "/logout", None, None),
+        ("registro", "POST", "/register", {"email": "nuevo@example.com", "password": "x" * 10, "nombre": "N"}, None),
+        ("claim recién registrado", "GET", "/claim/VIRGEN02", None, None),
+        ("db_ping", "GET", "/db_ping", None, None),
+        ("métricas", "GET", "/metrics", None, None),
+    ]
+
+
+def check(verbose=False):
+    from flask import has_request_context, request, request_finished, request_started
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        qr_app, _, qr_id = _sample_app(os.path.join(tmp, "budget.sqlite3"))
+        app, pool, store = qr_app.app, qr_app._POOL, qr_app._STORE
+
+        current = {}
+        on_query = store.on_query
+
+        def _spy(sql, seconds):
+            if not has_request_context():
+                return on_query(sql, seconds)     # threads de fondo (snapshot, réplicas)
+            current.setdefault("sql", []).append(" ".join(sql.split()))
+            on_query(sql, seconds)
+        store.on_query = _spy
+
+        def _started(sender, **extra):
+            current.clear()
+            current["opened"] = pool.stats()["opened"]
+
+        def _finished(sender, response, **extra):
+            current["endpoint"] = request.endpoint
+            current["opened"] = pool.stats()["opened"] - current["opened"]
+        request_started.connect(_started, app)
+        request_finished.connect(_finished, app)
+
+        client = app.test_client()
+        etag = None
+        print(f"{'paso':28} {'endpoint':22} {'status':>6} {'SQL':>7} {'conex.':>7}")
+        for desc, method, path, form, headers in _steps(qr_app, qr_id):
+            hdrs = {"If-None-Match": etag} if headers == "etag" and etag else {}
+            resp = client.open(path, method=method, data=form, headers=hdrs)
+            if path == f"/emergencia/{qr_id}" and resp.status_code == 200:
+                etag = resp.headers.get("ETag")
+            endpoint = current.get("endpoint")
+            sql = current.get("sql", [])
+            opened = current.get("opened", 0)
+            max_sql, max_conn = qr_app._DB_BUDGET.get(endpoint, (0, 0))
+            over = len(sql) > max_sql or opened > max_conn
+            print(f"{desc:28} {str(endpoint):22} {resp.status_code:>6} {len(sql):>3}/{max_sql:<3} "
+                  f"{opened:>3}/{max_conn:<3}{'  EXCEDIDO' if over else ''}")
+            if resp.status_code >= 500:
+                failures.append(f"{desc}: {method} {path} devolvió {resp.status_code}")
+            if over:
+                failures.append(f"{desc} ({method} {path} -> {endpoint}): {len(sql)} sentencias "
+                                f"(máx. {max_sql}), {opened} conexiones nuevas (máx. {max_conn})"
+                                + "".join(f"\n      {q}" for q in sql))
+            elif verbose:
+                for q in sql:
+                    print(f"      {q}")
+    return failures
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Presupuesto de sentencias SQL y conexiones por ruta")
+    ap.add_argument("-v", "--verbose", action="store_true", help="muestra el SQL de cada request")
+    args = ap.parse_args()
+    failures = check(args.verbose)
+    for f in failures:
+        print(f"FALLA: {f}")
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
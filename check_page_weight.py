@@ -0,0 +1,112 @@
+# check_page_weight.py
+"""
+Chequeo del peso de la ficha pública (/emergencia), para correr antes de
+deployar o en CI:
+
+    python check_page_weight.py                 # presupuesto por defecto
+    python check_page_weight.py --budget 14000  # bytes comprimidos (gzip)
+
+Levanta la app contra una base SQLite temporal con una ficha completa
+(contactos, alergias y números locales) y verifica:
+- el HTML comprimido entra en el presupuesto (por defecto ~14 KB: lo que
+  entra en la primera ventana TCP, un solo round-trip);
+- no hay CSS/JS/fuentes bloqueantes ni recursos de terceros (CDN);
+- los assets referenciados (/assets/...) existen y se sirven con cache immutable;
+- las variantes livianas (card_formats.py) no pasan su tope en bytes sin comprimir.
+Sale con código 1 si algo falla.
+"""
+import argparse
+import gzip
+import os
+import re
+import sys
+import tempfile
+
+DEFAULT_BUDGET = 14 * 1024
+
+# /emergencia/<id>.<ext> -> bytes máximos (sin comprimir)
+VARIANT_CAPS = {"lite": 2048, "txt": 2048, "json": 1024, "vcf": 1024}
+
+_BLOCKING = re.compile(r'<link[^>]+rel="stylesheet"[^>]*>|<script[^>]+src=[^>]*>', re.I)
+_URLS = re.compile(r'(?:href|src)="([^"]+)"', re.I)
+
+
+def _sample_app(db_path):
+    os.environ["QR_DB_BACKEND"] = "sqlite"
+    os.environ["QR_DB_SQLITE_PATH"] = db_path
+    os.environ.setdefault("QR_METRICS_DIR", os.path.join(os.path.dirname(db_path), "metrics"))
+    os.environ["QR_CARD_SNAPSHOT_PATH"] = os.path.join(os.path.dirname(db_path), "cards.snap")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as qr_app
+
+    store = qr_app._STORE
+    uid = store.create_user("peso@example.com", "", "Nombre Bastante Largo", "Apellido Compuesto")
+    conn = store.open_connection()
+    try:
+        conn.execute(
+            "UPDATE users SET grupo_sanguineo='AB-', alergias='Penicilina, AINEs, látex, frutos secos', "
+            "contacto1='+54 9 351 555 0001', contacto2='+54 9 351 555 0002' WHERE id=?", (uid,))
+        conn.execute("INSERT INTO qr_codes (public_code, user_id, claimed_at) VALUES ('PESO0001', ?, CURRENT_TIMESTAMP)", (uid,))
+        qr_id = conn.execute("SELECT id FROM qr_codes WHERE public_code='PESO0001'").fetchone()[0]
+    finally:
+        conn.close()
+    return qr_app.app, qr_id
+
+
+def check(budget):
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        app, qr_id = _sample_app(os.path.join(tmp, "peso.sqlite3"))
+        client = app.test_client()
+        resp = client.get(f"/emergencia/{qr_id}?region=cordoba", headers={"Accept-Language": "es-AR"})
+        if resp.status_code != 200:
+            return [f"/emergencia devolvió {resp.status_code}"]
+        html = resp.get_data()
+        compressed = len(gzip.compress(html, compresslevel=6))
+        print(f"HTML: {len(html)} B, gzip: {compressed} B (presupuesto {budget} B)")
+        if compressed > budget:
+            failures.append(f"HTML comprimido {compressed} B > {budget} B")
+
+        text = html.decode("utf-8")
+        for tag in _BLOCKING.findall(text):
+            failures.append(f"recurso bloqueante: {tag}")
+        for url in _URLS.findall(text):
+            if url.startswith(("tel:", "#", "data:")):
+                continue
+            if url.startswith(("http://", "https://", "//")):
+                failures.append(f"recurso de terceros: {url}")
+                continue
+            if url.startswith("/assets/"):
+                r = client.get(url, headers={"Accept-Encoding": "gzip, br"})
+                cc = r.headers.get("Cache-Control", "")
+                print(f"{url}: {r.status_code}, {len(r.get_data())} B, {r.headers.get('Content-Encoding', 'identity')}")
+                if r.status_code != 200:
+                    failures.append(f"{url} devolvió {r.status_code}")
+                elif "immutable" not in cc:
+                    failures.append(f"{url} sin cache immutable ({cc})")
+
+        for ext, cap in VARIANT_CAPS.items():
+            r = client.get(f"/emergencia/{qr_id}.{ext}?region=cordoba", headers={"Accept-Language": "es-AR"})
+            size = len(r.get_data())
+            print(f".{ext}: {r.status_code}, {size} B (tope {cap} B)")
+            if r.status_code != 200:
+                failures.append(f".{ext} devolvió {r.status_code}")
+            elif size > cap:
+                failures.append(f".{ext} pesa {size} B > {cap} B")
+    return failures
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Presupuesto de peso de /emergencia")
+    ap.add_argument("--budget", type=int, default=DEFAULT_BUDGET, help="bytes máximos del HTML comprimido")
+    args = ap.parse_args()
+    failures = check(args.budget)
+    for f in failures:
+        print(f"FALLA: {f}")
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
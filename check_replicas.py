@@ -0,0 +1,151 @@
+# check_replicas.py
+"""
+Ruteo primaria / réplicas con dos bases locales, para correr antes de deployar
+o en CI:
+
+    python check_replicas.py
+
+Levanta la app contra una primaria SQLite y una réplica (copia de la primaria
+con la API de backup, como si hubiera replicado) y verifica que:
+
+- la ficha y /v leen de la réplica (la réplica tiene otro nombre en el perfil);
+- el login, el claim y el panel van a la primaria, y la sesión que acaba de
+  reclamar sigue leyendo de la primaria (ve su QR aunque la réplica no lo tenga);
+- si la réplica falla en medio de una lectura, la ficha sale igual de la
+  primaria y la réplica queda fuera de rotación hasta el próximo chequeo bueno;
+- si no hay réplicas sanas todo va a la primaria.
+
+Con dos MySQL (primaria + réplica con replicación, p.ej. dos contenedores) se
+prueba lo mismo a mano: QR_DB_HOST=<primaria> QR_DB_REPLICAS=<réplica>:3307 y
+/db_ping muestra el estado y el atraso de cada réplica; con STOP REPLICA en la
+réplica queda fuera de rotación en el siguiente chequeo (QR_DB_REPLICA_CHECK).
+"""
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+
+SAMPLE_PASSWORD = "replicas-1234"
+
+
+def _replicate(primary, replica):
+    src, dst = sqlite3.connect(primary), sqlite3.connect(replica)
+    try:
+        src.backup(dst)
+    finally:
+        src.close()
+        dst.close()
+
+
+def _sql(path, sql, params=()):
+    cnx = sqlite3.connect(path)
+    try:
+        cnx.execute(sql, params)
+        cnx.commit()
+    finally:
+        cnx.close()
+
+
+def _sample_app(tmp):
+    primary = os.path.join(tmp, "primaria.sqlite3")
+    replica = os.path.join(tmp, "replica.sqlite3")
+    os.environ["QR_DB_BACKEND"] = "sqlite"
+    os.environ["QR_DB_SQLITE_PATH"] = primary
+    os.environ["QR_DB_REPLICAS"] = replica
+    os.environ["QR_DB_REPLICA_CHECK"] = "3600"                   # los chequeos los hace el script
+    os.environ.setdefault("QR_METRICS_DIR", os.path.join(tmp, "metrics"))
+    os.environ["QR_RATE_LIMIT_PATH"] = os.path.join(tmp, "ratelimit.bin")
+    os.environ["QR_CARD_SNAPSHOT_PATH"] = os.path.join(tmp, "cards.snap")
+    os.environ["QR_HASH_WORKERS"] = "0"
+    os.environ["QR_PASSWORD_METHOD"] = "pbkdf2:sha256:1000"
+    os.environ["QR_CODE_INDEX"] = "0"                            # /v consulta la base
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as qr_app
+
+    store = qr_app._STORE
+    store.create_user("flota@example.com", qr_app.hash_password(SAMPLE_PASSWORD), "Primaria", "Ejemplo")
+    store.insert_codes(["REPLICA01", "VIRGEN01"])
+    store.assign_codes([("REPLICA01", "flota@example.com")])
+    _replicate(primary, replica)
+    # Mismo perfil con otro nombre en la réplica: así se ve de dónde salió cada ficha
+    _sql(replica, "UPDATE users SET nombre='Replicada' WHERE email='flota@example.com'")
+    return qr_app, primary, replica
+
+
+def check():
+    failures = []
+
+    def expect(desc, ok, detail=""):
+        print(f"{'OK   ' if ok else 'FALLA'} {desc}{'' if ok else f' ({detail})'}")
+        if not ok:
+            failures.append(desc)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        qr_app, primary, replica = _sample_app(tmp)
+        replicas = qr_app._REPLICAS
+        store = qr_app._STORE
+        qr_id = store.find_code("REPLICA01")["id"]
+        virgin_id = store.find_code("VIRGEN01")["id"]
+
+        expect("la réplica entra en rotación", replicas.check() == 1, replicas.stats())
+
+        client = qr_app.app.test_client()
+
+        def card(c, i):
+            qr_app._CARD_CACHE.clear()
+            return c.get(f"/emergencia/{i}.txt")
+
+        resp = card(client, qr_id)
+        expect("la ficha se lee de la réplica", resp.status_code == 200 and b"Replicada" in resp.data,
+               resp.status_code)
+        resp = client.get("/v/REPLICA01")
+        expect("/v se resuelve en la réplica", resp.status_code == 302, resp.status_code)
+
+        resp = client.post("/login", data={"email": "flota@example.com", "password": SAMPLE_PASSWORD})
+        expect("login contra la primaria", resp.status_code == 302, resp.status_code)
+        resp = client.get("/claim/VIRGEN01")
+        expect("claim en la primaria redirige al panel", resp.status_code == 302
+               and resp.headers["Location"].endswith("/panel"), resp.status_code)
+        resp = client.get("/panel")
+        expect("el panel (primaria) muestra el QR recién reclamado",
+               resp.status_code == 200 and b"VIRGEN01" in resp.data, resp.status_code)
+        resp = card(client, virgin_id)
+        expect("la sesión que reclamó lee su ficha de la primaria",
+               resp.status_code == 200 and b"Primaria" in resp.data, resp.status_code)
+        other = qr_app.app.test_client()
+        resp = card(other, virgin_id)
+        expect("otra sesión sigue leyendo la réplica (todavía sin dueño)", resp.status_code == 404,
+               resp.status_code)
+
+        # Réplica rota a mitad de camino: la lectura se repite en la primaria
+        _sql(replica, "DROP TABLE qr_codes")
+        resp = card(other, qr_id)
+        expect("con la réplica rota la ficha sale de la primaria",
+               resp.status_code == 200 and b"Primaria" in resp.data, resp.status_code)
+        expect("la réplica rota queda fuera de rotación", not replicas.stats()[0]["healthy"], replicas.stats())
+        resp = card(other, qr_id)
+        expect("sin réplicas sanas se lee de la primaria",
+               resp.status_code == 200 and b"Primaria" in resp.data, resp.status_code)
+        expect("el chequeo no la vuelve a poner mientras siga rota", replicas.check() == 0, replicas.stats())
+
+        _replicate(primary, replica)
+        expect("repuesta, el chequeo la vuelve a poner en rotación", replicas.check() == 1, replicas.stats())
+        resp = card(other, virgin_id)
+        expect("la réplica al día ya tiene el claim", resp.status_code == 200, resp.status_code)
+
+        metrics = qr_app._METRICS.render()
+        reads = re.search(r'qr_db_replica_reads_total\{replica="[^"]+"\} (\d+)', metrics)
+        expect("métricas de lecturas en réplicas", reads is not None and int(reads.group(1)) > 0, metrics)
+    return failures
+
+
+def main():
+    failures = check()
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+# code_index.py
+"""
+Índice en memoria (por worker) de public_code -> (id, reclamado).
+
+Sirve para que /v/<code>, /claim y /claim/<code> no vayan a MySQL solo para
+responder 404 a bots o códigos mal tipeados.
+
+Estructura:
+- Un filtro de Bloom adelante: si dice "no está", el código no existe (sin
+  falsos negativos) y respondemos sin buscar nada más.
+- Un segmento principal ordenado y "empaquetado" en arrays:
+    _blob     bytes con todos los códigos concatenados (UTF-8, ordenados)
+    _offsets  array('I') con n+1 offsets dentro de _blob
+    _ids      array('q') con el id de qr_codes
+    _claimed  bytearray con 1 si el código tiene dueño
+  La búsqueda es binaria sobre _offsets.
+- Un overlay chico (dict) con los códigos nuevos que llegan por delta; cuando
+  crece se funde con el segmento principal.
+
+Todo eso vive en un solo objeto _Segment: una recarga o una fusión arma uno
+nuevo y lo publica con una sola asignación (self._seg), y lookup lo lee una
+vez, así que un request concurrente nunca mezcla claves nuevas con ids viejos.
+
+Memoria aproximada por millón de códigos de 12 caracteres:
+  blob 12 MB + offsets 4 MB + ids 8 MB + claimed 1 MB + Bloom (1% FP) 1.2 MB
+  ≈ 26 MB, contra ~150 MB de un dict de tuplas. Durante la carga inicial hay un
+  pico extra por la lista temporal que se ordena.
+
+Las filas vienen de Storage (iter_codes para la carga, codes_since para el
+delta; ver load_code_index en app.py). Frescura: se consulta la base por
+delta (id > último id visto o claimed_at >= último claimed_at visto). Un QR
+"des-reclamado" (user_id vuelto a NULL) no se detecta por delta; para eso hay
+que recargar (load con Storage.iter_codes()).
+Carga inicial: ~10 s por millón de códigos (CPython, dominado por el Bloom).
+"""
+import hashlib
+import math
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+
+# Overlay máximo antes de fundirlo con el segmento principal
+MERGE_THRESHOLD = 4096
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+class BloomFilter:
+    """Filtro de Bloom sobre un bytearray, con doble hashing (blake2b)."""
+
+    def __init__(self, capacity, fp_rate=0.01):
+        capacity = max(int(capacity), 1)
+        self.capacity = capacity
+        self.nbits = max(int(-capacity * math.log(fp_rate) / (math.log(2) ** 2)), 8)
+        self.k = max(int(round(self.nbits / capacity * math.log(2))), 1)
+        self._bits = bytearray((self.nbits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        d = hashlib.blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(d[:8], "little")
+        h2 = int.from_bytes(d[8:], "little") | 1
+        m = self.nbits
+        return [(h1 + i * h2) % m for i in range(self.k)]
+
+    def add(self, key):
+        bits = self._bits
+        for p in self._positions(key):
+            bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        bits = self._bits
+        for p in self._positions(key):
+            if not bits[p >> 3] & (1 << (p & 7)):
+                return False
+        return True
+
+    def nbytes(self):
+        return len(self._bits)
+
+
+class _Keys:
+    """Vista de secuencia sobre el blob para usar bisect."""
+    __slots__ = ("blob", "offsets")
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        o = self.offsets
+        return self.blob[o[i]:o[i + 1]]
+
+
+class _Segment:
+    """Estado que lookup lee sin lock; se reemplaza entero (ver CodeIndex._set_main)."""
+    __slots__ = ("keys", "ids", "claimed", "overlay", "bloom")
+
+    def __init__(self, keys, ids, claimed, bloom):
+        self.keys, self.ids, self.claimed, self.bloom = keys, ids, claimed, bloom
+        self.overlay = {}
+
+
+class CodeIndex:
+    def __init__(self, fp_rate=0.01):
+        self.fp_rate = fp_rate
+        self.ready = False
+        self.max_id = 0
+        self.max_claimed_at = _EPOCH
+        self.last_refresh = 0.0      # time.monotonic() del último delta
+        self._lock = threading.Lock()
+        self._set_main(b"", array("I", [0]), array("q"), bytearray())
+
+    # ---------- consulta ----------
+    def lookup(self, code):
+        """(id, claimed) si el código existe; None si no."""
+        key = code.encode("utf-8")
+        seg = self._seg
+        if key not in seg.bloom:
+            return None
+        hit = seg.overlay.get(key)
+        if hit is not None:
+            return hit
+        keys, ids, claimed = seg.keys, seg.ids, seg.claimed
+        i = bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            return ids[i], bool(claimed[i])
+        return None
+
+    def __len__(self):
+        seg = self._seg
+        return len(seg.ids) + len(seg.overlay)
+
+    def memory_bytes(self):
+        seg = self._seg
+        return (len(seg.keys.blob) + seg.keys.offsets.itemsize * len(seg.keys.offsets)
+                + seg.ids.itemsize * len(seg.ids) + len(seg.claimed) + seg.bloom.nbytes())
+
+    # ---------- carga / actualización ----------
+    def load(self, rows):
+        """
+        Carga completa desde un iterable de (id, public_code, claimed, claimed_at).
+        Reemplaza el contenido actual.
+        """
+        items = []
+        max_id = 0
+        max_claimed_at = _EPOCH
+        for qr_id, code, claimed, claimed_at in rows:
+            items.append((code.encode("utf-8"), qr_id, 1 if claimed else 0))
+            if qr_id > max_id:
+                max_id = qr_id
+            if claimed_at is not None and claimed_at > max_claimed_at:
+                max_claimed_at = claimed_at
+        items.sort()
+        with self._lock:
+            self._build(items)
+            self.max_id = max_id
+            self.max_claimed_at = max_claimed_at
+            self.last_refresh = time.monotonic()
+            self.ready = True
+
+    def apply_delta(self, rows):
+        """Aplica filas nuevas o recién reclamadas (mismo formato que load())."""
+        with self._lock:
+            for qr_id, code, claimed, claimed_at in rows:
+                key = code.encode("utf-8")
+                self._upsert(key, qr_id, bool(claimed))
+                if qr_id > self.max_id:
+                    self.max_id = qr_id
+                if claimed_at is not None and claimed_at > self.max_claimed_at:
+                    self.max_claimed_at = claimed_at
+            if len(self._seg.overlay) > MERGE_THRESHOLD:
+                self._merge()
+            self.last_refresh = time.monotonic()
+
+    def mark_claimed(self, code):
+        """Marca como reclamado un código que se reclamó en este worker."""
+        key = code.encode("utf-8")
+        with self._lock:
+            hit = self.lookup(code)
+            if hit is not None:
+                self._upsert(key, hit[0], True)
+
+    # ---------- internos ----------
+    def _set_main(self, blob, offsets, ids, claimed, bloom=None):
+        keys = _Keys(blob, offsets)
+        if bloom is None:
+            bloom = BloomFilter(max(len(ids) * 2, 1024), self.fp_rate)
+            for i in range(len(ids)):
+                bloom.add(keys[i])
+        # Una sola asignación: un lector concurrente ve el segmento viejo o el nuevo
+        self._seg = _Segment(keys, ids, claimed, bloom)
+
+    def _build(self, items, bloom=None):
+        parts = []
+        offsets = array("I", [0])
+        ids = array("q")
+        claimed = bytearray()
+        pos = 0
+        for key, qr_id, flag in items:
+            parts.append(key)
+            pos += len(key)
+            offsets.append(pos)
+            ids.append(qr_id)
+            claimed.append(flag)
+        self._set_main(b"".join(parts), offsets, ids, claimed, bloom)
+
+    def _upsert(self, key, qr_id, claimed):
+        seg = self._seg
+        keys = seg.keys
+        i = bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            seg.claimed[i] = 1 if claimed else 0
+            return
+        if key not in seg.overlay:
+            seg.bloom.add(key)        # antes que el overlay: el Bloom nunca da un falso "no está"
+        seg.overlay[key] = (qr_id, claimed)
+        if seg.bloom.count > seg.bloom.capacity:
+            # El Bloom se llenó: al fundir se reconstruye con el doble de capacidad
+            self._merge(keep_bloom=False)
+
+    def _merge(self, keep_bloom=True):
+        seg = self._seg
+        keys, ids, claimed = seg.keys, seg.ids, seg.claimed
+        items = [(keys[i], ids[i], claimed[i]) for i in range(len(ids))]
+        items.extend((k, v[0], 1 if v[1] else 0) for k, v in seg.overlay.items())
+        items.sort()
+        # Todas las claves del overlay ya están en el Bloom: se puede reusar
+        self._build(items, seg.bloom if keep_bloom else None)
+
@@ -0,0 +1,118 @@
+# codes.py
+"""
+Generación y verificación de public_code para etiquetas vírgenes.
+
+Usamos el alfabeto Crockford base32 (sin I, L, O, U) para que los códigos se
+puedan leer y tipear desde una etiqueta sin confundir 0/O ni 1/I/L. Al leer
+un código tipeado, O cuenta como 0 e I / L como 1, y se ignoran guiones y
+espacios.
+
+Los códigos nuevos llevan al final un símbolo verificador del mismo
+alfabeto: el código entero, tomado como polinomio sobre GF(32) y evaluado en
+`a` (Horner), tiene que dar 0. Detecta siempre un carácter cambiado, dos
+vecinos intercambiados (AB -> BA) y dos separados por uno (ABC -> CBA), sin
+ir a la base. Los códigos viejos (sin verificador) se aceptan aparte, por un
+camino de compatibilidad explícito (ver classify).
+"""
+import re
+import secrets
+
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+DEFAULT_LENGTH = 10                   # 50 bits de entropía (sin contar el verificador)
+CHECKED_LENGTH = DEFAULT_LENGTH + 1   # largo de un código nuevo, con el verificador
+
+VALID, LEGACY, INVALID = "valid", "legacy", "invalid"
+
+# Formato de los códigos anteriores al verificador (el que aceptaba /claim)
+LEGACY_PATTERN = r"[A-Z0-9\-]{4,64}"
+
+_VALUE = {c: i for i, c in enumerate(ALPHABET)}
+_VALUE.update({"O": 0, "I": 1, "L": 1})
+_SEPARATORS = str.maketrans("", "", "- ")
+
+# GF(32) con x^5 + x^2 + 1; `a` = x. _MUL_A[c] = a·c
+_POLY = 0b100101
+_MUL_A = [((c << 1) ^ _POLY) if c & 0b10000 else c << 1 for c in range(32)]
+
+
+def _residue(values):
+    c = 0
+    for v in values:
+        c = _MUL_A[c] ^ v
+    return c
+
+
+def check_symbol(payload):
+    """Símbolo verificador de un código sin verificador (alfabeto Crockford)."""
+    return ALPHABET[_MUL_A[_residue(_VALUE[ch] for ch in payload)]]
+
+
+def normalize(code):
+    """Mayúsculas, sin guiones ni espacios, O -> 0, I/L -> 1. None si queda algún carácter fuera del alfabeto."""
+    code = code.upper().translate(_SEPARATORS)
+    if not code or any(ch not in _VALUE for ch in code):
+        return None
+    return "".join(ALPHABET[_VALUE[ch]] for ch in code)
+
+
+def is_valid(code):
+    """True si `code` (normalizado) tiene el largo de los códigos nuevos y su verificador cierra."""
+    return len(code) == CHECKED_LENGTH and _residue(_VALUE[ch] for ch in code) == 0
+
+
+def classify(code, legacy=LEGACY_PATTERN):
+    """
+    (estado, código) sin consultar nada:
+    - VALID: código nuevo con verificador correcto (se devuelve normalizado);
+    - LEGACY: no tiene la forma de un código nuevo pero coincide con `legacy`
+      (regex; None = no se aceptan códigos viejos); se devuelve en mayúsculas;
+    - INVALID: ninguna de las dos. Un código con la forma de uno nuevo y el
+      verificador mal es INVALID aunque `legacy` lo acepte: es un error de tipeo.
+    """
+    norm = normalize(code)
+    if norm is not None and len(norm) == CHECKED_LENGTH:
+        return (VALID, norm) if is_valid(norm) else (INVALID, norm)
+    upper = code.strip().upper()
+    if legacy and re.fullmatch(legacy, upper):
+        return LEGACY, upper
+    return INVALID, norm or upper
+
+
+def suggestions(code, limit=3):
+    """Códigos válidos a un intercambio de distancia (vecinos o separados por uno) de `code`."""
+    norm = normalize(code)
+    if norm is None or len(norm) != CHECKED_LENGTH:
+        return []
+    out = []
+    for gap in (1, 2):
+        for i in range(len(norm) - gap):
+            j = i + gap
+            if norm[i] == norm[j]:
+                continue
+            cand = norm[:i] + norm[j] + norm[i + 1:j] + norm[i] + norm[j + 1:]
+            if is_valid(cand) and cand not in out:
+                out.append(cand)
+                if len(out) >= limit:
+                    return out
+    return out
+
+
+def random_code(length=DEFAULT_LENGTH):
+    """Código nuevo: `length` símbolos al azar + el verificador."""
+    payload = "".join(secrets.choice(ALPHABET) for _ in range(length))
+    return payload + check_symbol(payload)
+
+
+def unique_codes(n, seen, length=DEFAULT_LENGTH):
+    """
+    Genera n códigos nuevos que no estén en `seen` (un set), y los agrega a `seen`.
+    Las colisiones contra la base se resuelven aparte (ver mint_codes.py).
+    """
+    out = []
+    while len(out) < n:
+        c = random_code(length)
+        if c in seen:
+            continue
+        seen.add(c)
+        out.append(c)
+    return out
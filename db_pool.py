@@ -0,0 +1,214 @@
+# db_pool.py
+"""
+Pool acotado de conexiones a la base.
+
+- Como máximo `size` conexiones abiertas por proceso (worker).
+- Las conexiones ociosas se reutilizan en orden LIFO (la más "caliente" primero).
+- Antes de entregar una conexión que estuvo ociosa más de `ping_after` segundos
+  se le hace un ping; si está muerta se descarta y se abre otra.
+- Las conexiones con más de `recycle` segundos de vida se cierran y se reemplazan
+  (MySQL corta las conexiones ociosas por wait_timeout).
+- Después de un fork (gunicorn crea los workers con fork) el pool del hijo
+  arranca vacío: nunca se comparte un socket entre procesos.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    """No se pudo obtener una conexión del pool dentro del timeout."""
+
+
+def _mysql_ping(raw):
+    # mysql.connector: ping() lanza excepción si la conexión no responde
+    raw.ping(reconnect=False)
+
+
+class PooledConnection:
+    """
+    Envoltorio liviano sobre la conexión real.
+    - close() devuelve la conexión al pool (no la cierra de verdad).
+    - Si está "pinned" (conexión por request), close() no hace nada: la
+      devuelve el teardown de Flask con release().
+    El resto de los atributos se delegan a la conexión real.
+    """
+    __slots__ = ("_pool", "_raw", "_pinned")
+
+    def __init__(self, pool, raw, pinned=False):
+        self._pool = pool
+        self._raw = raw
+        self._pinned = pinned
+
+    def __getattr__(self, name):
+        raw = self._raw
+        if raw is None:
+            raise RuntimeError("La conexión ya fue devuelta al pool")
+        return getattr(raw, name)
+
+    def close(self):
+        if self._pinned:
+            return
+        self.release()
+
+    def release(self):
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool._put_back(raw)
+
+    def discard(self):
+        """Devuelve el slot al pool cerrando la conexión (p.ej. tras un error de red)."""
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool._drop(raw)
+
+
+class ConnectionPool:
+    def __init__(self, factory, size=5, timeout=10.0, recycle=3600.0,
+                 ping_after=30.0, pinger=_mysql_ping):
+        if size < 1:
+            raise ValueError("size debe ser >= 1")
+        self._factory = factory
+        self._pinger = pinger
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_after = ping_after
+        self._lock = threading.Condition(threading.Lock())
+        self._reset_state()
+        _POOLS.append(self)
+
+    def _reset_state(self):
+        self._pid = os.getpid()
+        self._idle = deque()      # (raw, created_at, last_used)
+        self._meta = {}           # id(raw) -> created_at
+        self._open = 0            # conexiones vivas (ociosas + prestadas)
+        self._opened = 0          # conexiones abiertas desde el arranque (acumulado)
+
+    # ---------- API pública ----------
+    def acquire(self, pinned=False):
+        """Presta una conexión (PooledConnection). Bloquea hasta `timeout` si el pool está lleno."""
+        self._check_fork()
+        deadline = time.monotonic() + self.timeout
+        with self._lock:
+            while True:
+                if self._idle:
+                    raw, created, last_used = self._idle.pop()
+                    break
+                if self._open < self.size:
+                    self._open += 1
+                    raw = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(f"Pool agotado ({self.size} conexiones en uso)")
+                self._lock.wait(remaining)
+
+        if raw is None:
+            raw = self._open_new()
+        else:
+            raw = self._validate(raw, created, last_used)
+        return PooledConnection(self, raw, pinned=pinned)
+
+    def dispose(self):
+        """Cierra todas las conexiones ociosas (las prestadas se cierran al devolverse)."""
+        with self._lock:
+            idle, self._idle = self._idle, deque()
+            self._open -= len(idle)
+            self._lock.notify_all()
+        for raw, _, _ in idle:
+            self._meta.pop(id(raw), None)
+            _quiet_close(raw)
+
+    def after_fork(self):
+        """
+        Llamar en el proceso hijo después de un fork. No cerramos las conexiones
+        heredadas (cerrarlas mandaría COM_QUIT por el socket del padre); solo
+        las olvidamos.
+        """
+        self._lock = threading.Condition(threading.Lock())
+        self._reset_state()
+
+    def stats(self):
+        with self._lock:
+            return {"size": self.size, "open": self._open, "idle": len(self._idle), "opened": self._opened}
+
+    # ---------- internos ----------
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            self.after_fork()
+
+    def _open_new(self):
+        try:
+            raw = self._factory()
+        except BaseException:
+            with self._lock:
+                self._open -= 1
+                self._lock.notify()
+            raise
+        self._meta[id(raw)] = time.monotonic()
+        with self._lock:
+            self._opened += 1
+        return raw
+
+    def _validate(self, raw, created, last_used):
+        now = time.monotonic()
+        if self.recycle and now - created > self.recycle:
+            self._forget(raw)
+            _quiet_close(raw)
+            return self._open_new()
+        if self.ping_after is not None and now - last_used > self.ping_after:
+            try:
+                self._pinger(raw)
+            except Exception:
+                self._forget(raw)
+                _quiet_close(raw)
+                return self._open_new()
+        return raw
+
+    def _forget(self, raw):
+        self._meta.pop(id(raw), None)
+
+    def _put_back(self, raw):
+        if self._pid != os.getpid():
+            return  # conexión heredada de otro proceso: la ignoramos
+        try:
+            if getattr(raw, "in_transaction", False):
+                raw.rollback()
+        except Exception:
+            self._drop(raw)
+            return
+        created = self._meta.get(id(raw), time.monotonic())
+        with self._lock:
+            self._idle.append((raw, created, time.monotonic()))
+            self._lock.notify()
+
+    def _drop(self, raw):
+        self._forget(raw)
+        _quiet_close(raw)
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            self._open -= 1
+            self._lock.notify()
+
+
+def _quiet_close(raw):
+    try:
+        raw.close()
+    except Exception:
+        pass
+
+
+# Todos los pools del proceso, para resetearlos en el hijo tras un fork
+_POOLS = []
+
+
+def _reset_all_after_fork():
+    for p in _POOLS:
+        p.after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_all_after_fork)
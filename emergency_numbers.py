@@ -0,0 +1,176 @@
+# emergency_numbers.py
+"""
+Números de emergencia por país / región, a partir de
+static/emergency_numbers_partial_updated.json:
+
+    {"AR": {"nombre": "Argentina",
+            "default": {"policía": "911", ...},
+            "Córdoba": {"policía": "101", ...}, ...}, ...}
+
+El archivo se lee una vez por worker y se arma un índice:
+- país por código ISO ("AR") o por nombre ("argentina"),
+- región sin importar mayúsculas ni acentos ("cordoba" -> "Córdoba"),
+- si la región no está (o no vino) se usa "default".
+Cada entrada ya trae armado su JSON (y su ETag) para el endpoint, así que
+por request el costo es una búsqueda en un dict.
+
+maybe_reload() vuelve a leer el archivo si cambió (mtime/tamaño), como mucho
+cada `check_every` seg.: se puede actualizar sin reiniciar los workers.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import namedtuple
+
+# services: tuple de (clave, etiqueta, número tal cual, número para tel:)
+Entry = namedtuple("Entry", "country nombre region services body etag")
+
+# Todo lo que sale de un archivo: se reemplaza entero en una sola asignación
+_Index = namedtuple("_Index", "countries aliases all_body version")
+
+_LABELS = {
+    "policía": "Policía",
+    "bomberos": "Bomberos",
+    "ambulancia": "Ambulancia",
+    "general": "Emergencias",
+    "bomberos_ambulancia": "Bomberos / Ambulancia",
+}
+
+_PHONE = re.compile(r"\+?\d[\d\s-]*\d|\d")
+
+
+def normalize(text):
+    """'  Córdoba ' -> 'cordoba' (sin acentos, minúsculas, espacios simples)."""
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(text.casefold().split())
+
+
+def label(key):
+    return _LABELS.get(key) or key.replace("_", " ").capitalize()
+
+
+def tel(number):
+    """Primer número marcable de '107 (SAME)' / '999 or 112' (para href="tel:")."""
+    m = _PHONE.search(number or "")
+    return re.sub(r"[\s-]", "", m.group(0)) if m else ""
+
+
+def _entry(code, nombre, region, services):
+    items = tuple((k, label(k), str(v), tel(str(v))) for k, v in services.items())
+    payload = {
+        "country": code,
+        "nombre": nombre,
+        "region": region,
+        "services": [{"key": k, "label": lb, "number": num, "tel": t} for k, lb, num, t in items],
+    }
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    etag = hashlib.blake2b(body, digest_size=12).hexdigest()
+    return Entry(code, nombre, region, items, body, etag)
+
+
+def build_index(data):
+    """
+    data: el JSON ya parseado. Devuelve (countries, aliases):
+    countries: {"AR": {"default": Entry, "regions": {"cordoba": Entry, ...}}}
+    aliases:   {"ar": "AR", "argentina": "AR", ...}
+    """
+    countries, aliases = {}, {}
+    for code, info in data.items():
+        code = code.upper()
+        nombre = info.get("nombre") or code
+        default = _entry(code, nombre, None, info.get("default") or {})
+        regions = {}
+        for name, services in info.items():
+            if name in ("nombre", "default") or not isinstance(services, dict):
+                continue
+            regions[normalize(name)] = _entry(code, nombre, name, services)
+        countries[code] = {"default": default, "regions": regions}
+        aliases[normalize(code)] = code
+        aliases[normalize(nombre)] = code
+    return countries, aliases
+
+
+class EmergencyNumbers:
+    def __init__(self, path, check_every=30.0):
+        self.path = path
+        self.check_every = check_every
+        self._index = _Index({}, {}, b"{}", "")
+        self._sig = None          # (mtime_ns, size) del archivo cargado
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return bool(self._index.countries)
+
+    @property
+    def version(self):
+        """Hash del archivo cargado (va en el ETag del listado)."""
+        return self._index.version
+
+    @property
+    def all_body(self):
+        return self._index.all_body
+
+    def listing(self):
+        """(JSON del listado de países, versión), del mismo archivo."""
+        index = self._index
+        return index.all_body, index.version
+
+    def load(self):
+        """Lee el archivo y reemplaza el índice de una sola vez."""
+        st = os.stat(self.path)
+        with open(self.path, "rb") as f:
+            raw = f.read()
+        data = json.loads(raw.decode("utf-8"))
+        countries, aliases = build_index(data)
+        listing = {code: {"nombre": c["default"].nombre,
+                          "regiones": sorted(e.region for e in c["regions"].values())}
+                   for code, c in countries.items()}
+        all_body = json.dumps(listing, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        # Una sola asignación: los lectores ven el índice viejo o el nuevo completo, nunca uno a medias
+        self._index = _Index(countries, aliases, all_body, hashlib.blake2b(raw, digest_size=12).hexdigest())
+        self._sig = (st.st_mtime_ns, st.st_size)
+        self._checked = time.monotonic()
+        return len(countries)
+
+    def maybe_reload(self):
+        """Recarga si el archivo cambió. Barato: un stat cada `check_every` seg."""
+        if time.monotonic() - self._checked < self.check_every:
+            return False
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            self._checked = time.monotonic()
+            st = os.stat(self.path)
+            if (st.st_mtime_ns, st.st_size) == self._sig:
+                return False
+            self.load()
+            return True
+        finally:
+            self._lock.release()
+
+    def country_code(self, country):
+        if not country:
+            return None
+        return self._index.aliases.get(normalize(country))
+
+    def lookup(self, country, region=None):
+        """Entry del país/región (o del default del país), o None si el país no está."""
+        if not country:
+            return None
+        index = self._index      # una sola lectura: alias y país del mismo archivo
+        code = index.aliases.get(normalize(country))
+        if code is None:
+            return None
+        c = index.countries[code]
+        if region:
+            e = c["regions"].get(normalize(region))
+            if e is not None:
+                return e
+        return c["default"]
@@ -1,12 +1,22 @@
 import os
 
+import profiles
+
 # Bind al puerto que da Railway
 bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
 
-# Perfil ultra liviano por defecto (puede subirse luego)
-workers = int(os.getenv("WEB_CONCURRENCY", "1"))   # 1 worker
-threads = int(os.getenv("WEB_THREADS", "1"))        # 1 thread
-worker_class = os.getenv("WEB_WORKER_CLASS", "sync")
+# Perfil de ejecución (WEB_PROFILE=sync|gthread|gevent, ver profiles.py).
+# Por defecto el ultra liviano: 1 worker sync, 1 thread.
+_profile = profiles.apply_env(profiles.get_profile())
+workers = _profile["workers"]
+threads = _profile["threads"]
+worker_class = _profile["worker_class"]
+worker_connections = _profile["worker_connections"]
+
+# preload: el master importa la app y hace el warm-up (esquema, templates,
+# índice de códigos, assets) una sola vez; cada worker nace ya caliente y
+# solo abre sus conexiones (post_fork).
+preload_app = _profile["preload_app"]
 
 # Estabilidad (evita fugas de memoria a largo plazo)
 max_requests = int(os.getenv("WEB_MAX_REQUESTS", "200"))
@@ -18,3 +28,30 @@ keepalive = 30
 accesslog = "-"
 errorlog = "-"
 loglevel = os.getenv("LOG_LEVEL", "info")
+
+# Métricas: cada worker vuelca las suyas en QR_METRICS_DIR (ver metrics.py);
+# el master borra las de la corrida anterior antes de crear los workers.
+def on_starting(server):
+    import metrics
+    metrics.clear_dir()
+    server.log.info("Perfil %s: %s x%d, threads=%d, preload=%s", _profile["name"],
+                    worker_class, workers, threads, preload_app)
+
+def pre_fork(server, worker):
+    # El master no atiende requests: no le dejamos conexiones que el hijo heredaría
+    if server.cfg.preload_app:
+        from app import before_fork
+        before_fork()
+
+def post_fork(server, worker):
+    # Sin preload (gevent) la app todavía no se importó: se calienta sola al importarse
+    # en el worker, después del monkey patching. Importarla acá lo rompería.
+    if server.cfg.preload_app:
+        from app import after_fork
+        after_fork()
+
+def worker_exit(server, worker):
+    # Lo que el worker acumuló desde su último volcado (max_requests los recicla seguido)
+    from app import flush_metrics, flush_scans
+    flush_scans()
+    flush_metrics()
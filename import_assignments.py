@@ -0,0 +1,280 @@
+# import_assignments.py
+"""
+Importador masivo de asignaciones email -> public_code (planillas de empresas).
+
+Ejemplos:
+  python import_assignments.py planilla.csv --results resultado.csv
+  python import_assignments.py planilla.jsonl --results resultado.csv --batch 1000 --dry-run
+
+Entrada (CSV con encabezado o JSONL), columnas:
+  email, public_code                                   (obligatorias)
+  nombre, apellido, grupo_sanguineo, alergias,
+  contacto1, contacto2                                 (opcionales)
+
+- Se lee en streaming y se procesa por tandas (--batch), una transacción por tanda.
+- Los usuarios se resuelven con un SELECT ... IN (...) por tanda; los que no
+  existen se crean sin contraseña (tienen que blanquearla para entrar).
+- Los datos de perfil se cargan en usuarios creados por el import; con
+  --update-profiles también se pisan en usuarios existentes.
+- Los códigos se reclaman con la misma guarda que /claim/<code>
+  (solo si user_id IS NULL), en un único UPDATE por tanda.
+- --dry-run hace todo y al final de cada tanda hace ROLLBACK.
+
+El archivo de resultados tiene una fila por fila de entrada con su estado:
+  claimed         reclamado ahora
+  already_owned   el código ya era de ese usuario
+  taken           el código ya tiene otro dueño
+  code_not_found  el código no existe
+  duplicate       el código ya apareció antes en la misma tanda
+  invalid         falta email o código, el email es inválido o la línea del
+                  JSONL no es un objeto JSON
+"""
+import argparse
+import csv
+import json
+import re
+import sys
+import time
+
+from codes import VALID, classify
+from mint_codes import connect
+from user_queries import detect_user_columns
+
+PROFILE_FIELDS = {
+    # campo de la planilla -> alias lógico de user_queries.COLUMN_CANDIDATES
+    "nombre": "first",
+    "apellido": "last",
+    "grupo_sanguineo": "blood",
+    "alergias": "allergies",
+    "contacto1": "phone1",
+    "contacto2": "phone2",
+}
+
+RESULT_COLUMNS = ["line", "email", "public_code", "status", "user_id", "user_created", "qr_id"]
+
+
+# ---------- lectura en streaming ----------
+def read_rows(path):
+    """Genera (nro_de_línea, dict) sin cargar el archivo entero. Una línea JSONL rota da un dict vacío (invalid)."""
+    if path.endswith(".jsonl"):
+        with open(path, encoding="utf-8") as f:
+            for n, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                yield n, row if isinstance(row, dict) else {}
+    else:
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            for n, row in enumerate(csv.DictReader(f), start=2):
+                yield n, row
+
+
+def batched(it, size):
+    batch = []
+    for item in it:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _text(raw, field):
+    """Valor de la fila como texto (en JSONL puede venir un número, null, ...)."""
+    value = raw.get(field)
+    return "" if value is None else str(value).strip()
+
+
+def _marks(n):
+    return ", ".join(["%s"] * n)
+
+
+# ---------- una tanda ----------
+class Importer:
+    def __init__(self, conn, colmap, update_profiles=False, dry_run=False):
+        self.conn = conn
+        self.colmap = colmap
+        self.update_profiles = update_profiles
+        self.dry_run = dry_run
+        self.id_col = colmap["id"] or "id"
+        self.email_col = colmap["email"] or "email"
+        self.pwd_col = colmap["pwd"] or "password_hash"
+
+    def process(self, batch):
+        results = []
+        valid = []
+        for line, raw in batch:
+            email = _text(raw, "email").lower()
+            code = _text(raw, "public_code").upper()
+            res = {"line": line, "email": email, "public_code": code, "status": None,
+                   "user_id": "", "user_created": 0, "qr_id": ""}
+            results.append(res)
+            if not (email and code) or not re.match(r".+@.+\..+", email):
+                res["status"] = "invalid"
+                continue
+            # Códigos nuevos tipeados en la planilla (minúsculas, guiones, O/I/L): como los guarda la base.
+            # Los que no pasan el verificador igual se buscan: puede ser un código viejo de 11 caracteres
+            status, norm = classify(code)
+            if status == VALID:
+                res["public_code"] = norm
+            valid.append((res, raw))
+
+        cur = self.conn.cursor()
+        try:
+            # autocommit está apagado: todo lo de la tanda va en una transacción
+            users = self._resolve_users(cur, valid)
+            self._claim(cur, valid, users)
+            if self.dry_run:
+                self.conn.rollback()
+            else:
+                self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            cur.close()
+        return results
+
+    def _resolve_users(self, cur, valid):
+        emails = sorted(set(res["email"] for res, _ in valid))
+        users = {}
+        if emails:
+            cur.execute(
+                f"SELECT {self.email_col}, {self.id_col} FROM users WHERE {self.email_col} IN ({_marks(len(emails))})",
+                tuple(emails),
+            )
+            users = {e: uid for e, uid in cur.fetchall()}
+
+        missing = [e for e in emails if e not in users]
+        if missing:
+            # Sin contraseña: login() responde "Usuario sin contraseña configurada"
+            cur.executemany(
+                f"INSERT INTO users ({self.email_col}, {self.pwd_col}) VALUES (%s, '')",
+                [(e,) for e in missing],
+            )
+            cur.execute(
+                f"SELECT {self.email_col}, {self.id_col} FROM users WHERE {self.email_col} IN ({_marks(len(missing))})",
+                tuple(missing),
+            )
+            users.update({e: uid for e, uid in cur.fetchall()})
+        created = set(missing)
+
+        profiles = {}
+        for res, raw in valid:
+            res["user_id"] = users[res["email"]]
+            res["user_created"] = 1 if res["email"] in created else 0
+            if res["user_created"] or self.update_profiles:
+                fields = {f: _text(raw, f) for f in PROFILE_FIELDS}
+                fields = {f: v for f, v in fields.items() if v and self.colmap[PROFILE_FIELDS[f]]}
+                if fields:
+                    profiles.setdefault(res["user_id"], {}).update(fields)
+        self._update_profiles(cur, profiles)
+        return users
+
+    def _update_profiles(self, cur, profiles):
+        # Agrupamos por conjunto de columnas para usar executemany
+        groups = {}
+        for uid, fields in profiles.items():
+            cols = tuple(sorted(fields))
+            groups.setdefault(cols, []).append(tuple(fields[c] for c in cols) + (uid,))
+        for cols, rows in groups.items():
+            sets = ", ".join(f"{self.colmap[PROFILE_FIELDS[c]]}=%s" for c in cols)
+            if self.colmap["updated"]:
+                # la ficha pública cambia: nueva versión para el ETag de /emergencia
+                sets += f", {self.colmap['updated']}=CURRENT_TIMESTAMP"
+            cur.executemany(f"UPDATE users SET {sets} WHERE {self.id_col}=%s", rows)
+
+    def _claim(self, cur, valid, users):
+        codes = sorted(set(res["public_code"] for res, _ in valid))
+        existing = {}
+        if codes:
+            # FOR UPDATE: el estado no cambia entre esta lectura y el UPDATE
+            cur.execute(
+                f"SELECT public_code, id, user_id FROM qr_codes WHERE public_code IN ({_marks(len(codes))}) FOR UPDATE",
+                tuple(codes),
+            )
+            existing = {c: (qr_id, uid) for c, qr_id, uid in cur.fetchall()}
+
+        to_claim = {}
+        seen = set()
+        for res, _ in valid:
+            code = res["public_code"]
+            if code in seen:
+                res["status"] = "duplicate"
+                continue
+            seen.add(code)
+            if code not in existing:
+                res["status"] = "code_not_found"
+                continue
+            qr_id, owner = existing[code]
+            res["qr_id"] = qr_id
+            if owner is None:
+                to_claim[code] = res["user_id"]
+                res["status"] = "claimed"
+            elif owner == res["user_id"]:
+                res["status"] = "already_owned"
+            else:
+                res["status"] = "taken"
+
+        if to_claim:
+            cases = " ".join(["WHEN %s THEN %s"] * len(to_claim))
+            params = []
+            for code, uid in to_claim.items():
+                params += [code, uid]
+            params += list(to_claim)
+            cur.execute(
+                f"UPDATE qr_codes SET user_id = CASE public_code {cases} END, claimed_at=NOW() "
+                f"WHERE user_id IS NULL AND public_code IN ({_marks(len(to_claim))})",
+                tuple(params),
+            )
+
+
+def run(conn, in_path, results_path, batch_size=500, update_profiles=False, dry_run=False):
+    importer = Importer(conn, detect_user_columns(conn), update_profiles=update_profiles, dry_run=dry_run)
+    counts = {}
+    total = 0
+    started = time.perf_counter()
+    with open(results_path, "w", encoding="utf-8", newline="") as out:
+        w = csv.DictWriter(out, fieldnames=RESULT_COLUMNS)
+        w.writeheader()
+        for batch in batched(read_rows(in_path), batch_size):
+            for res in importer.process(batch):
+                w.writerow(res)
+                counts[res["status"]] = counts.get(res["status"], 0) + 1
+            total += len(batch)
+            out.flush()
+            print(f"  {total} filas", file=sys.stderr)
+    return total, counts, time.perf_counter() - started
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Asigna public_code a usuarios desde una planilla CSV/JSONL.")
+    ap.add_argument("input", help="archivo .csv (con encabezado) o .jsonl")
+    ap.add_argument("--results", required=True, help="CSV de salida con el estado de cada fila")
+    ap.add_argument("--batch", type=int, default=500, help="filas por transacción (default 500)")
+    ap.add_argument("--update-profiles", action="store_true", help="pisar datos de perfil de usuarios existentes")
+    ap.add_argument("--dry-run", action="store_true", help="no confirma cambios (ROLLBACK por tanda)")
+    ap.add_argument("--url", help="MYSQL_PUBLIC_URL (si no, se usan QR_DB_* / MYSQL*)")
+    args = ap.parse_args(argv)
+
+    conn = connect(args.url)
+    try:
+        total, counts, elapsed = run(conn, args.input, args.results, batch_size=args.batch,
+                                     update_profiles=args.update_profiles, dry_run=args.dry_run)
+    finally:
+        conn.close()
+
+    rate = total / elapsed if elapsed > 0 else float("inf")
+    detail = ", ".join(f"{k}={v}" for k, v in sorted(counts.items()))
+    mode = " (dry-run, sin cambios)" if args.dry_run else ""
+    print(f"\nListo ✅ {total} filas en {elapsed:.1f}s ({rate:.0f} filas/s){mode}")
+    print(f"  {detail}")
+
+
+if __name__ == "__main__":
+    main()
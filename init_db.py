@@ -2,6 +2,8 @@ import mysql.connector
 from mysql.connector import Error
 from getpass import getpass
 
+from migrations import Db, migrate
+
 # >>> Conexión pública de Railway (según tu MYSQL_PUBLIC_URL):
 HOST = "shortline.proxy.rlwy.net"  # aparece en tu MYSQL_PUBLIC_URL
 PORT = 40635                       # aparece en tu MYSQL_PUBLIC_URL
@@ -9,41 +11,8 @@ USER = "root"                      # aparece en tu MYSQL_PUBLIC_URL
 DB   = "railway"                   # aparece en tu MYSQLPUBLIC_URL
 QR_CODE_DEMO = "QR001"
 
-DDL_AND_SEED = """
-CREATE TABLE IF NOT EXISTS users (
-  id INT AUTO_INCREMENT PRIMARY KEY,
-  email VARCHAR(190) UNIQUE NOT NULL,
-  password_hash VARCHAR(255) NOT NULL,
-  full_name VARCHAR(190),
-  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
-
-CREATE TABLE IF NOT EXISTS qr_codes (
-  id INT AUTO_INCREMENT PRIMARY KEY,
-  qr_code_string VARCHAR(190) UNIQUE NOT NULL,
-  user_id INT NOT NULL,
-  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-  FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-);
-
-CREATE TABLE IF NOT EXISTS emergency_data (
-  id INT AUTO_INCREMENT PRIMARY KEY,
-  user_id INT NOT NULL,
-  nombre VARCHAR(100) NOT NULL,
-  apellido VARCHAR(100) NOT NULL,
-  telefono_1 VARCHAR(40),
-  telefono_2 VARCHAR(40),
-  factor_sanguineo VARCHAR(10),
-  tiene_alergias BOOLEAN DEFAULT FALSE,
-  instructivo_url VARCHAR(255),
-  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-  FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-);
-
-INSERT INTO users (email, password_hash, full_name)
-VALUES ('demo@qr.com', 'hash-demo', 'Usuario Demo')
-ON DUPLICATE KEY UPDATE full_name=VALUES(full_name);
-"""
+# El esquema lo crean/actualizan las migraciones (migrations.py): es el mismo
+# que consulta app.py. Acá solo se cargan los datos demo.
 
 def main():
     print("Conexión a MySQL (Railway - proxy público)")
@@ -57,32 +26,29 @@ def main():
         cnx.autocommit = True
         cur = cnx.cursor()
 
-        print("→ Creando tablas y datos demo…")
-        for stmt in [s.strip() for s in DDL_AND_SEED.split(";\n") if s.strip()]:
-            cur.execute(stmt)
+        print("→ Migrando el esquema…")
+        migrate(Db(cnx, "mysql"))
 
-        # usuario demo
+        print("→ Cargando datos demo…")
+        cur.execute(
+            "INSERT INTO users (email, password_hash, nombre, apellido, grupo_sanguineo, contacto1, contacto2) "
+            "VALUES ('demo@qr.com', 'hash-demo', 'Juan', 'Pérez', '0+', '+5491100000001', '+5491100000002') "
+            "ON DUPLICATE KEY UPDATE email=email"
+        )
         cur.execute("SELECT id FROM users WHERE email=%s", ("demo@qr.com",))
         (uid,) = cur.fetchone()
 
-        # QR demo si no existe
-        cur.execute("INSERT IGNORE INTO qr_codes (qr_code_string, user_id) VALUES (%s, %s)", (QR_CODE_DEMO, uid))
-
-        # emergency_data si no existe
-        cur.execute("SELECT 1 FROM emergency_data WHERE user_id=%s", (uid,))
-        if cur.fetchone() is None:
-            cur.execute("""
-                INSERT INTO emergency_data
-                (user_id, nombre, apellido, telefono_1, telefono_2, factor_sanguineo, tiene_alergias, instructivo_url)
-                VALUES (%s, 'Juan', 'Pérez', '+5491100000001', '+5491100000002', '0+', FALSE,
-                        'https://www.cruzroja.org.ar/primeros-auxilios')
-            """, (uid,))
+        # QR demo (ya reclamado por el usuario demo) si no existe
+        cur.execute(
+            "INSERT IGNORE INTO qr_codes (public_code, user_id, claimed_at) VALUES (%s, %s, CURRENT_TIMESTAMP)",
+            (QR_CODE_DEMO, uid),
+        )
 
-        cur.execute("SELECT id, qr_code_string, user_id FROM qr_codes ORDER BY id")
+        cur.execute("SELECT id, public_code, user_id FROM qr_codes ORDER BY id")
         rows = cur.fetchall()
         print("\nQR codes existentes:")
         for r in rows:
-            print(f"  id={r[0]} | qr_code_string={r[1]} | user_id={r[2]}")
+            print(f"  id={r[0]} | public_code={r[1]} | user_id={r[2]}")
 
         if rows:
             first_id = rows[0][0]
@@ -1,9 +1,10 @@
 # link_qr.py
-import getpass
 import re
 import sys
 from urllib.parse import urlparse
-import mysql.connector
+
+from codes import random_code
+from storage import open_storage
 
 def parse_mysql_public_url(url: str):
     """
@@ -21,46 +22,16 @@ def parse_mysql_public_url(url: str):
     pwd  = u.password or ""
     return host, port, db, user, pwd
 
-def ensure_emergency_data(conn, user_id):
-    """
-    Si el usuario no tiene emergency_data, creamos una ficha básica.
-    Columnas esperadas (por tu app.py):
-      nombre, apellido, telefono_1, telefono_2, factor_sanguineo, tiene_alergias, instructivo_url, user_id
-    """
-    cur = conn.cursor()
-    cur.execute("SELECT 1 FROM emergency_data WHERE user_id=%s LIMIT 1", (user_id,))
-    has = cur.fetchone()
-    if not has:
-        cur.execute("""
-            INSERT INTO emergency_data
-            (nombre, apellido, telefono_1, telefono_2, factor_sanguineo, tiene_alergias, instructivo_url, user_id)
-            VALUES (%s,%s,%s,%s,%s,%s,%s,%s)
-        """, (
-            "Juan", "Pérez", "1122334455", "1199887766",
-            "0+", 0, "https://www.argentina.gob.ar/salud/primeros-auxilios",
-            user_id
-        ))
-        conn.commit()
-    cur.close()
-
-def create_and_link_qr(conn, user_id):
+def create_and_link_qr(store, email):
     """
-    Crea un nuevo registro en qr_codes para este user_id.
-    Usamos el próximo id (MAX(id)+1) y generamos un qr_code_string tipo 'QR###'.
-    Devuelve (new_id, qr_code_string).
+    Da de alta un public_code nuevo (con verificador, ver codes.py) y lo
+    reclama para el usuario, como /claim/<code>. El id lo asigna la base.
+    Devuelve (qr_id, public_code).
     """
-    cur = conn.cursor()
-    cur.execute("SELECT COALESCE(MAX(id),0) + 1 FROM qr_codes")
-    next_id = cur.fetchone()[0]
-    qr_string = f"QR{next_id:03d}"
-    # Insert con id explícito para que el /emergencia/<id> funcione directo
-    cur.execute(
-        "INSERT INTO qr_codes (id, qr_code_string, user_id) VALUES (%s,%s,%s)",
-        (next_id, qr_string, user_id)
-    )
-    conn.commit()
-    cur.close()
-    return next_id, qr_string
+    code = random_code()
+    store.insert_codes([code])
+    store.assign_codes([(code, email)])
+    return store.find_code(code)["id"], code
 
 def main():
     print("Pegá tu MYSQL_PUBLIC_URL (Railway → MySQL → Variables):")
@@ -77,30 +48,24 @@ def main():
         sys.exit(1)
 
     print(f"→ Conectando a {host}:{port} / db={db} user={user} …")
-    conn = mysql.connector.connect(host=host, port=port, user=user, password=pwd, database=db)
+    # Sin pool: cada consulta abre y cierra su conexión (autocommit, como en la app)
+    store = open_storage("mysql", lambda: store.open_connection(),
+                         host=host, port=port, user=user, password=pwd, database=db)
 
-    # Buscamos el usuario por email
-    cur = conn.cursor()
-    cur.execute("SELECT id FROM users WHERE email=%s LIMIT 1", (email,))
-    row = cur.fetchone()
+    # Buscamos el usuario por email (la ficha sale de sus datos en users: ver migrations.py)
+    row = store.find_login_user(email)
     if not row:
         print("Ese email no existe en la tabla users. Crealo primero con init_auth.py")
         sys.exit(1)
-    user_id = row[0]
-
-    # Aseguramos que tenga emergency_data
-    ensure_emergency_data(conn, user_id)
+    user_id = row["id"]
 
     # Creamos y vinculamos un QR
-    new_id, qr_string = create_and_link_qr(conn, user_id)
+    new_id, code = create_and_link_qr(store, email)
 
     print("\nListo ✅")
-    print(f"- Se creó y vinculó el QR id={new_id} (qr_code_string={qr_string}) al user_id={user_id}.")
+    print(f"- Se creó y vinculó el QR id={new_id} (public_code={code}) al user_id={user_id}.")
     print(f"- Probalo en tu panel: /panel")
     print(f"- Link público directo: /emergencia/{new_id}")
 
-    cur.close()
-    conn.close()
-
 if __name__ == "__main__":
     main()
@@ -0,0 +1,495 @@
+# loadtest.py
+"""
+Benchmark de carga del flujo escaneo -> ficha (y login / claim / panel).
+
+1) Sembrar datos en una base local (por defecto SQLite):
+     python loadtest.py seed --db bench.sqlite3 --users 2000 --claimed 5000 --unclaimed 5000
+
+2) Correr la carga. Levanta el servidor (gunicorn o waitress) contra esa base,
+   espera /health y mide:
+     python loadtest.py run --db bench.sqlite3 --server gunicorn --workers 2 --threads 4 \\
+         --concurrency 16 --duration 30 --out resultados.json
+   Tasa fija de llegadas en lugar de concurrencia fija:
+     python loadtest.py run --db bench.sqlite3 --rate 200 --duration 30 --out r.json
+   Contra un servidor ya levantado:
+     python loadtest.py run --db bench.sqlite3 --url http://127.0.0.1:8080 ...
+
+3) Comparar dos corridas (sale con código 1 si hay regresión):
+     python loadtest.py compare base.json nuevo.json --max-regression 0.10
+
+Mezcla de tráfico (--mix, pesos relativos):
+  scan   GET /v/<código reclamado> y luego GET /emergencia/<id> (el redirect)
+  claim  GET /claim/<código virgen> con sesión iniciada (consume códigos)
+  login  POST /login
+  panel  GET /panel con sesión iniciada
+
+Salida JSON: p50/p95/p99 (ms), throughput (ops/s) y tasa de error, total y por
+operación, más la configuración de la corrida. En modo --rate la latencia se
+mide desde el instante programado de cada llegada (no esconde la cola).
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode, urlparse
+
+from werkzeug.security import generate_password_hash
+
+from codes import unique_codes
+from db_pool import ConnectionPool
+from storage import open_storage
+
+BENCH_PASSWORD = "bench-pass"
+DEFAULT_MIX = "scan=80,claim=5,login=10,panel=5"
+
+
+# ---------- seed ----------
+def _storage(args):
+    """Backend según --db (SQLite) o, con --backend mysql, según QR_DB_*."""
+    holder = {}
+    store = open_storage(
+        args.backend,
+        lambda: holder["pool"].acquire(),
+        host=os.getenv("QR_DB_HOST", "127.0.0.1"),
+        port=int(os.getenv("QR_DB_PORT", "3306")),
+        user=os.getenv("QR_DB_USER", "root"),
+        password=os.getenv("QR_DB_PASSWORD", ""),
+        database=os.getenv("QR_DB_NAME", "railway"),
+        sqlite_path=args.db,
+    )
+    holder["pool"] = ConnectionPool(store.open_connection, size=1, pinger=store.ping)
+    return store
+
+
+def seed(args):
+    rnd = random.Random(args.seed)
+    store = _storage(args)
+    started = time.perf_counter()
+    pwd_hash = generate_password_hash(BENCH_PASSWORD)  # un solo hash, reutilizado
+
+    emails = [f"bench{i}@example.com" for i in range(args.users)]
+    for i in range(0, len(emails), 1000):
+        store.insert_users([(e, pwd_hash, f"Nombre{n}", f"Apellido{n}")
+                            for n, e in enumerate(emails[i:i + 1000], start=i)])
+
+    seen = set()
+    claimed = unique_codes(args.claimed, seen)
+    unclaimed = unique_codes(args.unclaimed, seen)
+    all_codes = claimed + unclaimed
+    for i in range(0, len(all_codes), 5000):
+        store.insert_codes(all_codes[i:i + 5000])
+    pairs = [(c, emails[rnd.randrange(len(emails))]) for c in claimed]
+    for i in range(0, len(pairs), 5000):
+        store.assign_codes(pairs[i:i + 5000])
+
+    manifest = {
+        "db": args.db,
+        "backend": args.backend,
+        "password": BENCH_PASSWORD,
+        "emails": emails,
+        "claimed": claimed,
+        "unclaimed": unclaimed,
+    }
+    with open(args.manifest or args.db + ".manifest.json", "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    print(f"Sembrado: {args.users} usuarios, {args.claimed} reclamados, {args.unclaimed} vírgenes "
+          f"en {time.perf_counter() - started:.1f}s")
+
+
+# ---------- cliente HTTP ----------
+class Client:
+    """Cliente HTTP/1.1 con keep-alive y una cookie de sesión (un cliente por thread)."""
+
+    def __init__(self, base_url, timeout=30):
+        u = urlparse(base_url)
+        self.host, self.port = u.hostname, u.port or 80
+        self.timeout = timeout
+        self.cookie = None
+        self._conn = None
+
+    def request(self, method, path, form=None):
+        body = urlencode(form) if form is not None else None
+        headers = {"Connection": "keep-alive"}
+        if body is not None:
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        if self.cookie:
+            headers["Cookie"] = self.cookie
+        for attempt in (1, 2):
+            if self._conn is None:
+                self._conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self._conn.request(method, path, body=body, headers=headers)
+                resp = self._conn.getresponse()
+                resp.read()
+                break
+            except (http.client.HTTPException, ConnectionError, OSError):
+                self._conn.close()
+                self._conn = None
+                if attempt == 2:
+                    raise
+        set_cookie = resp.getheader("Set-Cookie")
+        if set_cookie and set_cookie.startswith("session="):
+            self.cookie = set_cookie.split(";", 1)[0]
+        return resp.status, resp.getheader("Location")
+
+    def login(self, email, password):
+        return self.request("POST", "/login", {"email": email, "password": password, "next": "/panel"})
+
+
+# ---------- operaciones ----------
+class Workload:
+    def __init__(self, manifest, mix):
+        self.m = manifest
+        self.mix = mix
+        self._unclaimed = list(manifest["unclaimed"])
+        self._lock = threading.Lock()
+
+    def pick(self, rnd):
+        ops, weights = zip(*self.mix.items())
+        return rnd.choices(ops, weights)[0]
+
+    def _next_unclaimed(self):
+        with self._lock:
+            return self._unclaimed.pop() if self._unclaimed else None
+
+    def run_op(self, op, client, rnd):
+        """Devuelve True si la respuesta fue la esperada."""
+        if op == "scan":
+            code = rnd.choice(self.m["claimed"])
+            status, loc = client.request("GET", f"/v/{code}")
+            if status != 302 or not loc:
+                return False
+            status, _ = client.request("GET", urlparse(loc).path)
+            return status == 200
+        if op == "claim":
+            code = self._next_unclaimed()
+            if code is None:
+                return None  # sin códigos vírgenes: no cuenta
+            status, _ = client.request("GET", f"/claim/{code}")
+            return status == 302
+        if op == "login":
+            status, loc = client.login(rnd.choice(self.m["emails"]), self.m["password"])
+            return status == 302
+        if op == "panel":
+            status, _ = client.request("GET", "/panel")
+            return status == 200
+        raise ValueError(op)
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}   # op -> [latencias en seg.]
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def add(self, op, latency, ok):
+        with self._lock:
+            if ok:
+                self.samples.setdefault(op, []).append(latency)
+            else:
+                self.errors[op] = self.errors.get(op, 0) + 1
+
+
+def _percentile(sorted_vals, p):
+    if not sorted_vals:
+        return None
+    k = min(len(sorted_vals) - 1, max(0, int(round(p / 100.0 * len(sorted_vals) + 0.5)) - 1))
+    return sorted_vals[k]
+
+
+def _summary(latencies, errors, elapsed):
+    lat = sorted(latencies)
+    total = len(lat) + errors
+    return {
+        "count": total,
+        "errors": errors,
+        "error_rate": (errors / total) if total else 0.0,
+        "throughput": (total / elapsed) if elapsed else 0.0,
+        "p50_ms": _ms(_percentile(lat, 50)),
+        "p95_ms": _ms(_percentile(lat, 95)),
+        "p99_ms": _ms(_percentile(lat, 99)),
+        "max_ms": _ms(lat[-1] if lat else None),
+    }
+
+
+def _ms(v):
+    return None if v is None else round(v * 1000.0, 3)
+
+
+def _new_client(base_url, workload, rnd):
+    c = Client(base_url)
+    c.login(rnd.choice(workload.m["emails"]), workload.m["password"])
+    return c
+
+
+def _one(op, workload, client, rnd, rec, t0):
+    try:
+        ok = workload.run_op(op, client, rnd)
+    except Exception:
+        ok = False
+    if ok is not None:
+        rec.add(op, time.perf_counter() - t0, ok)
+
+
+def run_closed(base_url, workload, concurrency, duration, seed_):
+    """Concurrencia fija: N clientes en loop cerrado."""
+    rec = Recorder()
+    deadline = time.perf_counter() + duration
+
+    def worker(i):
+        rnd = random.Random(seed_ + i)
+        client = _new_client(base_url, workload, rnd)
+        while time.perf_counter() < deadline:
+            op = workload.pick(rnd)
+            _one(op, workload, client, rnd, rec, time.perf_counter())
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return rec, time.perf_counter() - started
+
+
+def run_open(base_url, workload, rate, duration, max_inflight, seed_):
+    """Tasa fija de llegadas (Poisson). La latencia se cuenta desde el instante programado."""
+    import queue
+    rec = Recorder()
+    jobs = queue.Queue()
+    rnd = random.Random(seed_)
+    ready = threading.Barrier(max_inflight + 1)
+
+    def worker(i):
+        wrnd = random.Random(seed_ + 1000 + i)
+        client = _new_client(base_url, workload, wrnd)
+        ready.wait()
+        while True:
+            job = jobs.get()
+            if job is None:
+                return
+            op, scheduled = job
+            _one(op, workload, client, wrnd, rec, scheduled)
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(max_inflight)]
+    for t in threads:
+        t.start()
+    ready.wait()  # los logins iniciales no entran en la medición
+    started = time.perf_counter()
+    t = started
+    end = started + duration
+    while True:
+        t += rnd.expovariate(rate)
+        if t >= end:
+            break
+        delay = t - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        jobs.put((workload.pick(rnd), t))
+    for _ in threads:
+        jobs.put(None)
+    for th in threads:
+        th.join()
+    return rec, time.perf_counter() - started
+
+
+# ---------- servidor ----------
+def start_server(args, port, tmp):
+    env = dict(os.environ)
+    env.update({
+        "PORT": str(port),
+        "QR_DB_BACKEND": args.backend,
+        "QR_DB_SQLITE_PATH": os.path.abspath(args.db),
+        "WEB_CONCURRENCY": str(args.workers),
+        "WEB_THREADS": str(args.threads),
+        "WEB_WORKER_CLASS": args.worker_class or ("gthread" if args.threads > 1 else "sync"),
+        "WEB_MAX_REQUESTS": str(args.max_requests),
+        "LOG_LEVEL": "warning",
+        # Sin --rate-limit los límites por IP/cuenta dejarían casi todo el login/claim en 429;
+        # la tabla es de esta corrida (la de /dev/shm arrastraría buckets de corridas anteriores)
+        "QR_RATE_LIMIT": "1" if args.rate_limit else "0",
+        "QR_RATE_LIMIT_PATH": os.path.join(tmp, "ratelimit.bin"),
+    })
+    here = os.path.dirname(os.path.abspath(__file__))
+    if args.server == "gunicorn":
+        cmd = [sys.executable, "-m", "gunicorn", "-c", "gunicorn_conf.py", "--access-logfile", "/dev/null", "app:app"]
+    else:
+        cmd = [sys.executable, "run_waitress.py"]
+    log = open(args.server_log, "ab") if args.server_log else subprocess.DEVNULL
+    proc = subprocess.Popen(cmd, cwd=here, env=env, stdout=log, stderr=log, start_new_session=True)
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"El servidor terminó al arrancar (código {proc.returncode})")
+        try:
+            status, _ = Client(base, timeout=2).request("GET", "/health")
+            if status == 200:
+                return proc, base
+        except OSError:
+            pass
+        time.sleep(0.2)
+    stop_server(proc)
+    raise SystemExit("El servidor no respondió /health en 60s")
+
+
+def stop_server(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+        proc.wait(timeout=30)
+    except Exception:
+        proc.kill()
+
+
+def _git_rev():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        op, _, w = part.partition("=")
+        op = op.strip()
+        if op not in ("scan", "claim", "login", "panel"):
+            raise SystemExit(f"Operación desconocida en --mix: {op}")
+        mix[op] = float(w or 1)
+    return {k: v for k, v in mix.items() if v > 0}
+
+
+def run(args):
+    with open(args.manifest or args.db + ".manifest.json", encoding="utf-8") as f:
+        manifest = json.load(f)
+    workload = Workload(manifest, parse_mix(args.mix))
+
+    proc = None
+    base = args.url
+    tmp = tempfile.TemporaryDirectory(prefix="qr-loadtest-")
+    if not base:
+        proc, base = start_server(args, args.port, tmp.name)
+    try:
+        if args.warmup:
+            run_closed(base, workload, min(args.concurrency, 4), args.warmup, args.seed + 99)
+        if args.rate:
+            rec, elapsed = run_open(base, workload, args.rate, args.duration, args.concurrency, args.seed)
+        else:
+            rec, elapsed = run_closed(base, workload, args.concurrency, args.duration, args.seed)
+    finally:
+        if proc is not None:
+            stop_server(proc)
+        tmp.cleanup()
+
+    all_lat = [x for v in rec.samples.values() for x in v]
+    result = {
+        "config": {
+            "git_rev": _git_rev(),
+            "server": "external" if args.url else args.server,
+            "workers": args.workers, "threads": args.threads,
+            "worker_class": args.worker_class,
+            "mode": "rate" if args.rate else "concurrency",
+            "rate": args.rate, "concurrency": args.concurrency,
+            "duration": args.duration, "mix": workload.mix,
+            "backend": args.backend,
+            "rate_limit": bool(args.rate_limit) if not args.url else None,
+        },
+        "total": _summary(all_lat, sum(rec.errors.values()), elapsed),
+        "ops": {op: _summary(rec.samples.get(op, []), rec.errors.get(op, 0), elapsed)
+                for op in workload.mix},
+    }
+    text = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+# ---------- comparación ----------
+def compare(args):
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+    failed = False
+    for scope in ["total"] + sorted(base.get("ops", {})):
+        b = base["total"] if scope == "total" else base["ops"].get(scope)
+        n = new["total"] if scope == "total" else new.get("ops", {}).get(scope)
+        if not b or not n:
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if b[key] and n[key] and n[key] > b[key] * (1 + args.max_regression):
+                print(f"REGRESIÓN {scope}.{key}: {b[key]} -> {n[key]} ms")
+                failed = True
+        if n["throughput"] < b["throughput"] * (1 - args.max_regression):
+            print(f"REGRESIÓN {scope}.throughput: {b['throughput']:.1f} -> {n['throughput']:.1f} ops/s")
+            failed = True
+        if n["error_rate"] > b["error_rate"] + args.max_error_increase:
+            print(f"REGRESIÓN {scope}.error_rate: {b['error_rate']:.4f} -> {n['error_rate']:.4f}")
+            failed = True
+    print("Sin regresiones ✅" if not failed else "Hay regresiones ❌")
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark de carga de QR Emergencias.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    def common(p):
+        p.add_argument("--db", default="bench.sqlite3", help="archivo SQLite (default bench.sqlite3)")
+        p.add_argument("--backend", choices=["sqlite", "mysql"], default="sqlite",
+                       help="mysql usa QR_DB_HOST/PORT/USER/PASSWORD/NAME")
+        p.add_argument("--manifest", help="default <db>.manifest.json")
+        p.add_argument("--seed", type=int, default=1)
+
+    p = sub.add_parser("seed", help="siembra usuarios y códigos")
+    common(p)
+    p.add_argument("--users", type=int, default=1000)
+    p.add_argument("--claimed", type=int, default=2000)
+    p.add_argument("--unclaimed", type=int, default=2000)
+
+    p = sub.add_parser("run", help="corre la carga")
+    common(p)
+    p.add_argument("--url", help="servidor ya levantado (si no, se levanta uno)")
+    p.add_argument("--server", choices=["gunicorn", "waitress"], default="gunicorn")
+    p.add_argument("--port", type=int, default=8099)
+    p.add_argument("--workers", type=int, default=1)
+    p.add_argument("--threads", type=int, default=1)
+    p.add_argument("--worker-class")
+    p.add_argument("--max-requests", type=int, default=0, help="0 = sin reciclar workers")
+    p.add_argument("--server-log", help="archivo para stdout/stderr del servidor (default: descartar)")
+    p.add_argument("--rate-limit", action="store_true",
+                   help="deja activos los límites de QR_RATE_LIMIT_RULES (default: apagados)")
+    p.add_argument("--concurrency", type=int, default=8, help="clientes (o máx. en vuelo con --rate)")
+    p.add_argument("--rate", type=float, help="llegadas por segundo (modo tasa fija)")
+    p.add_argument("--duration", type=float, default=20)
+    p.add_argument("--warmup", type=float, default=3, help="segundos de calentamiento sin medir")
+    p.add_argument("--mix", default=DEFAULT_MIX)
+    p.add_argument("--out", help="archivo JSON de resultados")
+
+    p = sub.add_parser("compare", help="compara dos resultados")
+    p.add_argument("base")
+    p.add_argument("new")
+    p.add_argument("--max-regression", type=float, default=0.10, help="fracción tolerada (default 0.10)")
+    p.add_argument("--max-error-increase", type=float, default=0.01)
+
+    args = ap.parse_args(argv)
+    if args.cmd == "seed":
+        seed(args)
+    elif args.cmd == "run":
+        run(args)
+    else:
+        sys.exit(compare(args))
+
+
+if __name__ == "__main__":
+    main()
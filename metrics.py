@@ -0,0 +1,347 @@
+# metrics.py
+"""
+Métricas en formato Prometheus, agregadas entre workers de gunicorn.
+
+Cada worker acumula contadores, histogramas y gauges en memoria y cada tanto
+(como mucho una vez por segundo, al terminar un request; si el worker queda
+ocioso, un thread de fondo vuelca lo pendiente) escribe una foto en
+<dir>/<pid>.json. /metrics (lo atienda el worker que sea) suma las fotos de
+todos los workers:
+- contadores e histogramas: se suman, incluidos los de workers que ya
+  murieron (max_requests los recicla seguido); las fotos de procesos muertos se
+  funden en archive.json para que el directorio no crezca.
+- gauges: solo de los workers vivos. Por defecto se suman (conexiones,
+  eventos en cola); los que no son aditivos se juntan según GAUGE_MERGE.
+
+El master de gunicorn (con preload) no vuelca: antes de forkear llama a
+release(), que borra su foto y no escribe más (sus gauges se sumarían a los
+de los workers).
+
+El directorio se vacía al arrancar el master (ver on_starting en gunicorn_conf.py).
+"""
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "qr_http_request_duration_seconds": ("histogram", "Latencia de requests por ruta"),
+    "qr_db_queries_total": ("counter", "Sentencias SQL ejecutadas"),
+    "qr_db_query_seconds_total": ("counter", "Tiempo total en sentencias SQL"),
+    "qr_db_budget_exceeded_total": ("counter", "Requests que pasaron su presupuesto de sentencias SQL (db_budget)"),
+    "qr_db_connections_opened_total": ("counter", "Conexiones nuevas abiertas contra la base"),
+    "qr_db_pool_wait_seconds_total": ("counter", "Tiempo esperando una conexión del pool"),
+    "qr_db_replica_reads_total": ("counter", "Requests que leyeron de una réplica"),
+    "qr_db_replica_fallback_total": ("counter", "Lecturas públicas que fueron a la primaria, por motivo"),
+    "qr_render_seconds_total": ("counter", "Tiempo renderizando templates"),
+    "qr_password_hash_seconds_total": ("counter", "Tiempo en hash/verificación de contraseñas"),
+    "qr_cache_hits_total": ("counter", "Hits de caches en memoria"),
+    "qr_cache_misses_total": ("counter", "Misses de caches en memoria"),
+    "qr_rate_limited_total": ("counter", "Requests rechazados con 429 por regla"),
+    "qr_public_code_checks_total": ("counter", "public_code verificados sin la base, por resultado (valid, legacy, invalid)"),
+    "qr_card_snapshot_served_total": ("counter", "Fichas servidas desde el snapshot (la base falló o circuito abierto)"),
+    "qr_scan_events_written_total": ("counter", "Escaneos escritos en scan_events"),
+    "qr_scan_events_dropped_total": ("counter", "Escaneos descartados por motivo (cola llena, error de la base)"),
+    "qr_db_pool_connections": ("gauge", "Conexiones del pool por estado"),
+    "qr_db_replica_up": ("gauge", "Réplica en rotación (1) o fuera (0)"),
+    "qr_db_breaker_state": ("gauge", "Circuit breaker de la base: 0 cerrado, 1 abierto, 2 probando"),
+    "qr_card_snapshot_cards": ("gauge", "Fichas en el snapshot en disco"),
+    "qr_scan_queue_events": ("gauge", "Escaneos esperando en la cola del worker"),
+    "qr_db_replica_lag_seconds": ("gauge", "Atraso de replicación en el último chequeo"),
+}
+
+
+# Gauges que no se suman entre workers: "max" / "min", o "pid" (una serie por worker, con label pid)
+GAUGE_MERGE = {
+    "qr_db_breaker_state": "pid",        # cada worker tiene su circuit breaker
+    "qr_card_snapshot_cards": "max",     # el snapshot es el mismo archivo para todos
+    "qr_db_replica_up": "min",           # en rotación solo si todos los workers la ven sana
+    "qr_db_replica_lag_seconds": "max",  # el peor atraso que vio algún worker
+}
+
+
+def default_dir():
+    return os.environ.get("QR_METRICS_DIR") or os.path.join(tempfile.gettempdir(), "qr_metrics")
+
+
+def clear_dir(directory=None):
+    """Borra las fotos de una corrida anterior (llamar en el master, antes de forkear)."""
+    directory = directory or default_dir()
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.endswith(".json"):
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+def _key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class Metrics:
+    def __init__(self, directory=None, buckets=DEFAULT_BUCKETS, flush_interval=1.0):
+        self.directory = directory or default_dir()
+        self.buckets = tuple(buckets)
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._collectors = []
+        self._released_pid = None
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._counters = {}   # (name, labels) -> valor
+        self._hist = {}       # (name, labels) -> [counts por bucket..., +Inf], sum
+        self._gauges = {}
+        self._last_flush = 0.0
+        self._dirty = False
+        self._flusher = None
+
+    def _check_fork(self):
+        # Un worker recién forkeado no hereda los números del master
+        if self._pid != os.getpid():
+            self._reset()
+        self._dirty = True
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        pid = self._pid
+        while pid == os.getpid() and pid != self._released_pid:
+            time.sleep(self.flush_interval)
+            if self._dirty:
+                try:
+                    self.flush()
+                except OSError:
+                    pass
+
+    # ---------- registro ----------
+    def inc(self, name, value=1.0, **labels):
+        k = (name, _key(labels))
+        with self._lock:
+            self._check_fork()
+            self._counters[k] = self._counters.get(k, 0.0) + value
+
+    def set_total(self, name, value, **labels):
+        """Fija un contador que el worker ya lleva acumulado (stats de caches, del pool)."""
+        k = (name, _key(labels))
+        with self._lock:
+            self._check_fork()
+            self._counters[k] = float(value)
+
+    def observe(self, name, value, **labels):
+        k = (name, _key(labels))
+        with self._lock:
+            self._check_fork()
+            h = self._hist.get(k)
+            if h is None:
+                h = self._hist[k] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts = h[0]
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            h[1] += value
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._check_fork()
+            self._gauges[(name, _key(labels))] = value
+
+    def add_collector(self, fn):
+        """fn() se llama antes de cada volcado (para copiar stats de caches, pool, etc.)."""
+        self._collectors.append(fn)
+
+    # ---------- volcado ----------
+    def maybe_flush(self):
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def release(self):
+        """Este proceso deja de volcar y borra su foto (master de gunicorn, antes de forkear)."""
+        with self._lock:
+            self._released_pid = os.getpid()
+        try:
+            os.remove(os.path.join(self.directory, f"{self._released_pid}.json"))
+        except OSError:
+            pass
+
+    def flush(self):
+        if self._released_pid == os.getpid():
+            return
+        for fn in self._collectors:
+            try:
+                fn(self)
+            except Exception:
+                pass
+        with self._lock:
+            self._check_fork()
+            self._dirty = False
+            self._last_flush = time.monotonic()
+            snap = {
+                "pid": self._pid,
+                "counters": [[n, list(l), v] for (n, l), v in self._counters.items()],
+                "hist": [[n, list(l), h[0], h[1]] for (n, l), h in self._hist.items()],
+                "gauges": [[n, list(l), v] for (n, l), v in self._gauges.items()],
+            }
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{self._pid}.json")
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(snap, f)
+        with self._lock:
+            if self._released_pid == os.getpid():
+                os.remove(tmp)      # release() llegó mientras escribíamos
+                return
+            os.replace(tmp, path)
+
+    # ---------- lectura / agregado ----------
+    def collect(self):
+        """Suma las fotos de todos los workers. Devuelve (counters, hist, gauges)."""
+        self.flush()
+        counters, hist, gauges = {}, {}, {}
+        with open(os.path.join(self.directory, "metrics.lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._archive_dead()
+            for name in os.listdir(self.directory):
+                if not name.endswith(".json"):
+                    continue
+                try:
+                    with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                        snap = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                _merge(snap, counters, hist)
+                if name != "archive.json":
+                    for n, l, v in snap.get("gauges", []):
+                        _merge_gauge(gauges, n, tuple(tuple(x) for x in l), v, snap.get("pid"))
+        return counters, hist, gauges
+
+    def _archive_dead(self):
+        archive_path = os.path.join(self.directory, "archive.json")
+        dead = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json") or name == "archive.json":
+                continue
+            try:
+                pid = int(name[:-5])
+            except ValueError:
+                continue
+            if not _alive(pid):
+                dead.append(os.path.join(self.directory, name))
+        if not dead:
+            return
+        counters, hist = {}, {}
+        for path in [archive_path] + dead:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    _merge(json.load(f), counters, hist)
+            except (OSError, ValueError):
+                pass
+        snap = {
+            "counters": [[n, [list(x) for x in l], v] for (n, l), v in counters.items()],
+            "hist": [[n, [list(x) for x in l], h[0], h[1]] for (n, l), h in hist.items()],
+        }
+        tmp = archive_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(snap, f)
+        os.replace(tmp, archive_path)
+        for path in dead:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def render(self):
+        """Texto en formato de exposición de Prometheus."""
+        counters, hist, gauges = self.collect()
+        lines = []
+        seen = set()
+
+        def header(name):
+            if name in seen:
+                return
+            seen.add(name)
+            kind, text = HELP.get(name, ("untyped", name))
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), v in sorted(counters.items()):
+            header(name)
+            lines.append(f"{name}{_fmt_labels(labels)} {_num(v)}")
+        for (name, labels), (counts, total) in sorted(hist.items()):
+            header(name)
+            acc = 0
+            for b, c in zip(self.buckets, counts):
+                acc += c
+                lines.append(f"{name}_bucket{_fmt_labels(labels + (('le', _num(b)),))} {acc}")
+            acc += counts[-1]
+            lines.append(f"{name}_bucket{_fmt_labels(labels + (('le', '+Inf'),))} {acc}")
+            lines.append(f"{name}_sum{_fmt_labels(labels)} {_num(total)}")
+            lines.append(f"{name}_count{_fmt_labels(labels)} {acc}")
+        for (name, labels), v in sorted(gauges.items()):
+            header(name)
+            lines.append(f"{name}{_fmt_labels(labels)} {_num(v)}")
+        return "\n".join(lines) + "\n"
+
+
+def _merge(snap, counters, hist):
+    for n, l, v in snap.get("counters", []):
+        k = (n, tuple(tuple(x) for x in l))
+        counters[k] = counters.get(k, 0.0) + v
+    for n, l, counts, total in snap.get("hist", []):
+        k = (n, tuple(tuple(x) for x in l))
+        h = hist.get(k)
+        if h is None:
+            hist[k] = [list(counts), total]
+        else:
+            h[0] = [a + b for a, b in zip(h[0], counts)]
+            h[1] += total
+
+
+def _merge_gauge(gauges, name, labels, v, pid):
+    how = GAUGE_MERGE.get(name, "sum")
+    if how == "pid":
+        gauges[(name, labels + (("pid", str(pid)),))] = v
+        return
+    k = (name, labels)
+    if k not in gauges:
+        gauges[k] = v
+    elif how == "max":
+        gauges[k] = max(gauges[k], v)
+    elif how == "min":
+        gauges[k] = min(gauges[k], v)
+    else:
+        gauges[k] += v
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _fmt_labels(labels):
+    if not labels:
+        return ""
+    inner = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in labels)
+    return "{" + inner + "}"
+
+
+def _num(v):
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return repr(v)
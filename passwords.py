@@ -0,0 +1,126 @@
+# passwords.py
+"""
+Hash y verificación de contraseñas fuera del thread del request.
+
+scrypt (el default de Werkzeug) tarda decenas de ms de CPU y usa ~32 MB por
+hash. Con el perfil por defecto de gunicorn (1 worker sync, 1 thread), unos
+pocos logins simultáneos frenaban todos los escaneos de /emergencia que
+venían atrás. Acá el hash corre en un pool de procesos acotado:
+
+- como mucho `workers` hashes en paralelo y `queue` esperando; si no hay
+  lugar -> HashBusy (la ruta contesta 503 con Retry-After);
+- si el resultado no llega en `timeout` seg. -> HashTimeout; ese hash sigue
+  ocupando su lugar hasta que termina (el proceso del pool no se puede cortar);
+- workers=0: se hashea en el mismo thread (desarrollo, benchmarks).
+
+El método es configurable (QR_PASSWORD_METHOD, p.ej. "scrypt:16384:8:1" o
+"pbkdf2:sha256:600000"); needs_rehash() avisa cuando un hash guardado
+quedó con otros parámetros, para rehashear en el próximo login.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+
+class HashBusy(Exception):
+    """No hay lugar en el pool de hashing (demasiados logins a la vez)."""
+
+
+class HashTimeout(Exception):
+    """El hash no terminó dentro del timeout."""
+
+
+def normalize_method(method):
+    """'scrypt' -> 'scrypt:32768:8:1', 'pbkdf2' -> 'pbkdf2:sha256:<default>' (como los guarda Werkzeug)."""
+    name, *args = method.split(":")
+    if name == "scrypt":
+        n, r, p = args if args else (2**15, 8, 1)
+        return f"scrypt:{int(n)}:{int(r)}:{int(p)}"
+    if name == "pbkdf2":
+        hash_name = args[0] if args else "sha256"
+        iterations = int(args[1]) if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f"pbkdf2:{hash_name}:{iterations}"
+    raise ValueError(f"Método de hash desconocido: {method!r} (scrypt o pbkdf2)")
+
+
+# Funciones que corren en los procesos del pool (tienen que ser de módulo)
+def _hash(password, method):
+    return generate_password_hash(password, method=method)
+
+
+def _verify(pwhash, password):
+    return check_password_hash(pwhash, password)
+
+
+def _mp_context():
+    # forkserver: los procesos del pool no heredan threads ni sockets del worker
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+class PasswordHasher:
+    def __init__(self, method="scrypt", workers=1, queue=8, timeout=10.0):
+        self.method = normalize_method(method)
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + queue) if workers else None
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    # ---------- API ----------
+    def hash(self, password):
+        return self._run(_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        return self._run(_verify, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        method = (pwhash or "").split("$", 1)[0]
+        try:
+            return normalize_method(method) != self.method
+        except ValueError:
+            return True
+
+    def shutdown(self):
+        pool, self._pool = self._pool, None
+        if pool is not None and self._pid == os.getpid():
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    # ---------- internos ----------
+    def _executor(self):
+        # Un pool por proceso: si gunicorn forkeó, el del padre no sirve
+        if self._pool is None or self._pid != os.getpid():
+            with self._lock:
+                if self._pool is None or self._pid != os.getpid():
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=_mp_context())
+                    self._pid = os.getpid()
+        return self._pool
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            raise HashBusy("pool de hashing lleno")
+        try:
+            future = self._executor().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # El lugar se libera cuando el hash termina de verdad: uno que ya pasó el
+        # timeout sigue ocupando un proceso del pool (cancel() no corta uno en curso)
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise HashTimeout(f"hash de contraseña > {self.timeout}s") from None
+        except BrokenProcessPool:
+            # Murió un proceso del pool (p.ej. OOM): se arma uno nuevo en el próximo hash
+            self._pool = None
+            raise HashBusy("pool de hashing reiniciado") from None
@@ -0,0 +1,71 @@
+# profiles.py
+"""
+Perfiles de ejecución con nombre, compartidos por gunicorn_conf.py y
+run_waitress.py. Se elige con WEB_PROFILE (default "sync"):
+
+    sync     1 worker, 1 thread, preload. El más liviano (Railway chico).
+    gthread  1 worker, 4 threads, preload. Los escaneos no esperan detrás de un
+             login o de una consulta lenta.
+    gevent   1 worker, 100 conexiones con greenlets. Sin preload: gevent tiene que
+             parchear threading/socket ANTES de importar la app. Requiere `gevent`
+             instalado; si no está se usa gthread.
+
+WEB_CONCURRENCY, WEB_THREADS, WEB_WORKER_CLASS, WEB_WORKER_CONNECTIONS y
+WEB_PRELOAD (0/1) pisan lo que diga el perfil. apply_env() deja el pool de la
+base y el warm-up de conexiones acordes a los threads (si no vienen ya en el
+entorno); hay que llamarlo antes de importar app.
+"""
+import importlib.util
+import os
+
+PROFILES = {
+    "sync": {"worker_class": "sync", "workers": 1, "threads": 1, "worker_connections": 1000, "preload_app": True},
+    "gthread": {"worker_class": "gthread", "workers": 1, "threads": 4, "worker_connections": 1000, "preload_app": True},
+    "gevent": {"worker_class": "gevent", "workers": 1, "threads": 1, "worker_connections": 100, "preload_app": False},
+}
+
+DEFAULT_PROFILE = "sync"
+
+
+def get_profile(name=None):
+    """Perfil resuelto (dict nuevo) con los overrides WEB_* aplicados."""
+    name = (name or os.getenv("WEB_PROFILE") or DEFAULT_PROFILE).strip().lower()
+    if name not in PROFILES:
+        print(f"[WARN] WEB_PROFILE={name!r} desconocido; uso {DEFAULT_PROFILE!r} ({', '.join(PROFILES)})")
+        name = DEFAULT_PROFILE
+    if name == "gevent" and importlib.util.find_spec("gevent") is None:
+        print("[WARN] WEB_PROFILE=gevent pero gevent no está instalado; uso 'gthread'")
+        name = "gthread"
+
+    prof = dict(PROFILES[name], name=name)
+    overrides = (
+        ("workers", "WEB_CONCURRENCY", int),
+        ("threads", "WEB_THREADS", int),
+        ("worker_class", "WEB_WORKER_CLASS", str),
+        ("worker_connections", "WEB_WORKER_CONNECTIONS", int),
+        ("preload_app", "WEB_PRELOAD", lambda v: v != "0"),
+    )
+    for key, env, conv in overrides:
+        v = os.getenv(env)
+        if v:
+            prof[key] = conv(v)
+    return prof
+
+
+def concurrency(prof):
+    """Requests simultáneos que puede atender un worker con este perfil."""
+    if prof["worker_class"] == "gevent":
+        return prof["worker_connections"]
+    return max(1, prof["threads"])
+
+
+def apply_env(prof):
+    """
+    Pool de la base y warm-up de conexiones según la concurrencia del perfil,
+    sin pisar lo que ya venga configurado. Con gevent el pool queda acotado:
+    cien greenlets no necesitan cien conexiones (esperan su turno en el pool).
+    """
+    n = concurrency(prof)
+    os.environ.setdefault("QR_DB_POOL_SIZE", str(min(n + 1, 10)))
+    os.environ.setdefault("QR_WARM_CONNECTIONS", str(min(n, 4)))
+    return prof
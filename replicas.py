@@ -0,0 +1,136 @@
+# replicas.py
+"""
+Réplicas de lectura para las consultas públicas (ficha de emergencia, /v).
+
+Cada réplica tiene su propio ConnectionPool (db_pool.py) y se reparten en
+round-robin entre las que están sanas. Un thread por worker las revisa cada
+`check_every` seg.: ping + atraso de replicación (storage.replica_lag). Queda
+fuera la que no responde, la que tiene la replicación cortada o la que va más
+de `max_lag` seg. atrasada, hasta el próximo chequeo bueno. Sin réplicas sanas
+acquire() devuelve (None, None) y el que llama lee de la primaria.
+
+Arrancan como "no sanas": hasta el primer chequeo (check(), lo hace el
+warm-up) todo va a la primaria.
+"""
+import itertools
+import os
+import threading
+import time
+
+from db_pool import ConnectionPool, PoolTimeout
+
+
+class Replica:
+    __slots__ = ("name", "store", "pool", "healthy", "lag", "error", "checked_at")
+
+    def __init__(self, name, store, pool):
+        self.name = name
+        self.store = store
+        self.pool = pool
+        self.healthy = False
+        self.lag = None           # seg. de atraso en el último chequeo
+        self.error = None         # motivo por el que quedó fuera
+        self.checked_at = 0.0     # time.time() del último chequeo
+
+
+class ReplicaSet:
+    def __init__(self, stores, pool_size=5, pool_timeout=1.0, recycle=1800.0,
+                 ping_after=30.0, max_lag=5.0, check_every=5.0):
+        """stores: [(nombre, Storage de la réplica)] (ver storage.open_replica)."""
+        self.replicas = [
+            Replica(name, store, ConnectionPool(
+                store.open_connection, size=pool_size, timeout=pool_timeout,
+                recycle=recycle, ping_after=ping_after, pinger=store.ping))
+            for name, store in stores
+        ]
+        self.max_lag = max_lag
+        self.check_every = check_every
+        self._rr = itertools.count()
+        self._lock = threading.Lock()
+        self._checker_pid = None
+
+    # ---------- API pública ----------
+    def acquire(self):
+        """
+        (Replica, PooledConnection pinned) de la próxima réplica sana, o
+        (None, None) si no hay ninguna disponible.
+        """
+        self._ensure_checker()
+        healthy = [r for r in self.replicas if r.healthy]
+        if not healthy:
+            return None, None
+        start = next(self._rr)
+        for i in range(len(healthy)):
+            r = healthy[(start + i) % len(healthy)]
+            try:
+                return r, r.pool.acquire(pinned=True)
+            except PoolTimeout:
+                continue        # llena: probamos la siguiente
+            except Exception as e:
+                self.mark_down(r, e)
+        return None, None
+
+    def mark_down(self, replica, error):
+        """Saca la réplica de la rotación hasta el próximo chequeo bueno."""
+        if replica.healthy:
+            print(f"[WARN] Réplica {replica.name} fuera de rotación: {error}")
+        replica.healthy = False
+        replica.error = str(error)
+
+    def check(self):
+        """Revisa todas las réplicas ahora (en este thread). Devuelve cuántas quedaron sanas."""
+        for r in self.replicas:
+            self._check_one(r)
+        return sum(1 for r in self.replicas if r.healthy)
+
+    def dispose(self):
+        for r in self.replicas:
+            r.pool.dispose()
+
+    def stats(self):
+        return [{"name": r.name, "healthy": r.healthy, "lag": r.lag, "error": r.error,
+                 "checked_at": r.checked_at} for r in self.replicas]
+
+    # ---------- internos ----------
+    def _check_one(self, r):
+        try:
+            conn = r.pool.acquire()
+        except Exception as e:
+            r.lag, r.checked_at = None, time.time()
+            self.mark_down(r, e)
+            return
+        try:
+            lag = r.store.replica_lag(conn)
+        except Exception as e:
+            conn.discard()
+            r.lag, r.checked_at = None, time.time()
+            self.mark_down(r, e)
+            return
+        conn.release()
+        r.lag, r.checked_at = lag, time.time()
+        if lag > self.max_lag:
+            self.mark_down(r, f"atrasada {lag:.0f} s (máx. {self.max_lag:.0f})")
+            return
+        if not r.healthy:
+            print(f"[INFO] Réplica {r.name} en rotación (atraso {lag:.0f} s)")
+        r.healthy = True
+        r.error = None
+
+    def _ensure_checker(self):
+        # Un thread por proceso: los de un master con preload no sobreviven al fork
+        pid = os.getpid()
+        if self._checker_pid == pid:
+            return
+        with self._lock:
+            if self._checker_pid == pid:
+                return
+            self._checker_pid = pid
+            threading.Thread(target=self._loop, args=(pid,), name="qr-replica-check", daemon=True).start()
+
+    def _loop(self, pid):
+        while self._checker_pid == pid:
+            time.sleep(self.check_every)
+            try:
+                self.check()
+            except Exception as e:
+                print(f"[WARN] Chequeo de réplicas: {e}")
@@ -1,5 +1,27 @@
-from waitress import serve
-from app import app
+import os
 
-serve(app, host="0.0.0.0", port=5000)
+import profiles
 
+# Mismos perfiles que gunicorn (WEB_PROFILE); waitress es un solo proceso con
+# threads, así que solo se toma la cantidad de threads. Hay que ajustar el
+# entorno antes de importar la app (tamaño del pool, warm-up de conexiones).
+_profile = profiles.get_profile()
+if _profile["worker_class"] == "gevent":
+    print("[WARN] waitress no usa gevent; perfil gevent -> threads de gthread")
+    _profile = profiles.get_profile("gthread")
+if not os.getenv("WEB_THREADS") and _profile["name"] == "sync" and not os.getenv("WEB_PROFILE"):
+    _profile["threads"] = 4   # sin perfil explícito: el default de waitress, como antes
+profiles.apply_env(_profile)
+
+# Guard: los procesos del pool de hashing (passwords.py) re-importan __main__; la app
+# (y su warm-up: conexiones, índice de códigos, snapshot) se importa solo en el proceso principal
+if __name__ == "__main__":
+    from waitress import serve
+    from app import app   # importar la app hace el warm-up (ver app.warm_up y /ready)
+
+    serve(
+        app,
+        host="0.0.0.0",
+        port=int(os.getenv("PORT", "5000")),
+        threads=_profile["threads"],
+    )
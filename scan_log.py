@@ -0,0 +1,134 @@
+# scan_log.py
+"""
+Registro de escaneos (/v y /emergencia) sin tocar la base en el request.
+
+El request solo agrega el evento a una cola en memoria (por worker, acotada
+a `maxsize`). Un thread de fondo la vacía con inserts de varias filas cada
+`batch` eventos o cada `interval` seg., lo que pase primero:
+
+- cola llena: el evento se descarta y se cuenta (dropped["full"]); el request
+  nunca espera a la base por esto;
+- la base falla: el lote vuelve al principio de la cola (lo que no entra se
+  cuenta en dropped["error"]) y se reintenta con espera creciente, hasta 30 s;
+- al terminar el worker (atexit / worker_exit de gunicorn) flush() escribe lo
+  pendiente.
+
+`write(events)` hace la escritura (en la app: Storage.insert_scans). Cada
+evento es una tupla (qr_id, public_code, scanned_at, ua_class, status, kind).
+"""
+import os
+import re
+import threading
+from collections import deque
+
+SCAN, VIEW = "scan", "view"     # kind: escaneo de la etiqueta (/v) o ficha mostrada (/emergencia)
+
+_BOT = re.compile(r"bot|crawl|spider|slurp|preview|facebookexternalhit|whatsapp|telegram|slack|discord", re.I)
+_SCRIPT = re.compile(r"curl|wget|python|go-http|okhttp|java/|libwww|httpclient|node-fetch|axios", re.I)
+_MOBILE = re.compile(r"mobi|android|iphone|ipad|ipod", re.I)
+
+
+def ua_class(user_agent):
+    """User-Agent -> bot | script | mobile | desktop | unknown (no se guarda el UA completo)."""
+    if not user_agent:
+        return "unknown"
+    if _BOT.search(user_agent):
+        return "bot"
+    if _SCRIPT.search(user_agent):
+        return "script"
+    if _MOBILE.search(user_agent):
+        return "mobile"
+    return "desktop"
+
+
+class ScanLog:
+    MAX_BACKOFF = 30.0
+
+    def __init__(self, write, maxsize=10000, batch=200, interval=1.0):
+        self._write = write
+        self.maxsize = maxsize
+        self.batch = batch
+        self.interval = interval
+        self._cond = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._queue = deque()
+        self._flusher = None
+        self._failures = 0
+        self.written = 0
+        self.batches = 0
+        self.dropped = {"full": 0, "error": 0}
+
+    def _check_fork(self):
+        # Un worker recién forkeado arranca con la cola vacía y su propio thread
+        if self._pid != os.getpid():
+            self._reset()
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, name="scan-log-flush", daemon=True)
+            self._flusher.start()
+
+    # ---------- request ----------
+    def record(self, event):
+        """Encola el evento; False si la cola está llena (se descarta)."""
+        with self._cond:
+            self._check_fork()
+            if len(self._queue) >= self.maxsize:
+                self.dropped["full"] += 1
+                return False
+            self._queue.append(event)
+            if len(self._queue) >= self.batch:
+                self._cond.notify()
+        return True
+
+    # ---------- escritura ----------
+    def _take(self):
+        n = min(self.batch, len(self._queue))
+        return [self._queue.popleft() for _ in range(n)]
+
+    def _write_batch(self, events):
+        try:
+            self._write(events)
+        except Exception as e:
+            with self._cond:
+                room = self.maxsize - len(self._queue)
+                self._queue.extendleft(reversed(events[:room]))
+                self.dropped["error"] += max(0, len(events) - room)
+                self._failures += 1
+            if self._failures == 1:
+                print(f"[WARN] Registro de escaneos: no se pudo escribir un lote de {len(events)}: {e}")
+            return False
+        with self._cond:
+            self.written += len(events)
+            self.batches += 1
+            self._failures = 0
+        return True
+
+    def _flush_loop(self):
+        pid = self._pid
+        while pid == os.getpid():
+            with self._cond:
+                wait = min(self.interval * 2 ** self._failures, self.MAX_BACKOFF) if self._failures else self.interval
+                if len(self._queue) < self.batch or self._failures:
+                    self._cond.wait(wait)
+                events = self._take()
+            # Lotes llenos seguidos mientras haya; uno parcial por intervalo
+            while events and self._write_batch(events):
+                with self._cond:
+                    events = self._take() if len(self._queue) >= self.batch else []
+
+    def flush(self):
+        """Escribe todo lo pendiente en este thread (fin del worker). Devuelve cuántos quedaron sin escribir."""
+        if self._pid != os.getpid():
+            return 0
+        while True:
+            with self._cond:
+                events = self._take()
+            if not events or not self._write_batch(events):
+                break
+        return len(self._queue)
+
+    def stats(self):
+        return {"queued": len(self._queue), "written": self.written, "batches": self.batches,
+                "dropped": dict(self.dropped)}
@@ -0,0 +1,119 @@
+# schema.py
+"""
+Definición única del esquema que usa app.py, para MySQL y SQLite.
+
+Cada columna se describe con un tipo lógico; render_ddl() lo traduce al
+dialecto. Así el backend SQLite local (y los benchmarks) usan exactamente las
+mismas tablas, columnas e índices que producción.
+"""
+from collections import namedtuple
+
+Column = namedtuple("Column", "name type null default extra")
+Index = namedtuple("Index", "name table columns unique")
+
+
+def col(name, type_, null=True, default=None, extra=""):
+    return Column(name, type_, null, default, extra)
+
+
+# tipo lógico -> (MySQL, SQLite)
+TYPES = {
+    "pk": ("INT AUTO_INCREMENT PRIMARY KEY", "INTEGER PRIMARY KEY AUTOINCREMENT"),
+    "int": ("INT", "INTEGER"),
+    "timestamp": ("DATETIME", "TIMESTAMP"),
+    # SQLite no tiene ON UPDATE: ahí quien modifica el perfil setea updated_at
+    "updated_ts": ("DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP", "TIMESTAMP DEFAULT CURRENT_TIMESTAMP"),
+}
+
+
+def _type(type_, dialect):
+    if type_ in TYPES:
+        return TYPES[type_][0 if dialect == "mysql" else 1]
+    # varchar(N) y similares son iguales en los dos
+    return type_.upper()
+
+
+TABLES = {
+    "users": [
+        col("id", "pk"),
+        col("email", "varchar(190)", null=False),
+        col("password_hash", "varchar(255)", null=False, default="''"),
+        col("nombre", "varchar(100)"),
+        col("apellido", "varchar(100)"),
+        col("grupo_sanguineo", "varchar(10)"),
+        col("alergias", "varchar(255)"),
+        col("contacto1", "varchar(40)"),
+        col("contacto2", "varchar(40)"),
+        col("created_at", "timestamp", default="CURRENT_TIMESTAMP"),
+        col("updated_at", "updated_ts"),
+    ],
+    "qr_codes": [
+        col("id", "pk"),
+        col("public_code", "varchar(64)", null=False),
+        col("user_id", "int", extra="REFERENCES users(id)"),
+        col("claimed_at", "timestamp"),
+        col("created_at", "timestamp", default="CURRENT_TIMESTAMP"),
+    ],
+    # Escaneos (ver scan_log.py): los escribe un thread de fondo en lotes, nunca el request.
+    # qr_id NULL = código inexistente en /v (public_code guarda lo que se probó)
+    "scan_events": [
+        col("id", "pk"),
+        col("qr_id", "int"),
+        col("public_code", "varchar(64)"),
+        col("scanned_at", "timestamp", null=False),
+        col("ua_class", "varchar(10)", null=False),
+        col("status", "int", null=False),
+        col("kind", "varchar(10)", null=False),
+    ],
+    # Totales por etiqueta (los lee /panel): se suman en el mismo lote que scan_events
+    "scan_counts": [
+        col("qr_id", "int", null=False, extra="PRIMARY KEY"),
+        col("scans", "int", null=False, default="0"),
+        col("views", "int", null=False, default="0"),
+        col("last_at", "timestamp"),
+    ],
+}
+
+INDEXES = [
+    Index("ux_users_email", "users", ("email",), True),
+    Index("ux_qr_codes_public_code", "qr_codes", ("public_code",), True),
+    # Listado paginado del panel (WHERE user_id=? AND id < ? ORDER BY id DESC);
+    # también cubre las búsquedas por user_id solo y la FK
+    Index("ix_qr_codes_user_id_id", "qr_codes", ("user_id", "id"), False),
+    # Delta del índice de códigos (codes_since): reclamados desde la última pasada
+    Index("ix_qr_codes_claimed_at", "qr_codes", ("claimed_at",), False),
+    # Delta del snapshot de fichas (cards_since): perfiles editados desde la última pasada
+    Index("ix_users_updated_at", "users", ("updated_at",), False),
+    # Historial de escaneos de una etiqueta (abuso, "escanearon tu QR")
+    Index("ix_scan_events_qr_id_scanned_at", "scan_events", ("qr_id", "scanned_at"), False),
+]
+
+
+def column_ddl(c, dialect):
+    parts = [c.name, _type(c.type, dialect)]
+    if c.type != "pk":
+        parts.append("NULL" if c.null else "NOT NULL")
+    if c.default is not None:
+        parts.append(f"DEFAULT {c.default}")
+    if c.extra:
+        parts.append(c.extra)
+    return " ".join(parts)
+
+
+def index_ddl(ix, dialect):
+    unique = "UNIQUE " if ix.unique else ""
+    cols = ", ".join(ix.columns)
+    if dialect == "sqlite":
+        return f"CREATE {unique}INDEX IF NOT EXISTS {ix.name} ON {ix.table} ({cols})"
+    return f"CREATE {unique}INDEX {ix.name} ON {ix.table} ({cols})"
+
+
+def render_ddl(dialect):
+    """Sentencias CREATE TABLE / CREATE INDEX para una base vacía."""
+    stmts = []
+    for table, cols in TABLES.items():
+        body = ",\n  ".join(column_ddl(c, dialect) for c in cols)
+        stmts.append(f"CREATE TABLE IF NOT EXISTS {table} (\n  {body}\n)")
+    for ix in INDEXES:
+        stmts.append(index_ddl(ix, dialect))
+    return stmts
@@ -0,0 +1,547 @@
+# storage.py
+"""
+Capa de acceso a datos de la app.
+
+Las rutas no escriben SQL: llaman a las operaciones de acá (buscar código,
+reclamar, cargar ficha, cargar usuario, listar QRs, crear usuario, ...).
+Hay dos implementaciones con el mismo SQL (parámetros %s; SQLite los pasa a ?):
+
+- MySQLStorage: producción (Railway).
+- SQLiteStorage: base embebida en un archivo, para correr la app, los
+  benchmarks y el profiling en una sola máquina sin red.
+
+Se elige con QR_DB_BACKEND=mysql|sqlite (ver app.py). El esquema sale de schema.py.
+
+Las conexiones las da `get_conn` (en la app, get_db(): pool + una por request);
+open_connection() es la fábrica que usa el pool.
+"""
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+from schema import render_ddl
+from user_queries import build_colmap, compile_user_queries, insert_user_params
+
+
+@lru_cache(maxsize=256)
+def _qmark(sql):
+    return sql.replace("%s", "?")
+
+
+class Storage:
+    dialect = None
+
+    def __init__(self, get_conn):
+        self._get_conn = get_conn
+        self._queries = None
+        self._queries_lock = threading.Lock()
+        # scan_counts existe (migración 6): el panel le suma los escaneos a cada QR
+        self.has_scan_counts = False
+        # on_query(sql, segundos): se llama después de cada sentencia (métricas, presupuestos)
+        self.on_query = None
+
+    # ---------- a implementar por cada backend ----------
+    def open_connection(self):
+        raise NotImplementedError
+
+    def ping(self, raw):
+        raise NotImplementedError
+
+    def is_disconnect_error(self, exc):
+        return False
+
+    def is_db_error(self, exc):
+        """Error del driver (red, servidor, SQL): lo que un fallback puede tapar."""
+        return False
+
+    def _user_columns(self, conn):
+        raise NotImplementedError
+
+    def _has_table(self, conn, table):
+        raise NotImplementedError
+
+    def _sql(self, sql):
+        return sql
+
+    def _dict_cursor(self, conn):
+        raise NotImplementedError
+
+    # ---------- helpers ----------
+    def _run(self, cur, sql, params=(), many=False):
+        t0 = time.perf_counter()
+        try:
+            if many:
+                cur.executemany(sql, params)
+            else:
+                cur.execute(sql, params)
+        finally:
+            if self.on_query is not None:
+                self.on_query(sql, time.perf_counter() - t0)
+
+    def _fetch(self, sql, params=(), one=False, dictionary=True):
+        conn = self._get_conn()
+        cur = self._dict_cursor(conn) if dictionary else conn.cursor()
+        try:
+            self._run(cur, self._sql(sql), params)
+            if one:
+                row = cur.fetchone()
+                return self._row(row) if dictionary else row
+            rows = cur.fetchall()
+            return [self._row(r) for r in rows] if dictionary else rows
+        finally:
+            cur.close()
+            conn.close()
+
+    def _execute(self, sql, params=()):
+        """Ejecuta un INSERT/UPDATE; devuelve (rowcount, lastrowid)."""
+        conn = self._get_conn()
+        cur = conn.cursor()
+        try:
+            self._run(cur, self._sql(sql), params)
+            return cur.rowcount, cur.lastrowid
+        finally:
+            cur.close()
+            conn.close()
+
+    def _row(self, row):
+        return row
+
+    # ---------- esquema de users ----------
+    @property
+    def queries(self):
+        """Consultas de users compiladas (ver user_queries.py); se detectan una vez."""
+        q = self._queries
+        if q is not None:
+            return q
+        with self._queries_lock:
+            if self._queries is None:
+                self._load_queries()
+            return self._queries
+
+    def _load_queries(self):
+        conn = self._get_conn()
+        try:
+            cols = self._user_columns(conn)
+            self.has_scan_counts = self._has_table(conn, "scan_counts")
+        finally:
+            conn.close()
+        self._queries = compile_user_queries(build_colmap(cols))
+        return self._queries
+
+    def reload_schema(self):
+        """Vuelve a detectar el esquema de users (p.ej. después de un ALTER TABLE)."""
+        with self._queries_lock:
+            return self._load_queries()
+
+    # ---------- operaciones ----------
+    def ping_db(self):
+        self._fetch("SELECT 1", one=True, dictionary=False)
+
+    def find_code(self, public_code):
+        """{"id", "user_id"} del QR con ese public_code, o None."""
+        return self._fetch("SELECT id, user_id FROM qr_codes WHERE public_code=%s", (public_code,), one=True)
+
+    def claim_code(self, public_code, user_id):
+        """Asocia el código al usuario solo si sigue virgen. True si lo reclamó."""
+        rowcount, _ = self._execute(
+            "UPDATE qr_codes SET user_id=%s, claimed_at=CURRENT_TIMESTAMP WHERE public_code=%s AND user_id IS NULL",
+            (user_id, public_code),
+        )
+        return rowcount == 1
+
+    def load_card(self, qr_id):
+        """Datos de la ficha (id, user_id, nombre, apellido, grupo_sanguineo, alergias, contacto1, contacto2)."""
+        return self._fetch(self.queries.card, (qr_id,), one=True)
+
+    def card_version(self, qr_id):
+        """id, user_id, claimed_at, updated_at del QR (sin los datos de la ficha), o None."""
+        return self._fetch(self.queries.card_version, (qr_id,), one=True)
+
+    def iter_cards(self, batch=5000):
+        """Todas las fichas reclamadas (columnas de load_card), por id, de a `batch` (keyset)."""
+        last = 0
+        while True:
+            rows = self._fetch(self.queries.cards_after, (last, batch))
+            yield from rows
+            if len(rows) < batch:
+                return
+            last = rows[-1]["id"]
+
+    def cards_since(self, since):
+        """Fichas reclamadas o con el perfil editado desde `since` (puede repetir filas)."""
+        q = self.queries
+        return self._fetch(q.cards_since, (since, since) if q.colmap["updated"] else (since,))
+
+    def load_user(self, user_id):
+        """id, email, nombre, apellido del usuario, o None."""
+        return self._fetch(self.queries.current_user, (user_id,), one=True)
+
+    def find_login_user(self, email):
+        """id, email, password_hash del usuario con ese email, o None."""
+        return self._fetch(self.queries.login, (email,), one=True)
+
+    def user_exists(self, email):
+        return self._fetch(self.queries.user_exists, (email,), one=True) is not None
+
+    def create_user(self, email, pwd_hash, nombre="", apellido=""):
+        """Alta de usuario; devuelve el id nuevo."""
+        q = self.queries
+        _, uid = self._execute(q.insert_user, insert_user_params(q, email, pwd_hash, nombre, apellido))
+        return uid
+
+    def update_password(self, user_id, pwd_hash):
+        self._execute(self.queries.update_password, (pwd_hash, user_id))
+
+    def list_user_qrs(self, user_id, limit=None, before_id=None, after_id=None,
+                      prefix=None, claimed_from=None, claimed_until=None):
+        """
+        QR del usuario, del más nuevo al más viejo, paginados por clave
+        (índice (user_id, id)): before_id = página siguiente, after_id = anterior.
+        prefix: comienzo del public_code (sin comodines, lo valida la ruta).
+        claimed_from / claimed_until: rango [desde, hasta) de claimed_at.
+        """
+        self.queries   # también detecta has_scan_counts
+        sql = "SELECT q.id, q.public_code, q.user_id, q.claimed_at"
+        if self.has_scan_counts:
+            # Totales de escaneos (scan_log.py) en la misma consulta: una búsqueda por PK por fila
+            sql += (", COALESCE(c.scans, 0) AS scans, COALESCE(c.views, 0) AS views, c.last_at AS last_scan_at"
+                    " FROM qr_codes q LEFT JOIN scan_counts c ON c.qr_id = q.id")
+        else:
+            sql += " FROM qr_codes q"
+        sql += " WHERE q.user_id=%s"
+        params = [user_id]
+        if before_id is not None:
+            sql += " AND q.id < %s"
+            params.append(before_id)
+        if after_id is not None:
+            sql += " AND q.id > %s"
+            params.append(after_id)
+        if prefix:
+            sql += " AND q.public_code LIKE %s"
+            params.append(prefix + "%")
+        if claimed_from is not None:
+            sql += " AND q.claimed_at >= %s"
+            params.append(claimed_from)
+        if claimed_until is not None:
+            sql += " AND q.claimed_at < %s"
+            params.append(claimed_until)
+        # Hacia atrás se recorre el índice en orden ascendente y se da vuelta
+        sql += " ORDER BY q.id ASC" if after_id is not None else " ORDER BY q.id DESC"
+        if limit is not None:
+            sql += " LIMIT %s"
+            params.append(limit)
+        rows = self._fetch(sql, tuple(params))
+        if after_id is not None:
+            rows.reverse()
+        return rows
+
+    def count_user_qrs(self, user_id):
+        row = self._fetch("SELECT COUNT(*) AS n FROM qr_codes WHERE user_id=%s", (user_id,), one=True)
+        return row["n"] if row else 0
+
+    def _executemany(self, sql, rows):
+        """executemany en una sola transacción."""
+        conn = self._get_conn()
+        cur = conn.cursor()
+        try:
+            self._begin(conn)
+            self._run(cur, self._sql(sql), rows, many=True)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+            conn.close()
+
+    # Máximo de parámetros por sentencia en los inserts de varias filas
+    _MAX_PARAMS = 10000
+
+    def _insert_rows(self, cur, head, rows, tail=""):
+        """INSERT ... VALUES (...), (...), ... de a tantas filas como entren en _MAX_PARAMS."""
+        width = len(rows[0])
+        per_stmt = max(1, self._MAX_PARAMS // width)
+        values = "(" + ", ".join(["%s"] * width) + ")"
+        for i in range(0, len(rows), per_stmt):
+            chunk = rows[i:i + per_stmt]
+            sql = f"{head} VALUES {', '.join([values] * len(chunk))}{tail}"
+            self._run(cur, self._sql(sql), tuple(v for r in chunk for v in r))
+
+    # Suma los totales de scan_counts (cada backend tiene su upsert)
+    _SCAN_COUNTS_UPSERT = None
+
+    def insert_scans(self, events):
+        """
+        Lote de escaneos (ver scan_log.py): (qr_id, public_code, scanned_at,
+        ua_class, status, kind). Inserta los eventos y suma los totales por
+        QR en scan_counts, todo en una transacción.
+        """
+        counts = {}
+        for qr_id, _, scanned_at, _, status, kind in events:
+            if qr_id is None or status >= 400:
+                continue
+            scans, views, last = counts.get(qr_id, (0, 0, scanned_at))
+            counts[qr_id] = (scans + (kind == "scan"), views + (kind != "scan"), max(last, scanned_at))
+        conn = self._get_conn()
+        cur = conn.cursor()
+        try:
+            self._begin(conn)
+            self._insert_rows(cur, "INSERT INTO scan_events (qr_id, public_code, scanned_at, ua_class, status, kind)",
+                              events)
+            if counts:
+                self._insert_rows(cur, "INSERT INTO scan_counts (qr_id, scans, views, last_at)",
+                                  [(q,) + c for q, c in sorted(counts.items())], self._SCAN_COUNTS_UPSERT)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+            conn.close()
+
+    def insert_codes(self, codes):
+        """Alta de códigos vírgenes (una transacción)."""
+        self._executemany("INSERT INTO qr_codes (public_code) VALUES (%s)", [(c,) for c in codes])
+
+    def insert_users(self, users):
+        """Alta masiva de usuarios: (email, pwd_hash, nombre, apellido). Una transacción."""
+        q = self.queries
+        self._executemany(q.insert_user, [insert_user_params(q, *u) for u in users])
+
+    def assign_codes(self, pairs):
+        """Reclama en bloque (public_code, email), con la misma guarda que claim_code()."""
+        q = self.queries
+        id_col = q.colmap["id"] or "id"
+        email_col = q.colmap["email"] or "email"
+        self._executemany(
+            f"UPDATE qr_codes SET user_id=(SELECT {id_col} FROM users WHERE {email_col}=%s), "
+            f"claimed_at=CURRENT_TIMESTAMP WHERE public_code=%s AND user_id IS NULL",
+            [(email, code) for code, email in pairs],
+        )
+
+    def _begin(self, conn):
+        conn.start_transaction()
+
+    # índice de public_code (code_index.py): filas (id, public_code, claimed, claimed_at)
+    _CODES_SQL = "SELECT id, public_code, user_id IS NOT NULL, claimed_at FROM qr_codes WHERE public_code IS NOT NULL"
+
+    def iter_codes(self, batch=10000):
+        conn = self._get_conn()
+        cur = conn.cursor()
+        try:
+            self._run(cur, self._sql(self._CODES_SQL))
+            while True:
+                rows = cur.fetchmany(batch)
+                if not rows:
+                    return
+                for r in rows:
+                    yield r
+        finally:
+            cur.close()
+            conn.close()
+
+    def codes_since(self, max_id, claimed_since):
+        # Dos rangos por índice (PK y claimed_at) en vez de un OR, que termina en full scan
+        return self._fetch(
+            self._CODES_SQL + " AND id > %s UNION ALL "
+            + self._CODES_SQL + " AND claimed_at >= %s AND id <= %s",
+            (max_id, claimed_since, max_id),
+            dictionary=False,
+        )
+
+
+class MySQLStorage(Storage):
+    dialect = "mysql"
+
+    def __init__(self, get_conn, host, port, user, password, database, connect_timeout=5):
+        super().__init__(get_conn)
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.database = database
+        self.connect_timeout = connect_timeout
+
+    def describe(self):
+        return {"db_host": self.host, "db_name": self.database}
+
+    def open_connection(self):
+        import mysql.connector
+        return mysql.connector.connect(
+            host=self.host,
+            port=self.port,
+            user=self.user,
+            password=self.password,
+            database=self.database,
+            autocommit=True,
+            connection_timeout=self.connect_timeout
+        )
+
+    def ping(self, raw):
+        raw.ping(reconnect=False)
+
+    def is_disconnect_error(self, exc):
+        import mysql.connector
+        return isinstance(exc, (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError))
+
+    def is_db_error(self, exc):
+        import mysql.connector
+        return isinstance(exc, mysql.connector.Error)
+
+    def replica_lag(self, raw):
+        """
+        Seg. de atraso de una réplica (Seconds_Behind_Source). inf si la
+        replicación está cortada; 0 si el servidor no se ve como réplica
+        (p.ej. un endpoint de solo lectura del proveedor).
+        """
+        cur = raw.cursor(dictionary=True)
+        try:
+            try:
+                cur.execute("SHOW REPLICA STATUS")
+            except Exception:
+                cur.execute("SHOW SLAVE STATUS")   # MySQL < 8.0.22
+            row = cur.fetchone()
+        finally:
+            cur.close()
+        if not row:
+            return 0.0
+        lag = row.get("Seconds_Behind_Source", row.get("Seconds_Behind_Master"))
+        return float("inf") if lag is None else float(lag)
+
+    def _user_columns(self, conn):
+        cur = conn.cursor()
+        try:
+            self._run(cur, "SHOW COLUMNS FROM users")
+            return set(r[0] for r in cur.fetchall())  # (Field, Type, Null, Key, Default, Extra)
+        finally:
+            cur.close()
+
+    def _has_table(self, conn, table):
+        cur = conn.cursor()
+        try:
+            self._run(cur, "SHOW TABLES LIKE %s", (table,))
+            return cur.fetchone() is not None
+        finally:
+            cur.close()
+
+    # Filas ordenadas por qr_id: dos lotes concurrentes toman los locks en el mismo orden
+    _SCAN_COUNTS_UPSERT = (
+        " ON DUPLICATE KEY UPDATE scans=scans+VALUES(scans), views=views+VALUES(views),"
+        " last_at=GREATEST(COALESCE(last_at, VALUES(last_at)), VALUES(last_at))"
+    )
+
+    def _dict_cursor(self, conn):
+        return conn.cursor(dictionary=True)
+
+
+class SQLiteStorage(Storage):
+    dialect = "sqlite"
+
+    def __init__(self, get_conn, path):
+        super().__init__(get_conn)
+        self.path = path
+
+    def describe(self):
+        return {"db_path": self.path}
+
+    def open_connection(self):
+        # isolation_level=None: autocommit como en MySQL; las transacciones se abren con BEGIN
+        raw = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None,
+                              detect_types=sqlite3.PARSE_DECLTYPES, timeout=10)
+        raw.row_factory = sqlite3.Row
+        raw.execute("PRAGMA journal_mode=WAL")
+        raw.execute("PRAGMA synchronous=NORMAL")
+        raw.execute("PRAGMA foreign_keys=ON")
+        return raw
+
+    def ping(self, raw):
+        raw.execute("SELECT 1").fetchone()
+
+    def is_disconnect_error(self, exc):
+        return isinstance(exc, sqlite3.ProgrammingError)  # "Cannot operate on a closed database"
+
+    def is_db_error(self, exc):
+        return isinstance(exc, sqlite3.Error)
+
+    def replica_lag(self, raw):
+        # SQLite no replica: solo verificamos que el archivo tenga las tablas (no una base vacía)
+        raw.execute("SELECT 1 FROM qr_codes LIMIT 1").fetchall()
+        return 0.0
+
+    def create_schema(self):
+        """Crea las tablas si no existen (la base SQLite arranca vacía)."""
+        raw = self.open_connection()
+        try:
+            for stmt in render_ddl("sqlite"):
+                raw.execute(stmt)
+        finally:
+            raw.close()
+
+    def _user_columns(self, conn):
+        cur = conn.cursor()
+        try:
+            self._run(cur, "PRAGMA table_info(users)")
+            return set(r[1] for r in cur.fetchall())  # (cid, name, type, notnull, dflt, pk)
+        finally:
+            cur.close()
+
+    def _has_table(self, conn, table):
+        cur = conn.cursor()
+        try:
+            self._run(cur, "SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table,))
+            return cur.fetchone() is not None
+        finally:
+            cur.close()
+
+    # SQLite < 3.32 acepta hasta 999 parámetros por sentencia
+    _MAX_PARAMS = 999
+    _SCAN_COUNTS_UPSERT = (
+        " ON CONFLICT(qr_id) DO UPDATE SET scans=scans+excluded.scans, views=views+excluded.views,"
+        " last_at=MAX(COALESCE(last_at, excluded.last_at), excluded.last_at)"
+    )
+
+    def _sql(self, sql):
+        return _qmark(sql)
+
+    def _dict_cursor(self, conn):
+        return conn.cursor()
+
+    def _row(self, row):
+        return dict(row) if row is not None else None
+
+    def _begin(self, conn):
+        conn.execute("BEGIN")
+
+
+def open_storage(backend, get_conn, **cfg):
+    """Crea el backend pedido. cfg: datos de conexión de MySQL o `sqlite_path`."""
+    if backend == "sqlite":
+        store = SQLiteStorage(get_conn, cfg["sqlite_path"])
+        store.create_schema()
+        return store
+    if backend == "mysql":
+        return MySQLStorage(
+            get_conn,
+            host=cfg["host"], port=cfg["port"], user=cfg["user"], password=cfg["password"],
+            database=cfg["database"], connect_timeout=cfg.get("connect_timeout", 5),
+        )
+    raise ValueError(f"QR_DB_BACKEND desconocido: {backend!r} (mysql o sqlite)")
+
+
+def open_replica(backend, spec, **cfg):
+    """
+    Backend de una réplica de lectura. spec: "host[:puerto]" en MySQL, ruta del
+    archivo en SQLite. Solo abre conexiones (las consultas las arma el Storage
+    de la primaria sobre esas conexiones) y nunca crea el esquema.
+    """
+    if backend == "sqlite":
+        return SQLiteStorage(None, spec)
+    if backend == "mysql":
+        host, _, port = spec.partition(":")
+        return MySQLStorage(
+            None,
+            host=host, port=int(port or cfg["port"]), user=cfg["user"], password=cfg["password"],
+            database=cfg["database"], connect_timeout=cfg.get("connect_timeout", 5),
+        )
+    raise ValueError(f"QR_DB_BACKEND desconocido: {backend!r} (mysql o sqlite)")
@@ -0,0 +1,171 @@
+# user_queries.py
+"""
+"Compilador" de las consultas sobre la tabla users.
+
+La tabla users no tiene los mismos nombres de columnas en todas las bases
+(nombre/name/first_name, contacto1/contact_phone_1/phone1, ...). En lugar de
+armar el SQL con if/else en cada request, detectamos las columnas una vez
+(al arrancar el worker) y generamos el texto final de cada consulta.
+En el camino caliente solo se bindean parámetros.
+"""
+from dataclasses import dataclass
+from types import MappingProxyType
+
+# alias lógico -> nombres posibles de columna, en orden de preferencia
+COLUMN_CANDIDATES = {
+    "first": ("nombre", "name", "first_name"),
+    "last": ("apellido", "surname", "last_name"),
+    "blood": ("grupo_sanguineo", "blood_type"),
+    "allergies": ("alergias", "allergies", "allergies_bool"),
+    "phone1": ("contacto1", "contact_phone_1", "phone1"),
+    "phone2": ("contacto2", "contact_phone_2", "phone2"),
+    "email": ("email",),
+    "pwd": ("password_hash", "pass_hash"),
+    "id": ("id",),
+    "updated": ("updated_at",),
+}
+
+
+def detect_user_columns(conn):
+    """
+    Lee las columnas reales de 'users' y devuelve un mapping (solo lectura):
+    first, last, blood, allergies, phone1, phone2, email, pwd, id -> columna o None
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute("SHOW COLUMNS FROM users")
+        rows = cur.fetchall()  # tuples: (Field, Type, Null, Key, Default, Extra)
+        cols = set([r[0] for r in rows])
+    finally:
+        cur.close()
+    return build_colmap(cols)
+
+
+def build_colmap(cols):
+    def pick(candidates):
+        for c in candidates:
+            if c in cols:
+                return c
+        return None
+    return MappingProxyType({alias: pick(cands) for alias, cands in COLUMN_CANDIDATES.items()})
+
+
+@dataclass(frozen=True)
+class UserQueries:
+    """Texto SQL final (parámetros con %s) para cada uso en las rutas."""
+    colmap: MappingProxyType
+    # get_current_user(): (uid,) -> id, email, nombre, apellido, updated_at
+    current_user: str
+    # login(): (email,) -> id, email, nombre, apellido, updated_at, password_hash
+    login: str
+    # register(): (email,) -> id
+    user_exists: str
+    # register(): (email, password_hash, nombre, apellido)
+    insert_user: str
+    # login() con rehash: (password_hash, uid)
+    update_password: str
+    # emergencia(): (qr_id,) -> id, user_id, nombre, apellido, grupo_sanguineo, alergias, contacto1, contacto2,
+    #               claimed_at, updated_at
+    card: str
+    # emergencia() condicional: (qr_id,) -> id, user_id, claimed_at, updated_at (solo la versión)
+    card_version: str
+    # snapshot de fichas, armado: (after_id, limit) -> columnas de card, reclamados, por id
+    cards_after: str
+    # snapshot de fichas, delta: (since,) o (since, since) si hay updated_at -> columnas de card
+    cards_since: str
+
+
+def _col(prefix, col, alias):
+    # Si la columna no existe devolvemos '' con el alias esperado por las rutas
+    if col:
+        return f"{prefix}{col} AS {alias}"
+    return f"'' AS {alias}"
+
+
+def compile_user_queries(colmap):
+    id_col = colmap["id"] or "id"
+    email_col = colmap["email"] or "email"
+    pwd_col = colmap["pwd"] or "password_hash"
+    first_col = colmap["first"]
+    last_col = colmap["last"]
+
+    # Identidad (la que guarda la sesión) + su versión: users.updated_at si existe
+    identity = (
+        f"{id_col} AS id, {email_col} AS email, "
+        f"{_col('', first_col, 'nombre')}, {_col('', last_col, 'apellido')}, "
+        f"{colmap['updated'] or 'NULL'} AS updated_at"
+    )
+    current_user = f"SELECT {identity} FROM users WHERE {id_col}=%s"
+
+    login = f"SELECT {identity}, {pwd_col} AS password_hash FROM users WHERE {email_col}=%s"
+
+    user_exists = f"SELECT {id_col} AS id FROM users WHERE {email_col}=%s"
+
+    # Un solo INSERT: los nombres vacíos quedan en NULL (igual que antes, cuando
+    # solo se actualizaban si venían con valor). Ver insert_user_params().
+    insert_cols = [email_col, pwd_col]
+    insert_vals = ["%s", "%s"]
+    if first_col:
+        insert_cols.append(first_col)
+        insert_vals.append("NULLIF(%s, '')")
+    if last_col:
+        insert_cols.append(last_col)
+        insert_vals.append("NULLIF(%s, '')")
+    insert_user = f"INSERT INTO users ({', '.join(insert_cols)}) VALUES ({', '.join(insert_vals)})"
+
+    update_password = f"UPDATE users SET {pwd_col}=%s WHERE {id_col}=%s"
+
+    card_parts = [
+        _col("u.", first_col, "nombre"),
+        _col("u.", last_col, "apellido"),
+        _col("u.", colmap["blood"], "grupo_sanguineo"),
+        _col("u.", colmap["allergies"], "alergias"),
+        _col("u.", colmap["phone1"], "contacto1"),
+        _col("u.", colmap["phone2"], "contacto2"),
+    ]
+    # Versión de la ficha (ETag / Last-Modified): claimed_at + users.updated_at si existe
+    updated = f"u.{colmap['updated']}" if colmap["updated"] else "NULL"
+    version_cols = f"q.claimed_at AS claimed_at, {updated} AS updated_at"
+    card = (
+        f"SELECT q.id, q.user_id, {', '.join(card_parts)}, {version_cols} "
+        f"FROM qr_codes q LEFT JOIN users u ON u.{id_col} = q.user_id "
+        f"WHERE q.id=%s"
+    )
+    card_version = (
+        f"SELECT q.id, q.user_id, {version_cols} "
+        f"FROM qr_codes q LEFT JOIN users u ON u.{id_col} = q.user_id "
+        f"WHERE q.id=%s"
+    )
+
+    claimed_cards = (
+        f"SELECT q.id, q.user_id, {', '.join(card_parts)}, {version_cols} "
+        f"FROM qr_codes q JOIN users u ON u.{id_col} = q.user_id"
+    )
+    cards_after = f"{claimed_cards} WHERE q.id > %s ORDER BY q.id LIMIT %s"
+    # Dos rangos por índice (claimed_at y users.updated_at) en vez de un OR
+    cards_since = f"{claimed_cards} WHERE q.claimed_at >= %s"
+    if colmap["updated"]:
+        cards_since += f" UNION ALL {claimed_cards} WHERE {updated} >= %s"
+
+    return UserQueries(
+        colmap=colmap,
+        current_user=current_user,
+        login=login,
+        user_exists=user_exists,
+        insert_user=insert_user,
+        update_password=update_password,
+        card=card,
+        card_version=card_version,
+        cards_after=cards_after,
+        cards_since=cards_since,
+    )
+
+
+def insert_user_params(queries, email, pwd_hash, nombre, apellido):
+    """Parámetros para queries.insert_user según las columnas de nombre disponibles."""
+    params = [email, pwd_hash]
+    if queries.colmap["first"]:
+        params.append(nombre)
+    if queries.colmap["last"]:
+        params.append(apellido)
+    return tuple(params)